@@ -0,0 +1,176 @@
+"""
+FitFlex adaptive inference
+
+Decides per frame how much pose inference to spend:
+
+  skip      - athlete is barely moving: no inference, landmarks are extrapolated from
+              the smoother's filtered position + velocity (at most max_skip in a row)
+  roi       - run the model on a padded crop around the last smoothed skeleton
+  full      - run on the whole frame (no track yet, or the ROI lost the athlete)
+
+and walks a quality ladder of (model_complexity, input_scale) levels to hold a target
+FPS: a level is dropped when inference latency exceeds the frame budget and restored
+when there is clear headroom. Every decision is counted in stats().
+"""
+import time
+
+import numpy as np
+
+from fitflex_frame import VIS_THRESHOLD
+
+# (model_complexity, input scale), best quality first
+DEFAULT_LADDER = ((1, 1.0), (0, 1.0), (0, 0.75), (0, 0.5))
+
+
+class AdaptiveInference:
+    def __init__(self, pose_factory, smoother, target_fps=30.0, ladder=DEFAULT_LADDER,
+                 initial_pose=None, roi_pad=0.25, min_roi_px=160, skip_speed_px_s=60.0,
+                 max_skip=2, budget_frac=0.7, cooldown_frames=30, metrics=None):
+        """
+        pose_factory(complexity) builds a MediaPipe Pose; instances are created lazily and
+        reused. initial_pose, if given, is used for the first ladder level's complexity.
+        smoother is the PoseSmoother whose state drives ROI and skip decisions.
+        """
+        self.pose_factory = pose_factory
+        self.smoother = smoother
+        self.ladder = list(ladder)
+        self.level = 0
+        self.poses = {}
+        if initial_pose is not None:
+            self.poses[self.ladder[0][0]] = initial_pose
+        self.owned = set()
+        self.roi_pad = roi_pad
+        self.min_roi_px = min_roi_px
+        self.skip_speed_px_s = skip_speed_px_s
+        self.max_skip = max_skip
+        self.budget_ms = 1000.0 / target_fps * budget_frac
+        self.cooldown_frames = cooldown_frames
+        self.metrics = metrics
+        self.tracking = False
+        self.skips = 0
+        self.last_vis = None
+        self.ema_ms = None
+        self.frames_since_change = 0
+        self.counts = {"full": 0, "roi": 0, "skip": 0, "roi_fallback": 0, "lost": 0,
+                       "level_down": 0, "level_up": 0}
+
+    def _count(self, name):
+        self.counts[name] += 1
+        if self.metrics:
+            self.metrics.count(f"adaptive_{name}")
+
+    def _pose(self, complexity):
+        pose = self.poses.get(complexity)
+        if pose is None:
+            pose = self.poses[complexity] = self.pose_factory(complexity)
+            self.owned.add(complexity)
+        return pose
+
+    def _speed(self):
+        """Peak filtered landmark speed (px/s) over visible joints."""
+        vel = self.smoother.dx_prev[:, :2]
+        speed = np.hypot(vel[:, 0], vel[:, 1])
+        if self.last_vis is not None:
+            speed = speed[self.last_vis >= VIS_THRESHOLD]
+        return float(speed.max()) if speed.size else 0.0
+
+    def _roi(self, h, w):
+        if self.last_vis is None:
+            return None
+        pts = self.smoother.x_prev[:, :2][self.last_vis >= VIS_THRESHOLD]
+        if len(pts) < 4:
+            return None
+        x0, y0 = pts.min(axis=0)
+        x1, y1 = pts.max(axis=0)
+        pad = self.roi_pad * max(x1 - x0, y1 - y0, self.min_roi_px)
+        x0 = int(max(0, x0 - pad)); y0 = int(max(0, y0 - pad))
+        x1 = int(min(w, x1 + pad)); y1 = int(min(h, y1 + pad))
+        if x1 - x0 < self.min_roi_px or y1 - y0 < self.min_roi_px:
+            return None
+        if (x1 - x0) * (y1 - y0) > 0.8 * w * h:
+            return None  # not worth cropping
+        return x0, y0, x1, y1
+
+    def _infer(self, frame, roi, state, t_ms):
+        import cv2
+        complexity, scale = self.ladder[self.level]
+        h, w = frame.shape[:2]
+        x0, y0, x1, y1 = roi if roi else (0, 0, w, h)
+        img = frame[y0:y1, x0:x1]
+        if scale != 1.0:
+            img = cv2.resize(img, (max(1, int((x1 - x0) * scale)), max(1, int((y1 - y0) * scale))),
+                             interpolation=cv2.INTER_AREA)
+        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        rgb.flags.writeable = False
+        t0 = time.perf_counter()
+        results = self._pose(complexity).process(rgb)
+        self._observe((time.perf_counter() - t0) * 1000.0)
+        if not results.pose_landmarks:
+            return False
+        state.fill_landmarks(results.pose_landmarks.landmark, t_ms, x1 - x0, y1 - y0, x0, y0)
+        return True
+
+    def _observe(self, ms):
+        if self.metrics:
+            self.metrics.observe("pose_process", ms)
+        self.ema_ms = ms if self.ema_ms is None else 0.9 * self.ema_ms + 0.1 * ms
+        self.frames_since_change += 1
+        if self.frames_since_change < self.cooldown_frames:
+            return
+        if self.ema_ms > self.budget_ms and self.level < len(self.ladder) - 1:
+            self.level += 1
+            self._count("level_down")
+        elif self.ema_ms < 0.4 * self.budget_ms and self.level > 0:
+            self.level -= 1
+            self._count("level_up")
+        else:
+            return
+        self.frames_since_change = 0
+        self.ema_ms = None
+
+    def process(self, frame, state, t_ms):
+        """
+        Fills the FrameState in pixel coords; returns False when no pose is tracked.
+        Skipped frames get the smoother's prediction with state.predicted set: it is
+        the output as is and must not be fed back into the filter.
+        """
+        if (self.tracking and self.skips < self.max_skip
+                and self._speed() < self.skip_speed_px_s):
+            self.skips += 1
+            self._count("skip")
+            state.fill(t_ms, self.smoother.predict(t_ms), self.last_vis)
+            state.predicted = True
+            return True
+        self.skips = 0
+        h, w = frame.shape[:2]
+        roi = self._roi(h, w) if self.tracking else None
+        found = self._infer(frame, roi, state, t_ms)
+        if roi is not None:
+            if not found:
+                # athlete left the crop: fall back to the whole frame right away
+                self._count("roi_fallback")
+                found = self._infer(frame, None, state, t_ms)
+            else:
+                self._count("roi")
+        if roi is None or not found:
+            self._count("full")
+        if not found:
+            if self.tracking:
+                self._count("lost")
+            self.tracking = False
+            self.last_vis = None
+            state.clear(t_ms)
+            return False
+        self.tracking = True
+        self.last_vis = state.vis.copy()
+        return True
+
+    def stats(self):
+        complexity, scale = self.ladder[self.level]
+        return dict(self.counts, model_complexity=complexity, input_scale=scale,
+                    inference_ema_ms=round(self.ema_ms, 2) if self.ema_ms is not None else None)
+
+    def close(self):
+        for c in self.owned:
+            self.poses[c].close()
+        self.owned.clear()
@@ -0,0 +1,495 @@
+"""
+FitFlex landmark archives (.ffla)
+
+Long-term storage for landmark streams, a fraction of the size of CSV or .fflm:
+
+  quantize  pixel x/y to 1/XY_SCALE px, MediaPipe z to 1/Z_SCALE and visibility to
+            1/VIS_SCALE, all as integers
+  hidden    optional (pack --hidden_xy_step): x/y of landmarks at or below VIS_MIN
+            visibility go on a coarse px grid. They are never drawn or measured, but
+            the smoother reads them, so replayed reps can differ from the raw stream
+  delta     each value is stored as its change from the previous frame; the first frame
+            of a chunk is relative to zero, so every chunk decodes on its own
+  pack      deltas are zigzag-mapped to unsigned, laid out one landmark coordinate at a
+            time, split into byte planes (small deltas leave the high planes all zero)
+            and deflated with zlib
+  chunks    CHUNK_FRAMES frames per chunk; a seek index at the end of the file holds
+            each chunk's offset and first/last timestamp
+
+    header   magic, version, fps, width, height, landmark count, chunk frames, scales,
+             frame count, chunk count, index offset
+    chunk    frames (u32), payload bytes (u32), first ts, last ts (i64), payload
+    index    offset, payload bytes, frames, first ts, last ts per chunk
+
+read(start_ms, end_ms) decodes only the chunks that overlap the range, straight into
+NumPy arrays. Quantization is the only loss: x/y come back within 1/(2*XY_SCALE) px,
+or hidden_xy_step/2 px for hidden landmarks when that is set.
+An archive whose writer did not close is still readable: the chunks are scanned.
+
+    python fitflex_archive.py pack session.csv -o session.ffla
+    python fitflex_archive.py extract session.ffla --start 60 --end 75 -o clip.fflm
+    python fitflex_mediapipe_multi.py --csv session.ffla --start 60 --end 75
+"""
+import argparse
+import json
+import struct
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from fitflex_exercises import VIS_MIN
+
+MAGIC = b"FFLMARC1"
+VERSION = 1
+# magic, version, header_size, fps, width, height, num_landmarks, chunk_frames,
+# xy_scale, z_scale, vis_scale, frame_count, chunk_count, index_offset
+HEADER_FMT = "<8sHHfHHHHfffQQQ"
+HEADER_SIZE = 64
+COUNTS_OFFSET = struct.calcsize("<8sHHfHHHHfff")
+CHUNK_FMT = "<IIqq"
+CHUNK_HEADER = struct.calcsize(CHUNK_FMT)
+ARCHIVE_EXT = ".ffla"
+
+CHUNK_FRAMES = 256
+# 1/2 px, 1/256 of MediaPipe's normalized depth and 1/100 visibility: well below the
+# model's own frame-to-frame jitter, which is most of what the deltas encode
+XY_SCALE = 2.0
+# occluded landmarks jitter by tens of pixels; storing that at full precision costs more
+# than all the visible ones. Suggested grid for pack --hidden_xy_step (off by default)
+HIDDEN_XY_STEP = 16.0
+Z_SCALE = 256.0
+VIS_SCALE = 100.0
+ZLIB_LEVEL = 6
+# decoded chunks kept for repeated reads around the same spot (clip review)
+CACHE_CHUNKS = 4
+
+INDEX_DTYPE = np.dtype([
+    ("offset", "<u8"),
+    ("nbytes", "<u4"),
+    ("frames", "<u4"),
+    ("first_ts", "<i8"),
+    ("last_ts", "<i8"),
+])
+
+
+def is_archive(path):
+    """True if path starts with the archive magic."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def _shuffle(values):
+    """uint32 values -> their bytes grouped by significance (all low bytes first)."""
+    return np.ascontiguousarray(values.astype("<u4").view(np.uint8).reshape(-1, 4).T).tobytes()
+
+
+def _unshuffle(raw, count):
+    planes = np.frombuffer(raw, dtype=np.uint8, count=4 * count).reshape(4, count)
+    return np.ascontiguousarray(planes.T).view("<u4").reshape(count)
+
+
+def _zigzag(d):
+    d = d.astype(np.int64)
+    return ((d << 1) ^ (d >> 63)).astype(np.uint32)
+
+
+def _unzigzag(u):
+    u = u.astype(np.int64)
+    return (u >> 1) ^ -(u & 1)
+
+
+def encode_chunk(ts, q):
+    """
+    ts (T,) int64 and quantized q (T, n, 4) int32 -> payload bytes. Deltas run along
+    time for each landmark coordinate; the first frame is relative to zero.
+    """
+    t = len(ts)
+    dt = np.diff(ts)
+    series = q.reshape(t, -1).T                                 # (n*4, T)
+    d = np.diff(series, axis=1, prepend=0)
+    return zlib.compress(_shuffle(_zigzag(dt)) + _shuffle(_zigzag(d).ravel()), ZLIB_LEVEL)
+
+
+def decode_chunk(payload, frames, first_ts, num_landmarks):
+    """Inverse of encode_chunk: (ts (T,) int64, q (T, n, 4) int64)."""
+    raw = zlib.decompress(payload)
+    k = 4 * (frames - 1)
+    dt = _unzigzag(_unshuffle(raw[:k], frames - 1))
+    ts = np.empty(frames, dtype=np.int64)
+    ts[0] = first_ts
+    np.cumsum(dt, out=ts[1:])
+    ts[1:] += first_ts
+    width = num_landmarks * 4
+    d = _unzigzag(_unshuffle(raw[k:], width * frames)).reshape(width, frames)
+    q = np.cumsum(d, axis=1).T.reshape(frames, num_landmarks, 4)
+    return ts, q
+
+
+class LandmarkArchiveWriter:
+    """
+    Writer for .ffla archives with the LandmarkWriter interface. Frames are staged in a
+    preallocated chunk buffer; each full chunk is encoded and appended, and the seek
+    index and counts are written on close. hidden_xy_step (px, off by default) stores
+    landmarks at or below VIS_MIN on that coarser grid.
+    """
+    def __init__(self, path, fps=30.0, width=640, height=480, num_landmarks=33,
+                 chunk_frames=CHUNK_FRAMES, xy_scale=XY_SCALE, z_scale=Z_SCALE, vis_scale=VIS_SCALE,
+                 hidden_xy_step=None):
+        self.path = str(path)
+        self.num = num_landmarks
+        self.chunk_frames = chunk_frames
+        self.scale = np.array([xy_scale, xy_scale, z_scale, vis_scale], dtype=np.float64)
+        self.hidden_xy_step = hidden_xy_step
+        self.ts = np.zeros(chunk_frames, dtype=np.int64)
+        self.values = np.zeros((chunk_frames, num_landmarks, 4), dtype=np.float64)
+        self.pending = 0
+        self.count = 0
+        self.index = []
+        self.f = open(self.path, "wb")
+        header = struct.pack(HEADER_FMT, MAGIC, VERSION, HEADER_SIZE, float(fps), int(width), int(height),
+                             num_landmarks, chunk_frames, xy_scale, z_scale, vis_scale, 0, 0, 0)
+        self.f.write(header.ljust(HEADER_SIZE, b"\0"))
+
+    def write(self, ts, landmarks, vis=None):
+        """Append one frame: (x, y, z, v) tuples or an (n, 3)/(n, 4) array; vis overrides v."""
+        arr = np.asarray(landmarks, dtype=np.float64)
+        row = self.values[self.pending]
+        row[:, :3] = arr[:, :3]
+        if vis is not None:
+            row[:, 3] = vis
+        elif arr.shape[1] > 3:
+            row[:, 3] = arr[:, 3]
+        else:
+            row[:, 3] = 1.0
+        self.ts[self.pending] = ts
+        self.pending += 1
+        if self.pending == self.chunk_frames:
+            self.flush()
+
+    def write_many(self, ts, xyz, vis):
+        """Append whole arrays: ts (T,), xyz (T, n, 3), vis (T, n)."""
+        i = 0
+        while i < len(ts):
+            k = min(self.chunk_frames - self.pending, len(ts) - i)
+            rows = self.values[self.pending:self.pending + k]
+            rows[..., :3] = xyz[i:i + k]
+            rows[..., 3] = vis[i:i + k]
+            self.ts[self.pending:self.pending + k] = ts[i:i + k]
+            self.pending += k
+            i += k
+            if self.pending == self.chunk_frames:
+                self.flush()
+
+    def flush(self):
+        """Encode the staged frames as one chunk."""
+        t = self.pending
+        if not t:
+            return
+        # frames without a pose (NaN) are stored as zeros with zero visibility
+        values = np.nan_to_num(self.values[:t] * self.scale)
+        if self.hidden_xy_step:
+            hidden = self.values[:t, :, 3] <= VIS_MIN
+            step = self.hidden_xy_step * self.scale[0]
+            values[..., :2][hidden] = np.rint(values[..., :2][hidden] / step) * step
+        q = np.rint(values).astype(np.int32)
+        ts = self.ts[:t].copy()
+        payload = encode_chunk(ts, q)
+        offset = self.f.tell()
+        self.f.write(struct.pack(CHUNK_FMT, t, len(payload), int(ts[0]), int(ts[-1])))
+        self.f.write(payload)
+        self.index.append((offset, len(payload), t, int(ts[0]), int(ts[-1])))
+        self.count += t
+        self.pending = 0
+
+    def close(self):
+        if self.f.closed:
+            return
+        self.flush()
+        index_offset = self.f.tell()
+        self.f.write(np.array(self.index, dtype=INDEX_DTYPE).tobytes())
+        self.f.seek(COUNTS_OFFSET)
+        self.f.write(struct.pack("<QQQ", self.count, len(self.index), index_offset))
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LandmarkArchive:
+    """
+    Random-access reader for .ffla archives. read(start_ms, end_ms) returns
+    (ts, xyz, vis) arrays for that range, decoding only the chunks it overlaps;
+    ts/xyz/vis decode the whole archive once, for code written against LandmarkRecording.
+    """
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, "rb") as f:
+            raw = f.read(HEADER_SIZE)
+            f.seek(0, 2)
+            size = f.tell()
+        if len(raw) < HEADER_SIZE or raw[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path}: not a FitFlex landmark archive")
+        (_, version, header_size, fps, width, height, num, chunk_frames,
+         xy_scale, z_scale, vis_scale, count, chunks, index_offset) = struct.unpack(
+            HEADER_FMT, raw[:struct.calcsize(HEADER_FMT)])
+        if version != VERSION:
+            raise ValueError(f"{self.path}: unsupported archive version {version}")
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self.num_landmarks = num
+        self.chunk_frames = chunk_frames
+        self.scale = np.array([xy_scale, xy_scale, z_scale, vis_scale], dtype=np.float64)
+        self.f = open(self.path, "rb")
+        if index_offset:
+            self.f.seek(index_offset)
+            self.index = np.frombuffer(self.f.read(chunks * INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)
+        else:
+            # writer did not close: walk the chunk headers
+            self.index = self._scan(header_size, size)
+        self.count = int(self.index["frames"].sum())
+        self.starts = np.concatenate(([0], np.cumsum(self.index["frames"], dtype=np.int64)))
+        self.cache = OrderedDict()
+        self._all = None
+
+    def _scan(self, pos, size):
+        entries = []
+        while pos + CHUNK_HEADER <= size:
+            self.f.seek(pos)
+            frames, nbytes, first, last = struct.unpack(CHUNK_FMT, self.f.read(CHUNK_HEADER))
+            if pos + CHUNK_HEADER + nbytes > size:
+                break
+            entries.append((pos, nbytes, frames, first, last))
+            pos += CHUNK_HEADER + nbytes
+        return np.array(entries, dtype=INDEX_DTYPE)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.f.close()
+
+    def chunk(self, k):
+        """Decoded chunk k as (ts, q) with q still quantized; recently used chunks are cached."""
+        hit = self.cache.get(k)
+        if hit is not None:
+            self.cache.move_to_end(k)
+            return hit
+        entry = self.index[k]
+        self.f.seek(int(entry["offset"]) + CHUNK_HEADER)
+        payload = self.f.read(int(entry["nbytes"]))
+        hit = decode_chunk(payload, int(entry["frames"]), int(entry["first_ts"]), self.num_landmarks)
+        self.cache[k] = hit
+        if len(self.cache) > CACHE_CHUNKS:
+            self.cache.popitem(last=False)
+        return hit
+
+    def _dequantize(self, q):
+        values = q / self.scale
+        return values[..., :3].astype(np.float32), values[..., 3].astype(np.float32)
+
+    def chunks_for(self, start_ms=None, end_ms=None):
+        """Indices of the chunks holding frames with start_ms <= ts < end_ms."""
+        lo = 0 if start_ms is None else int(np.searchsorted(self.index["last_ts"], start_ms, side="left"))
+        hi = len(self.index) if end_ms is None else int(np.searchsorted(self.index["first_ts"], end_ms, side="left"))
+        return range(lo, hi)
+
+    def read(self, start_ms=None, end_ms=None):
+        """(ts (T,), xyz (T, n, 3), vis (T, n)) for frames with start_ms <= ts < end_ms."""
+        parts_ts, parts_q = [], []
+        for k in self.chunks_for(start_ms, end_ms):
+            ts, q = self.chunk(k)
+            lo = 0 if start_ms is None else np.searchsorted(ts, start_ms, side="left")
+            hi = len(ts) if end_ms is None else np.searchsorted(ts, end_ms, side="left")
+            parts_ts.append(ts[lo:hi])
+            parts_q.append(q[lo:hi])
+        if not parts_ts:
+            n = self.num_landmarks
+            return np.zeros(0, np.int64), np.zeros((0, n, 3), np.float32), np.zeros((0, n), np.float32)
+        ts = np.concatenate(parts_ts)
+        xyz, vis = self._dequantize(np.concatenate(parts_q))
+        return ts, xyz, vis
+
+    def frames(self, start=0, stop=None):
+        """Like read() but by frame index: frames [start, stop)."""
+        stop = self.count if stop is None else min(stop, self.count)
+        if start >= stop:
+            return self.read(0, 0)
+        lo = int(np.searchsorted(self.starts, start, side="right")) - 1
+        hi = int(np.searchsorted(self.starts, stop, side="left"))
+        ts = np.concatenate([self.chunk(k)[0] for k in range(lo, hi)])
+        q = np.concatenate([self.chunk(k)[1] for k in range(lo, hi)])
+        a = start - int(self.starts[lo])
+        xyz, vis = self._dequantize(q[a:a + stop - start])
+        return ts[a:a + stop - start], xyz, vis
+
+    def _whole(self):
+        if self._all is None:
+            self._all = self.frames()
+        return self._all
+
+    @property
+    def ts(self):
+        return self._whole()[0]
+
+    @property
+    def xyz(self):
+        return self._whole()[1]
+
+    @property
+    def vis(self):
+        return self._whole()[2]
+
+    def iter_frames(self, start_ms=None, end_ms=None):
+        """Yield (ts, landmarks, vis) like read_landmarks_csv, one chunk decoded at a time."""
+        for k in self.chunks_for(start_ms, end_ms):
+            ts, q = self.chunk(k)
+            lo = 0 if start_ms is None else np.searchsorted(ts, start_ms, side="left")
+            hi = len(ts) if end_ms is None else np.searchsorted(ts, end_ms, side="left")
+            xyz, vis = self._dequantize(q[lo:hi])
+            for t, p, v in zip(ts[lo:hi].tolist(), xyz.tolist(), vis.tolist()):
+                yield t, [(x, y, z, w) for (x, y, z), w in zip(p, v)], v
+
+    @property
+    def first_ts(self):
+        return int(self.index["first_ts"][0]) if len(self.index) else 0
+
+    @property
+    def last_ts(self):
+        return int(self.index["last_ts"][-1]) if len(self.index) else 0
+
+    def info(self):
+        size = Path(self.path).stat().st_size
+        return {
+            'frames': self.count,
+            'chunks': len(self.index),
+            'duration_s': (self.last_ts - self.first_ts) / 1000.0,
+            'fps': self.fps,
+            'size': [self.width, self.height],
+            'landmarks': self.num_landmarks,
+            'scales': self.scale.tolist(),
+            'bytes': size,
+            'bytes_per_frame': round(size / self.count, 1) if self.count else 0.0,
+        }
+
+
+def clip_range(first_ts, start_s=None, end_s=None):
+    """(start_ms, end_ms) for a clip given in seconds from the first frame (None = open)."""
+    return (None if start_s is None else first_ts + int(round(start_s * 1000)),
+            None if end_s is None else first_ts + int(round(end_s * 1000)))
+
+
+def load_arrays(path, start_s=None, end_s=None):
+    """
+    (ts, xyz, vis, (fps, width, height)) from an archive, a .fflm recording or a landmarks
+    CSV (z = 0, 640x480 at 30 fps assumed), optionally cut to a clip.
+    """
+    from fitflex_recording import LandmarkRecording, is_recording
+    if is_archive(path):
+        archive = LandmarkArchive(path)
+        try:
+            ts, xyz, vis = archive.read(*clip_range(archive.first_ts, start_s, end_s))
+            return ts, xyz, vis, (archive.fps, archive.width, archive.height)
+        finally:
+            archive.close()
+    if is_recording(path):
+        rec = LandmarkRecording(path)
+        ts, xyz, vis, info = rec.ts, rec.xyz, rec.vis, (rec.fps, rec.width, rec.height)
+    else:
+        table = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+        ts = table[:, 0].astype(np.int64)
+        rows = table[:, 1:].reshape(len(table), -1, 3)
+        xyz = np.zeros(rows.shape, dtype=np.float32)
+        xyz[..., :2] = rows[..., :2]
+        vis = rows[..., 2].astype(np.float32)
+        info = (30.0, 640, 480)
+    if len(ts) and (start_s is not None or end_s is not None):
+        start_ms, end_ms = clip_range(int(ts[0]), start_s, end_s)
+        lo = 0 if start_ms is None else int(np.searchsorted(ts, start_ms))
+        hi = len(ts) if end_ms is None else int(np.searchsorted(ts, end_ms))
+        ts, xyz, vis = ts[lo:hi], xyz[lo:hi], vis[lo:hi]
+    return np.asarray(ts), np.asarray(xyz), np.asarray(vis), info
+
+
+def pack(src, dst, chunk_frames=CHUNK_FRAMES, xy_scale=XY_SCALE, z_scale=Z_SCALE, vis_scale=VIS_SCALE,
+         hidden_xy_step=None):
+    """Archive a CSV, .fflm or .ffla file; returns the frame count."""
+    ts, xyz, vis, (fps, width, height) = load_arrays(src)
+    with LandmarkArchiveWriter(dst, fps, width, height, xyz.shape[1], chunk_frames,
+                               xy_scale, z_scale, vis_scale, hidden_xy_step) as w:
+        w.write_many(ts, xyz, vis)
+    return len(ts)
+
+
+def extract(src, dst, start_s=None, end_s=None):
+    """
+    Write a clip of src (seconds from its first frame) as .ffla, .fflm or landmarks CSV,
+    chosen by dst's suffix. Returns the frame count.
+    """
+    ts, xyz, vis, (fps, width, height) = load_arrays(src, start_s, end_s)
+    suffix = Path(dst).suffix.lower()
+    if suffix == ARCHIVE_EXT:
+        with LandmarkArchiveWriter(dst, fps, width, height, xyz.shape[1]) as w:
+            w.write_many(ts, xyz, vis)
+    elif suffix == ".csv":
+        n = xyz.shape[1]
+        table = np.concatenate([xyz[..., :2], vis[..., None]], axis=-1).reshape(len(ts), -1)
+        header = ",".join(["timestamp"] + [f"{c}{i}" for i in range(n) for c in ("x", "y", "v")])
+        with open(dst, "w") as f:
+            f.write(header + "\n")
+            for t, row in zip(ts.tolist(), table):
+                f.write(str(t) + "," + ",".join(f"{v:.3f}" for v in row.tolist()) + "\n")
+    else:
+        from fitflex_recording import LandmarkWriter
+        with LandmarkWriter(dst, fps, width, height, xyz.shape[1]) as w:
+            for t, p, v in zip(ts, xyz, vis):
+                w.write(int(t), p, v)
+    return len(ts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack landmark recordings into compressed .ffla archives")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("pack", help="Archive a landmarks CSV or .fflm recording")
+    p.add_argument("src")
+    p.add_argument("-o", "--out", help=f"Output archive (default: <src stem>{ARCHIVE_EXT})")
+    p.add_argument("--chunk_frames", type=int, default=CHUNK_FRAMES, help="Frames per independently decodable chunk")
+    p.add_argument("--xy_scale", type=float, default=XY_SCALE, help="Steps per pixel for x/y")
+    p.add_argument("--hidden_xy_step", type=float, nargs="?", const=HIDDEN_XY_STEP,
+                   help=f"Store x/y of landmarks at or below VIS_MIN visibility on this px grid "
+                        f"(default {HIDDEN_XY_STEP:g} when given without a value); smaller, but "
+                        f"replayed reps can change")
+    p = sub.add_parser("extract", help="Cut a clip out of any recording into .ffla, .fflm or CSV")
+    p.add_argument("src")
+    p.add_argument("-o", "--out", required=True, help="Output path; the suffix picks the format")
+    p.add_argument("--start", type=float, help="Seconds from the first frame")
+    p.add_argument("--end", type=float, help="Seconds from the first frame")
+    p = sub.add_parser("info", help="Archive header and size")
+    p.add_argument("src")
+    args = parser.parse_args()
+
+    if args.cmd == "pack":
+        out = args.out or str(Path(args.src).with_suffix(ARCHIVE_EXT))
+        frames = pack(args.src, out, args.chunk_frames, args.xy_scale, hidden_xy_step=args.hidden_xy_step)
+        src_size, out_size = Path(args.src).stat().st_size, Path(out).stat().st_size
+        print(f"[Archive] {frames} frames: {src_size} -> {out_size} bytes "
+              f"({src_size / max(out_size, 1):.1f}x smaller) -> {out}")
+    elif args.cmd == "extract":
+        frames = extract(args.src, args.out, args.start, args.end)
+        print(f"[Archive] {frames} frames -> {args.out}")
+    else:
+        archive = LandmarkArchive(args.src)
+        print(json.dumps(archive.info(), indent=2))
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+"""
+FitFlex benchmark suite
+
+Times each hot path in isolation on synthetic pose streams (fitflex_synth) plus a full
+headless replay, and writes machine-readable JSON. --compare flags regressions against
+a saved baseline and exits non-zero when any benchmark got slower than the threshold.
+
+    python fitflex_bench.py --out bench.json
+    python fitflex_bench.py --compare bench.json --threshold 0.15
+
+Startup benchmarks time fresh interpreters: importing the tracking core (which must not
+load OpenCV or MediaPipe), a short headless replay, the backends themselves, and
+building a pre-warmed Pose. Cases whose backend is not installed are skipped.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import fitflex_mediapipe_multi as ff
+import fitflex_synth as synth
+from fitflex_archive import LandmarkArchive, LandmarkArchiveWriter, pack
+from fitflex_exercises import AngleKernel
+from fitflex_frame import FrameState
+from fitflex_recording import LandmarkWriter, LandmarkRecording
+from fitflex_shm import ShmFrameRing
+
+CONNECTIONS = ff.POSE_CONNECTIONS
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# name -> (code run by a fresh interpreter, optional); {path} is a short recording
+STARTUP_CASES = {
+    "startup_import_core": ("import sys, fitflex_mediapipe_multi\n"
+                            "loaded = [m for m in ('cv2', 'mediapipe') if m in sys.modules]\n"
+                            "assert not loaded, 'core import loaded ' + ', '.join(loaded)", False),
+    "startup_headless_replay": ("import fitflex_mediapipe_multi as ff\n"
+                                "ff.replay_session(ff.read_landmarks({path!r}))", False),
+    "startup_import_cv2": ("import cv2", True),
+    "startup_import_mediapipe": ("import mediapipe", True),
+    "startup_pose_prewarm": ("import fitflex_mediapipe_multi as ff\n"
+                             "ff.PoseWarmup().get()", True),
+}
+
+
+def _timed(fn, repeat):
+    """Run fn() `repeat` times; fn returns the number of ops it performed."""
+    times = []
+    ops = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        ops = fn()
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    median = times[len(times) // 2]
+    return {
+        "ops": ops,
+        "repeat": repeat,
+        "median_us": round(1e6 * median / ops, 3),
+        "min_us": round(1e6 * times[0] / ops, 3),
+        "ops_per_s": round(ops / median, 1),
+    }
+
+
+def bench_one_euro(frames_list, ts):
+    xs = [f[15][0] for f in frames_list]
+    def run():
+        f = ff.OneEuro()
+        for x, t in zip(xs, ts):
+            f.filter(x, t)
+        return len(xs)
+    return run
+
+
+def bench_smooth(frames_list, ts):
+    def run():
+        s = ff.PoseSmoother()
+        for lm, t in zip(frames_list, ts):
+            s.smooth(lm, t)
+        return len(frames_list)
+    return run
+
+
+def bench_frame_state(frames_arr, ts):
+    """MediaPipe-shaped result -> FrameState -> in-place smoothing, as in camera mode."""
+    class _Lm:
+        __slots__ = ("x", "y", "z", "visibility")
+    results = []
+    for f in frames_arr[:300]:
+        lms = []
+        for x, y, z, v in f.tolist():
+            lm = _Lm()
+            lm.x, lm.y, lm.z, lm.visibility = x / ff.FRAME_W, y / ff.FRAME_H, z, v
+            lms.append(lm)
+        results.append(lms)
+    def run():
+        s = ff.PoseSmoother()
+        state = FrameState()
+        for lms, t in zip(results, ts):
+            state.fill_landmarks(lms, t, ff.FRAME_W, ff.FRAME_H)
+            s.smooth_state(state)
+        return len(results)
+    return run
+
+
+def bench_angle(frames_list, ts):
+    def run():
+        for lm in frames_list:
+            ff.angle_deg(lm[11][:2], lm[13][:2], lm[15][:2])
+        return len(frames_list)
+    return run
+
+
+def bench_kernel(frames_arr):
+    xy = frames_arr[:, :, :2].astype(np.float64)
+    vis = frames_arr[:, :, 3].astype(np.float64)
+    def run():
+        kernel = AngleKernel()
+        for k in range(len(xy)):
+            kernel.angles(xy[k], vis[k])
+        return len(xy)
+    return run
+
+
+def bench_kernel_batch(frames_arr):
+    xy = frames_arr[:, :, :2].astype(np.float64)
+    vis = frames_arr[:, :, 3].astype(np.float64)
+    def run():
+        AngleKernel().angles(xy, vis)
+        return len(xy)
+    return run
+
+
+def bench_detector(frames_list, ts):
+    angles = [ff.angle_deg(lm[11][:2], lm[13][:2], lm[15][:2]) for lm in frames_list]
+    def run():
+        clock = ff.ReplayClock()
+        det = ff.ExerciseDetector('bicep_curl', bottom_th=40, top_th=160, min_amp=30, clock=clock)
+        for a, t in zip(angles, ts):
+            clock.set(t)
+            det.update(a)
+        return len(angles)
+    return run
+
+
+def bench_analyze(frames_list, ts, vis_list):
+    def run():
+        clock = ff.ReplayClock()
+        mgr = ff.MultiExerciseManager(clock=clock)
+        for lm, vis, t in zip(frames_list, vis_list, ts):
+            clock.set(t)
+            mgr.analyze_and_switch(lm, vis)
+        return len(frames_list)
+    return run
+
+
+def bench_overlay(frames_list, ts, vis_list):
+    frame = np.full((ff.FRAME_H, ff.FRAME_W, 3), 40, dtype=np.uint8)
+    n = min(len(frames_list), 300)
+    def run():
+        for lm, vis in zip(frames_list[:n], vis_list[:n]):
+            ff.draw_overlay_rgba(frame, lm, vis, CONNECTIONS)
+        return n
+    return run
+
+
+def bench_csv_write(frames_list, ts, vis_list, tmpdir):
+    path = os.path.join(tmpdir, "bench_write.csv")
+    def run():
+        if os.path.exists(path):
+            os.remove(path)
+        for lm, vis in zip(frames_list, vis_list):
+            ff.export_landmarks_to_csv(lm, vis, path)
+        return len(frames_list)
+    return run
+
+
+def bench_csv_read(path, n):
+    def run():
+        for _ in ff.read_landmarks_csv(path):
+            pass
+        return n
+    return run
+
+
+def bench_fflm_write(frames_arr, ts_arr, tmpdir):
+    path = os.path.join(tmpdir, "bench_write.fflm")
+    def run():
+        with LandmarkWriter(path) as w:
+            for t, f in zip(ts_arr.tolist(), frames_arr):
+                w.write(t, f)
+        return len(frames_arr)
+    return run
+
+
+def bench_fflm_read(path, n):
+    def run():
+        for _ in LandmarkRecording(path).iter_frames():
+            pass
+        return n
+    return run
+
+
+def bench_ffla_write(frames_arr, ts_arr, tmpdir):
+    path = os.path.join(tmpdir, "bench_write.ffla")
+    def run():
+        with LandmarkArchiveWriter(path) as w:
+            for t, f in zip(ts_arr.tolist(), frames_arr):
+                w.write(t, f)
+        return len(frames_arr)
+    return run
+
+
+def bench_ffla_read(path, n):
+    def run():
+        archive = LandmarkArchive(path)
+        for _ in archive.iter_frames():
+            pass
+        archive.close()
+        return n
+    return run
+
+
+def bench_ffla_clip(path, seconds=2.0, clips=50, seed=0):
+    """Random clip reads from a cold cache: seek, decode the overlapping chunks, slice."""
+    archive = LandmarkArchive(path)
+    span = max(archive.last_ts - archive.first_ts - int(seconds * 1000), 1)
+    starts = (archive.first_ts + np.random.default_rng(seed).integers(0, span, clips)).tolist()
+    def run():
+        for start in starts:
+            archive.cache.clear()
+            archive.read(start, start + int(seconds * 1000))
+        return clips
+    return run
+
+
+def bench_end_to_end(ts_arr, frames_arr):
+    def run():
+        session = _quiet(ff.replay_session, synth.iter_frames(ts_arr, frames_arr))
+        return session['frames']
+    return run
+
+
+def bench_multi_person(ts_arr, frames_arr, people):
+    """Headless multi-person replay of `people` side-by-side copies of the stream (one op = one frame)."""
+    frames = frames_arr[:300]
+    shifts = [(k - (people - 1) / 2.0) * 200.0 for k in range(people)]
+    stream = []
+    for t, f in zip(ts_arr[:300].tolist(), frames):
+        crowd = []
+        for dx in shifts:
+            xyz = f[:, :3].copy()
+            xyz[:, 0] += dx
+            crowd.append((xyz, f[:, 3]))
+        stream.append((t, crowd))
+    def run():
+        session = _quiet(ff.replay_multi, stream, 'bench', None, None, people)
+        return session['frames']
+    return run
+
+
+def bench_shm_ring():
+    """640x480 BGR frame through a shared-memory ring: put + get (one op = one frame)."""
+    frame = np.full((ff.FRAME_H, ff.FRAME_W, 3), 40, dtype=np.uint8)
+    out = np.empty_like(frame)
+    def run():
+        ring = ShmFrameRing.create(frame.shape)
+        try:
+            for t in range(1000):
+                ring.put(frame, t)
+                ring.get(out)
+        finally:
+            ring.release()
+        return 1000
+    return run
+
+
+def bench_startup(code, cwd):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [HERE, os.environ.get("PYTHONPATH")])))
+    def run():
+        proc = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env,
+                              capture_output=True, text=True)
+        if proc.returncode:
+            lines = proc.stderr.strip().splitlines()
+            raise RuntimeError(lines[-1] if lines else f"exit code {proc.returncode}")
+        return 1
+    return run
+
+
+def run_startup(repeat, tmpdir):
+    path = os.path.join(tmpdir, "bench_startup.fflm")
+    ts_arr, frames_arr = synth.synth_stream("bicep_curl", seconds=2.0)
+    with LandmarkWriter(path) as w:
+        for t, f in zip(ts_arr.tolist(), frames_arr):
+            w.write(t, f)
+    results = {}
+    for name, (code, optional) in STARTUP_CASES.items():
+        try:
+            results[name] = _timed(bench_startup(code.format(path=path), tmpdir), repeat)
+        except RuntimeError as e:
+            if not optional:
+                raise
+            print(f"{name:28s} skipped ({e})")
+            continue
+        print(f"{name:28s} {results[name]['median_us'] / 1000:>12.1f} ms")
+    return results
+
+
+def _quiet(fn, *args):
+    # auto-switch logging would dominate the timing
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        return fn(*args)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def write_csv(path, ts, frames_list):
+    with open(path, "w") as f:
+        f.write(",".join(["timestamp"] + [f"{c}{i}" for i in range(33) for c in ("x", "y", "v")]) + "\n")
+        for t, lm in zip(ts, frames_list):
+            f.write(",".join([str(t)] + [f"{v:.3f}" for p in lm for v in (p[0], p[1], p[3])]) + "\n")
+
+
+def write_formats(ts_arr, frames_arr, tmpdir):
+    """Write the stream as bench_read.csv/.fflm/.ffla into tmpdir; returns bytes per frame of each."""
+    ts = ts_arr.tolist()
+    csv_path = os.path.join(tmpdir, "bench_read.csv")
+    write_csv(csv_path, ts, frames_arr.tolist())
+    fflm_path = os.path.join(tmpdir, "bench_read.fflm")
+    with LandmarkWriter(fflm_path) as w:
+        for t, f in zip(ts, frames_arr):
+            w.write(t, f)
+    # as --record writes it: x, y, z and visibility
+    ffla_path = os.path.join(tmpdir, "bench_read.ffla")
+    with LandmarkArchiveWriter(ffla_path) as w:
+        w.write_many(ts_arr, frames_arr[..., :3], frames_arr[..., 3])
+    # packed from the CSV: the same data (no z), for the size comparison
+    ffla_csv_path = os.path.join(tmpdir, "bench_csv.ffla")
+    pack(csv_path, ffla_csv_path)
+    return {name: round(os.path.getsize(path) / len(ts), 1)
+            for name, path in (("csv", csv_path), ("fflm", fflm_path), ("ffla", ffla_path),
+                               ("ffla_from_csv", ffla_csv_path))}
+
+
+def check_reps(kind, ts_arr, frames_arr, seconds):
+    """
+    Replay the stream once and compare the counted reps with synth.expected_reps, so the
+    suite never times a pipeline that counts nothing. Returns (counted, expected, ok);
+    occlusion streams only need 0 < counted <= expected.
+    """
+    session = _quiet(ff.replay_session, synth.iter_frames(ts_arr, frames_arr))
+    expected = synth.expected_reps(kind, seconds)
+    exercise = synth.KIND_EXERCISE[kind]
+    counted = session['reps'].get(exercise, 0) if exercise else sum(session['reps'].values())
+    ok = 0 < counted <= expected if kind == "occlusion" else counted == expected
+    return counted, expected, ok
+
+
+def run_suite(kind="bicep_curl", seconds=60.0, fps=30.0, noise_px=1.5, repeat=5, seed=0, startup=True):
+    ts_arr, frames_arr = synth.synth_stream(kind, seconds=seconds, fps=fps, noise_px=noise_px, seed=seed)
+    counted, expected, ok = check_reps(kind, ts_arr, frames_arr, seconds)
+    if not ok:
+        raise RuntimeError(f"{kind} stream: replay counted {counted} reps, expected {expected}")
+    ts = ts_arr.tolist()
+    frames_list = [[tuple(p) for p in f] for f in frames_arr.tolist()]
+    vis_list = [[p[3] for p in f] for f in frames_list]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        storage = write_formats(ts_arr, frames_arr, tmpdir)
+        csv_path = os.path.join(tmpdir, "bench_read.csv")
+        fflm_path = os.path.join(tmpdir, "bench_read.fflm")
+        ffla_path = os.path.join(tmpdir, "bench_read.ffla")
+        cases = {
+            "one_euro_filter": bench_one_euro(frames_list, ts),
+            "pose_smoother_smooth": bench_smooth(frames_list, ts),
+            "frame_state_fill_smooth": bench_frame_state(frames_arr, ts),
+            "angle_deg": bench_angle(frames_list, ts),
+            "angle_kernel_frame": bench_kernel(frames_arr),
+            "angle_kernel_batch": bench_kernel_batch(frames_arr),
+            "exercise_detector_update": bench_detector(frames_list, ts),
+            "analyze_and_switch": bench_analyze(frames_list, ts, vis_list),
+            "draw_overlay_rgba": bench_overlay(frames_list, ts, vis_list),
+            "csv_write": bench_csv_write(frames_list, ts, vis_list, tmpdir),
+            "csv_read": bench_csv_read(csv_path, len(frames_list)),
+            "fflm_write": bench_fflm_write(frames_arr, ts_arr, tmpdir),
+            "fflm_read": bench_fflm_read(fflm_path, len(frames_list)),
+            "ffla_write": bench_ffla_write(frames_arr, ts_arr, tmpdir),
+            "ffla_read": bench_ffla_read(ffla_path, len(frames_list)),
+            "ffla_clip_2s": bench_ffla_clip(ffla_path),
+            "shm_ring_frame": bench_shm_ring(),
+            "end_to_end_headless": bench_end_to_end(ts_arr, frames_arr),
+            "multi_person_1": bench_multi_person(ts_arr, frames_arr, 1),
+            "multi_person_4": bench_multi_person(ts_arr, frames_arr, 4),
+        }
+        for name, fn in cases.items():
+            results[name] = _quiet(_timed, fn, repeat)
+            print(f"{name:28s} {results[name]['median_us']:>12.2f} us/op  {results[name]['ops_per_s']:>12.1f} ops/s")
+        print("bytes/frame " + "  ".join(f"{k}={v}" for k, v in storage.items())
+              + f"  (vs csv: ffla {storage['csv'] / storage['ffla']:.1f}x smaller, "
+                f"ffla_from_csv {storage['csv'] / storage['ffla_from_csv']:.1f}x)")
+        if startup:
+            results.update(run_startup(repeat, tmpdir))
+    e2e = results["end_to_end_headless"]
+    e2e["realtime_factor"] = round(e2e["ops_per_s"] / fps, 1)
+    return {
+        "config": {"kind": kind, "seconds": seconds, "fps": fps, "noise_px": noise_px,
+                   "repeat": repeat, "seed": seed},
+        "env": {"python": platform.python_version(), "numpy": np.__version__,
+                "machine": platform.machine(), "cpus": os.cpu_count()},
+        "results": results,
+        "bytes_per_frame": storage,
+        "reps": {"counted": counted, "expected": expected},
+    }
+
+
+def compare(current, baseline, threshold):
+    """List of (name, baseline_us, current_us, change) where median time grew by more than threshold."""
+    regressions = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        change = cur["median_us"] / base["median_us"] - 1.0 if base["median_us"] else 0.0
+        flag = "REGRESSION" if change > threshold else ""
+        print(f"{name:28s} {base['median_us']:>10.2f} -> {cur['median_us']:>10.2f} us/op ({change:+.1%}) {flag}")
+        if change > threshold:
+            regressions.append((name, base["median_us"], cur["median_us"], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FitFlex hot-path benchmarks")
+    parser.add_argument("--kind", choices=synth.KINDS, default="bicep_curl", help="Synthetic stream type")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Length of the synthetic stream")
+    parser.add_argument("--fps", type=float, default=30.0, help="Synthetic frame rate")
+    parser.add_argument("--noise", type=float, default=1.5, help="Landmark jitter in pixels")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, help="Write results JSON here")
+    parser.add_argument("--compare", type=str, help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown before flagging (0.10 = 10%%)")
+    parser.add_argument("--skip_startup", action="store_true", help="Skip the fresh-interpreter startup benchmarks")
+    args = parser.parse_args()
+
+    try:
+        report = run_suite(args.kind, args.seconds, args.fps, args.noise, args.repeat, args.seed,
+                           startup=not args.skip_startup)
+    except RuntimeError as e:
+        print(f"[Bench] Sanity check failed: {e}")
+        sys.exit(1)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[Bench] Results -> {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"[Bench] {len(regressions)} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+        print("[Bench] No regressions.")
+
+
+if __name__ == "__main__":
+    main()
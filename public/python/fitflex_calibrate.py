@@ -0,0 +1,246 @@
+"""
+FitFlex offline calibration
+
+Searches detector and smoothing parameters against recordings with known rep counts
+and writes a profile the tracker loads with --profile:
+
+    python fitflex_calibrate.py recordings/ --out profile.json
+    python fitflex_mediapipe_multi.py --profile profile.json
+
+Labels come from the same <stem>.labels.json sidecars as fitflex_eval.py. The search is
+vectorized rather than replaying once per combination:
+
+  1. landmarks of every recording are One-Euro filtered for all (min_cutoff, beta) pairs
+     at once and turned into primary-angle series by AngleKernel    -> (P, T)
+  2. moving averages for every ANGLE_WINDOW from one cumulative sum -> (P, W, T)
+  3. the rep state machine steps through time once, with its state held as arrays over
+     the whole (P, W, bottom_th, top_th, MIN_REP_MS, MAX_REP_MS) grid
+
+The One-Euro pair is shared by all exercises (there is one smoother per stream); the
+detector parameters are chosen per exercise.
+"""
+import argparse
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+
+import fitflex_mediapipe_multi as ff
+from fitflex_archive import LandmarkArchive, is_archive
+from fitflex_eval import find_recordings, label_path
+from fitflex_exercises import AngleKernel
+from fitflex_recording import LandmarkRecording, is_recording
+
+DEFAULT_GRID = {
+    "min_cutoff": [0.5, 1.0, 2.0],
+    "beta": [0.001, 0.007, 0.03],
+    "angle_window": [1, 3, 5, 7, 9],
+    "bottom_th": list(range(30, 95, 5)),
+    "top_th": list(range(120, 175, 5)),
+    "min_rep_ms": [150, 250, 400, 600],
+    "max_rep_ms": [4000, 8000, 12000],
+}
+DETECTOR_AXES = ("angle_window", "bottom_th", "top_th", "min_rep_ms", "max_rep_ms")
+
+def load_arrays(path):
+    """(ts (T,), xy (T, 33, 2), vis (T, 33)) for a .ffla, .fflm or CSV recording."""
+    if is_archive(path):
+        archive = LandmarkArchive(path)
+        ts, xyz, vis = archive.read()
+        archive.close()
+        return ts.astype(np.float64), xyz[:, :, :2].astype(np.float64), vis.astype(np.float64)
+    if is_recording(path):
+        rec = LandmarkRecording(path)
+        return (np.asarray(rec.ts, dtype=np.float64), np.asarray(rec.xyz[:, :, :2], dtype=np.float64),
+                np.asarray(rec.vis, dtype=np.float64))
+    ts, xy, vis = [], [], []
+    for t, landmarks, v in ff.read_landmarks_csv(path):
+        ts.append(t)
+        xy.append([(p[0], p[1]) for p in landmarks])
+        vis.append(v)
+    return np.asarray(ts, dtype=np.float64), np.asarray(xy), np.asarray(vis)
+
+
+def one_euro_batch(x, ts, min_cutoff, beta, d_cutoff=ff.ONE_EURO_D_CUTOFF):
+    """
+    One-Euro filter a (T, ...) signal for P parameter pairs at once.
+    min_cutoff and beta are (P,) arrays; returns (P, T, ...). Same recurrence as OneEuro.
+    """
+    shape = (len(min_cutoff),) + (1,) * (x.ndim - 1)
+    mc = np.asarray(min_cutoff, dtype=np.float64).reshape(shape)
+    bt = np.asarray(beta, dtype=np.float64).reshape(shape)
+    out = np.empty((len(min_cutoff),) + x.shape, dtype=np.float64)
+    x_prev = np.broadcast_to(x[0], out.shape[:1] + x.shape[1:]).copy()
+    dx_prev = np.zeros_like(x_prev)
+    out[:, 0] = x_prev
+    t_prev = ts[0] / 1000.0
+    two_pi = 2.0 * math.pi
+    for k in range(1, len(ts)):
+        t = ts[k] / 1000.0
+        dt = max(1e-6, t - t_prev)
+        dx = (x[k] - x_prev) / dt
+        a_d = 1.0 / (1.0 + 1.0 / (two_pi * d_cutoff * dt))
+        dx_prev = a_d * dx + (1.0 - a_d) * dx_prev
+        cutoff = mc + bt * np.abs(dx_prev)
+        a = 1.0 / (1.0 + 1.0 / (two_pi * cutoff * dt))
+        x_prev = a * x[k] + (1.0 - a) * x_prev
+        out[:, k] = x_prev
+        t_prev = t
+    return out
+
+
+def windowed_means(angles, windows):
+    """Trailing means like ExerciseDetector.angle_hist for each window: (P, T) -> (P, W, T)."""
+    P, T = angles.shape
+    csum = np.concatenate([np.zeros((P, 1)), np.cumsum(angles, axis=1)], axis=1)
+    out = np.empty((P, len(windows), T))
+    idx = np.arange(T)
+    for j, w in enumerate(windows):
+        lo = np.maximum(0, idx - w + 1)
+        out[:, j] = (csum[:, idx + 1] - csum[:, lo]) / (idx + 1 - lo)
+    return out
+
+
+def count_reps_grid(avg, ts, bottom, top, min_rep, max_rep):
+    """
+    Rep count of the ExerciseDetector state machine for every parameter combination.
+    avg: (P, W, T). Returns counts of shape (P, W, B, TOP, MN, MX).
+    """
+    P, W, T = avg.shape
+    grid = (P, W, len(bottom), len(top), len(min_rep), len(max_rep))
+    b = np.asarray(bottom, dtype=np.float64)[:, None, None, None]
+    tp = np.asarray(top, dtype=np.float64)[None, :, None, None]
+    mn = np.asarray(min_rep, dtype=np.float64)[None, None, :, None]
+    mx = np.asarray(max_rep, dtype=np.float64)[None, None, None, :]
+    down = np.zeros(grid, dtype=bool)
+    last = np.full(grid, np.nan)
+    count = np.zeros(grid, dtype=np.int32)
+    idle_ms = ff.SET_IDLE_S * 1000
+    oldest = np.inf      # earliest last-rep time anywhere in the grid
+    for k in range(T):
+        if k and ts[k - 1] - oldest > idle_ms:
+            # set completion on the previous frame forgot the last rep
+            last[ts[k - 1] - last > idle_ms] = np.nan
+            oldest = np.nanmin(last) if not np.isnan(last).all() else np.inf
+        a = avg[:, :, k][:, :, None, None, None, None]
+        down |= a > tp
+        trig = down & (a < b)
+        if not trig.any():
+            continue
+        gap = ts[k] - last
+        ok = trig & (np.isnan(last) | ((gap >= mn) & (gap <= mx)))
+        count += ok
+        last = np.where(ok, ts[k], last)
+        oldest = np.nanmin(last) if not np.isnan(last).all() else np.inf
+        down &= ~trig
+    return count
+
+
+def labelled_samples(paths):
+    """Yield (path, labels, exercise, label_reps) for every labelled exercise of every file."""
+    for path in paths:
+        lp = label_path(path)
+        if not lp.exists():
+            continue
+        labels = json.loads(lp.read_text())
+        for exercise, reps in labels.get("reps", {}).items():
+            yield path, labels, exercise, reps
+
+
+def segment_mask(labels, exercise, ts):
+    """Frames labelled as `exercise` (all frames when the file has no segments)."""
+    segments = labels.get("segments")
+    if not segments:
+        return np.ones(len(ts), dtype=bool)
+    mask = np.zeros(len(ts), dtype=bool)
+    for seg in segments:
+        if seg["exercise"] == exercise:
+            mask |= (ts >= seg["start"]) & (ts <= seg["end"])
+    return mask
+
+
+def calibrate(paths, grid=DEFAULT_GRID):
+    """Returns (profile dict, per-exercise error summary)."""
+    mc_grid, beta_grid = np.meshgrid(grid["min_cutoff"], grid["beta"], indexing="ij")
+    mc_flat, beta_flat = mc_grid.ravel(), beta_grid.ravel()
+    errors = {}     # exercise -> summed |pred - label| over the full grid
+    sq_errors = {}
+    files = {}
+    kernel = AngleKernel()
+    # only the landmarks some exercise's joints use need smoothing
+    used = np.unique(kernel.triplets)
+    kernel.triplets = np.searchsorted(used, kernel.triplets)
+    loaded = None
+    for path, labels, exercise, reps in labelled_samples(paths):
+        if exercise not in kernel.index:
+            print(f"[Calibrate] {path}: skipping unregistered exercise {exercise!r}")
+            continue
+        # angle series are reused across the exercises labelled in one file
+        if loaded is None or loaded[0] != path:
+            ts, xy, vis = load_arrays(str(path))
+            smoothed = one_euro_batch(xy[:, used], ts, mc_flat, beta_flat)      # (P, T, U, 2)
+            loaded = (path, ts, kernel.angles(smoothed, vis[:, used]))          # (P, T, S)
+        _, ts, angles = loaded
+        mask = segment_mask(labels, exercise, ts)
+        if not mask.any():
+            continue
+        avg = windowed_means(angles[:, mask, kernel.index[exercise]], grid["angle_window"])
+        counts = count_reps_grid(avg, ts[mask], grid["bottom_th"], grid["top_th"],
+                                 grid["min_rep_ms"], grid["max_rep_ms"])
+        err = np.abs(counts - reps)
+        errors[exercise] = errors.get(exercise, 0) + err
+        sq_errors[exercise] = sq_errors.get(exercise, 0) + err.astype(np.float64) ** 2
+        files[exercise] = files.get(exercise, 0) + 1
+    if not errors:
+        raise ValueError("no labelled recordings found")
+
+    # bottom_th must stay below top_th
+    bottom = np.asarray(grid["bottom_th"])[:, None]
+    top = np.asarray(grid["top_th"])[None, :]
+    invalid = (bottom >= top)[None, None, :, :, None, None]
+    # rank by abs error, then squared error (favours many small misses over one big one)
+    scores = {ex: np.where(invalid, np.inf, errors[ex] + 1e-3 * sq_errors[ex]) for ex in errors}
+    # best detector params per exercise for each smoother setting, then best shared smoother
+    per_p = sum(s.reshape(s.shape[0], -1).min(axis=1) for s in scores.values())
+    p_best = int(np.argmin(per_p))
+
+    profile = {
+        "version": 1,
+        "one_euro": {"min_cutoff": float(mc_flat[p_best]), "beta": float(beta_flat[p_best])},
+        "exercises": {},
+    }
+    summary = {}
+    for ex, s in scores.items():
+        idx = np.unravel_index(int(np.argmin(s[p_best])), s.shape[1:])
+        params = {axis: grid[axis][i] for axis, i in zip(DETECTOR_AXES, idx)}
+        profile["exercises"][ex] = params
+        summary[ex] = {"files": files[ex], "total_abs_error": int(errors[ex][p_best][idx]),
+                       "mae": round(float(errors[ex][p_best][idx]) / files[ex], 3)}
+    profile["fit"] = summary
+    return profile, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit detector thresholds and smoothing to labelled recordings")
+    parser.add_argument("corpus", help="Directory of .ffla/.fflm/.csv recordings with .labels.json sidecars")
+    parser.add_argument("--out", type=str, default="fitflex_profile.json", help="Profile JSON to write")
+    parser.add_argument("--grid", type=str, help="JSON file overriding any DEFAULT_GRID axes")
+    args = parser.parse_args()
+
+    grid = dict(DEFAULT_GRID)
+    if args.grid:
+        grid.update(json.loads(Path(args.grid).read_text()))
+    paths = find_recordings(args.corpus)
+    size = int(np.prod([len(v) for v in grid.values()]))
+    print(f"[Calibrate] {len(paths)} recordings, {size} parameter combinations")
+    profile, summary = calibrate(paths, grid)
+    print(f"[Calibrate] One-Euro: {profile['one_euro']}")
+    for ex, params in profile["exercises"].items():
+        print(f"  {ex:14s} {params}  mae={summary[ex]['mae']}")
+    Path(args.out).write_text(json.dumps(profile, indent=2))
+    print(f"[Saved] Calibration profile -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+"""
+FitFlex exercise classifier
+
+Replaces the single-frame auto-switch heuristic with two parts:
+
+  FeatureEngine       ring buffers of per-frame body signals (elbow/shoulder/hip/knee
+                      angles, wrist height) with O(1) running statistics per frame:
+                      mean, std, range (monotonic min/max queues), mean speed and the
+                      dominant period (spacing of mean crossings)
+  TemplateClassifier  nearest-template matching of the last rep-length trajectory against
+                      an index of reference rep trajectories: LB_Keogh lower bounds over
+                      the whole index in one array op, then Sakoe-Chiba banded DTW with
+                      early abandoning on the surviving candidates
+
+Reference trajectories come from each exercise's declared motion (fitflex_exercises) and,
+optionally, from labelled recordings:
+
+    python fitflex_classifier.py recordings/ --out templates.npz
+    python fitflex_mediapipe_multi.py --templates templates.npz
+"""
+import argparse
+import math
+from collections import deque
+
+import numpy as np
+
+from fitflex_exercises import (EXERCISES, JOINTS, VIS_MIN, joint_angles, LEFT_SHOULDER, RIGHT_SHOULDER,
+                               LEFT_WRIST, RIGHT_WRIST, LEFT_HIP, RIGHT_HIP)
+
+SIGNALS = ('elbow', 'shoulder', 'hip', 'knee', 'wrist_h')
+# per-signal scale so that angles (degrees) and wrist height (torso lengths) weigh alike
+SIGNAL_SCALE = np.array([1 / 90.0, 1 / 90.0, 1 / 90.0, 1 / 90.0, 1.0])
+
+TEMPLATE_POINTS = 32
+TEMPLATE_ROTATIONS = 8
+DTW_BAND = 4
+
+
+_TRIPLETS = np.array([t for j in ('elbow', 'shoulder', 'hip', 'knee') for t in JOINTS[j]])
+_TRIPLET_LIST = _TRIPLETS.tolist()
+
+
+def frame_signals(xy, vis):
+    """
+    Body signals of one frame from a (33, 2) landmark array: the four joint angles of the
+    better-visible side and wrist height above the shoulder in torso lengths, as a list.
+    Signals that cannot be measured are NaN.
+    """
+    ang = joint_angles(xy, _TRIPLETS).tolist()              # left/right per joint
+    v = vis.tolist() if hasattr(vis, 'tolist') else vis
+    out = []
+    for j in range(4):
+        vl = [v[i] for i in _TRIPLET_LIST[2 * j]]
+        vr = [v[i] for i in _TRIPLET_LIST[2 * j + 1]]
+        right = sum(vr) > sum(vl)
+        if j == 0:
+            right_arm = right
+        tv = vr if right else vl
+        out.append(ang[2 * j + right] if min(tv) > VIS_MIN else math.nan)
+    s, w = (RIGHT_SHOULDER, RIGHT_WRIST) if right_arm else (LEFT_SHOULDER, LEFT_WRIST)
+    (lsx, lsy), (rsx, rsy), (lhx, lhy), (rhx, rhy) = xy[[LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_HIP, RIGHT_HIP]].tolist()
+    torso = 0.5 * math.hypot(lsx + rsx - lhx - rhx, lsy + rsy - lhy - rhy)
+    if v[s] > VIS_MIN and v[w] > VIS_MIN and torso > 1.0:
+        out.append((float(xy[s, 1]) - float(xy[w, 1])) / torso)
+    else:
+        out.append(math.nan)
+    return out
+
+
+class RingBuffer:
+    """Fixed-capacity (capacity, width) float buffer; push() is O(1) and allocates nothing."""
+    def __init__(self, capacity, width):
+        self.data = np.zeros((capacity, width), dtype=np.float64)
+        self.capacity = capacity
+        self.head = 0       # next write slot
+        self.size = 0
+
+    def push(self, row):
+        """Store row; returns the overwritten row as a list once the buffer is full, else None."""
+        slot = self.data[self.head]
+        old = slot.tolist() if self.size == self.capacity else None
+        slot[:] = row
+        self.head = (self.head + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+        return old
+
+    def last(self, n=None):
+        """The newest n rows in chronological order (a copy)."""
+        n = self.size if n is None else min(n, self.size)
+        start = (self.head - n) % self.capacity
+        if start + n <= self.capacity:
+            return self.data[start:start + n].copy()
+        return np.concatenate([self.data[start:], self.data[:self.head]])
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+
+class _SlidingMax:
+    """Sliding-window maximum over frame sequence numbers (monotonic deque, amortized O(1))."""
+    def __init__(self):
+        self.q = deque()
+
+    def push(self, seq, x, oldest):
+        q = self.q
+        while q and q[-1][1] <= x:
+            q.pop()
+        q.append((seq, x))
+        while q[0][0] < oldest:
+            q.popleft()
+        return q[0][1]
+
+
+class FeatureEngine:
+    """
+    Running statistics of the SIGNALS over the last `window` frames. push() costs O(1) per
+    frame regardless of the window length; trajectory() is only called when classifying.
+    Unmeasurable signals (NaN) hold their last value; a signal's statistics start with
+    its first measurement.
+    """
+    def __init__(self, window=120, max_crossings=4):
+        self.window = window
+        self.max_crossings = max_crossings
+        self.k = len(SIGNALS)
+        # one row per frame: signal values (NaN until first measured), their speeds, timestamp (s)
+        self.ring = RingBuffer(window, 2 * self.k + 1)
+        self._clear()
+
+    def reset(self):
+        self._clear()
+
+    def _clear(self):
+        k = self.k
+        self.ring.clear()
+        self.sum = [0.0] * k
+        self.sumsq = [0.0] * k
+        self.speed_sum = [0.0] * k
+        self.count = [0] * k             # measured frames of each signal in the window
+        self.range = [0.0] * k
+        self.last = None
+        self.last_t = None
+        self.seq = 0
+        self.maxs = [_SlidingMax() for _ in range(k)]
+        self.negmins = [_SlidingMax() for _ in range(k)]
+        self.above = [False] * k
+        self.crossed = [-1] * k          # seq of each signal's last mean crossing (either way)
+        self.crossings = [deque(maxlen=self.max_crossings) for _ in range(k)]
+        self.period_s = [math.nan] * k
+
+    def push(self, t_ms, xy, vis):
+        x = frame_signals(xy, vis)
+        if self.last is None:
+            if all(xi != xi for xi in x):
+                return          # nothing measured yet
+            speed = [0.0] * self.k
+        else:
+            x = [l if xi != xi else xi for xi, l in zip(x, self.last)]
+            inv_dt = 1.0 / max(1e-3, t_ms / 1000.0 - self.last_t)
+            # no speed on a signal's first measurement (or before it)
+            speed = [0.0 if b != b else abs(a - b) * inv_dt for a, b in zip(x, self.last)]
+        t = t_ms / 1000.0
+        old = self.ring.push(x + speed + [t])
+        k = self.k
+        oldest = self.seq - self.window + 1
+        for i in range(k):
+            if old is not None and old[i] == old[i]:
+                o = old[i]
+                self.sum[i] -= o
+                self.sumsq[i] -= o * o
+                self.speed_sum[i] -= old[k + i]
+                self.count[i] -= 1
+            xi = x[i]
+            if xi != xi:
+                continue        # not measured yet
+            self.sum[i] += xi
+            self.sumsq[i] += xi * xi
+            self.speed_sum[i] += speed[i]
+            self.count[i] += 1
+            n = self.count[i]
+            r = self.maxs[i].push(self.seq, xi, oldest) + self.negmins[i].push(self.seq, -xi, oldest)
+            self.range[i] = r
+            # period: upward crossings of the running mean, with hysteresis of a quarter std
+            mean = self.sum[i] / n
+            band = 0.25 * math.sqrt(max(self.sumsq[i] / n - mean * mean, 0.0))
+            if self.above[i]:
+                if xi < mean - band:
+                    self.above[i] = False
+                    self.crossed[i] = self.seq
+            elif xi > mean + band and r > 0:
+                self.above[i] = True
+                self.crossed[i] = self.seq
+                c = self.crossings[i]
+                c.append(t)
+                if len(c) >= 2:
+                    self.period_s[i] = (c[-1] - c[0]) / (len(c) - 1)
+        self.last = x
+        self.last_t = t
+        self.seq += 1
+
+    def mean(self):
+        return np.array(self.sum) / np.maximum(1, self.count)
+
+    def std(self):
+        n = np.maximum(1, self.count)
+        m = np.array(self.sum) / n
+        return np.sqrt(np.maximum(np.array(self.sumsq) / n - m * m, 0.0))
+
+    def speed(self):
+        return np.array(self.speed_sum) / np.maximum(1, self.count)
+
+    def scaled_range(self):
+        return np.array(self.range) * SIGNAL_SCALE
+
+    def half_cycle(self):
+        """True when the dominant signal crossed its mean on the latest frame (twice per rep)."""
+        return self.crossed[self.dominant()] == self.seq - 1
+
+    def dominant(self):
+        """Index of the signal with the largest scaled range (the one driving the motion)."""
+        return int(np.argmax(self.scaled_range()))
+
+    def features(self):
+        return {"mean": self.mean(), "std": self.std(), "range": np.array(self.range),
+                "speed": self.speed(), "period_s": np.array(self.period_s)}
+
+    def trajectory(self, n_points=TEMPLATE_POINTS, max_period_s=None):
+        """
+        The last dominant period of all signals, resampled to (n_points, K) and scaled by
+        SIGNAL_SCALE, or None while no period has been observed (or it exceeds the window).
+        """
+        period = self.period_s[self.dominant()]
+        if period != period:
+            return None
+        rows = self.ring.last()
+        ts = rows[:, -1]
+        if ts.size < 4 or ts[-1] - ts[0] < period or (max_period_s and period > max_period_s):
+            return None
+        grid = np.linspace(ts[-1] - period, ts[-1], n_points)
+        out = np.empty((n_points, self.k))
+        for k in range(self.k):
+            col = rows[:, k]
+            seen = col == col
+            if not seen.all():
+                # before its first measurement a signal holds that value (0 if never measured)
+                col[~seen] = col[seen][0] if seen.any() else 0.0
+            out[:, k] = np.interp(grid, ts, col)
+        return out * SIGNAL_SCALE
+
+
+def motion_template(motion, n_points=TEMPLATE_POINTS):
+    """
+    One rep as a (n_points, K) trajectory plus (K,) weights from a declared motion
+    {signal: (extended, contracted) or None}; signals left out or None get weight 0.
+    """
+    phase = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_points) / n_points)
+    traj = np.zeros((n_points, len(SIGNALS)))
+    weights = np.zeros(len(SIGNALS))
+    for k, name in enumerate(SIGNALS):
+        span = motion.get(name)
+        if span is None:
+            continue
+        a, b = span
+        traj[:, k] = (a + (b - a) * phase) * SIGNAL_SCALE[k]
+        weights[k] = 1.0
+    return traj, weights
+
+
+def _dtw(cost, band, abandon):
+    """Banded DTW over a precomputed (n, n) cost matrix; inf once every cell exceeds abandon."""
+    n = len(cost)
+    inf = math.inf
+    prev = [0.0] + [inf] * n
+    for i, row in enumerate(cost.tolist(), 1):
+        cur = [inf] * (n + 1)
+        lo = max(1, i - band)
+        hi = min(n, i + band)
+        best = inf
+        left = inf
+        for j in range(lo, hi + 1):
+            up = prev[j]
+            diag = prev[j - 1]
+            m = up if up < diag else diag
+            if left < m:
+                m = left
+            left = row[j - 1] + m
+            cur[j] = left
+            if left < best:
+                best = left
+        if best >= abandon:
+            return inf
+        prev = cur
+    return prev[n]
+
+
+class TemplateClassifier:
+    """
+    Nearest-template classifier over an index of rep trajectories.
+    Every template is stored at TEMPLATE_ROTATIONS phase offsets, so a query window may
+    start anywhere in the rep; upper/lower LB_Keogh envelopes are precomputed per template.
+    """
+    def __init__(self, n_points=TEMPLATE_POINTS, band=DTW_BAND, rotations=TEMPLATE_ROTATIONS):
+        self.n_points = n_points
+        self.band = band
+        self.rotations = rotations
+        self.labels = []
+        self._traj = []
+        self._weights = []
+        self.index = None
+
+    def add(self, exercise, traj, weights, rotate=True):
+        steps = range(0, self.n_points, self.n_points // self.rotations) if rotate else (0,)
+        for s in steps:
+            self.labels.append(exercise)
+            self._traj.append(np.roll(traj, -s, axis=0))
+            self._weights.append(weights / weights.sum())
+        self.index = None
+
+    def add_motions(self, exercises=None):
+        for spec in (exercises or EXERCISES).values():
+            if spec.motion:
+                self.add(spec.name, *motion_template(spec.motion, self.n_points))
+        return self
+
+    def build(self):
+        traj = np.stack(self._traj)                                  # (M, N, K)
+        n = self.n_points
+        upper = np.empty_like(traj)
+        lower = np.empty_like(traj)
+        for i in range(n):
+            lo, hi = max(0, i - self.band), min(n, i + self.band + 1)
+            upper[:, i] = traj[:, lo:hi].max(axis=1)
+            lower[:, i] = traj[:, lo:hi].min(axis=1)
+        self.index = {"traj": traj, "weights": np.stack(self._weights), "upper": upper,
+                      "lower": lower}
+        return self
+
+    def classify(self, query):
+        """
+        query: (N, K) scaled trajectory. Returns (exercise, confidence, {exercise: distance}).
+        Distances are RMS per weighted signal and are exact for the two best exercises;
+        confidence is 1 - best / runner-up.
+        """
+        if self.index is None:
+            self.build()
+        idx = self.index
+        w = idx["weights"]
+        # LB_Keogh for the whole index at once
+        over = np.maximum(query - idx["upper"], 0.0)
+        under = np.maximum(idx["lower"] - query, 0.0)
+        lb = ((over * over + under * under) * w[:, None, :]).sum(axis=(1, 2))
+        best = {}
+        second = math.inf       # runner-up exercise distance so far
+        for m in np.argsort(lb).tolist():
+            if lb[m] >= second:
+                break           # nothing left can change the two best exercises
+            label = self.labels[m]
+            own = best.get(label, math.inf)
+            if lb[m] >= own:
+                continue
+            # outside the top two a match only matters if it beats the runner-up
+            bound = own if own <= second else second
+            diff = query[:, None, :] - idx["traj"][m][None, :, :]
+            d = _dtw((diff * diff * w[m]).sum(axis=2), self.band, bound)
+            if d < own:
+                best[label] = d
+                ranked = sorted(best.values())
+                second = ranked[1] if len(ranked) > 1 else math.inf
+        dist = {k: math.sqrt(v / self.n_points) for k, v in best.items()}
+        ranked = sorted(dist.items(), key=lambda kv: kv[1])
+        exercise, d1 = ranked[0]
+        d2 = ranked[1][1] if len(ranked) > 1 else math.inf
+        confidence = 1.0 - d1 / d2 if d2 > 0 else 0.0
+        return exercise, confidence, dist
+
+    def save(self, path):
+        np.savez_compressed(path, traj=np.stack(self._traj), weights=np.stack(self._weights),
+                            labels=np.array(self.labels), band=self.band)
+
+    @classmethod
+    def load(cls, path, with_motions=True):
+        data = np.load(path)
+        traj = data["traj"]
+        clf = cls(n_points=traj.shape[1], band=int(data["band"]))
+        if with_motions:
+            clf.add_motions()
+        for label, t, w in zip(data["labels"].tolist(), traj, data["weights"]):
+            clf.add(label, t, w, rotate=False)
+        return clf.build()
+
+
+class ExerciseClassifier:
+    """
+    Auto-switch policy: feeds the FeatureEngine every frame and classifies at each half
+    rep (mean crossing of the dominant signal, at most every `min_gap` frames) while
+    something is moving. A switch needs `votes` consecutive confident predictions of the
+    same other exercise.
+    """
+    def __init__(self, classifier=None, window=120, min_gap=10, min_confidence=0.2,
+                 votes=3, min_range=0.3, max_distance=0.6):
+        self.engine = FeatureEngine(window)
+        self.classifier = classifier or TemplateClassifier().add_motions().build()
+        self.min_gap = min_gap
+        self.min_confidence = min_confidence
+        self.votes = votes
+        self.min_range = min_range
+        self.max_distance = max_distance
+        self.reset()
+
+    def reset(self):
+        """Forget the athlete seen so far (features, votes); the templates are kept."""
+        self.engine.reset()
+        self.frames = 0
+        self.last_classified = -self.min_gap
+        self.candidate = None
+        self.streak = 0
+        self.since_ms = None        # estimated start of the candidate's motion
+        self.prediction = None
+        self.confidence = 0.0
+        self.distances = {}
+        self.classifications = 0
+
+    def update(self, t_ms, xy, vis, current):
+        """Returns the exercise to switch to, or None to keep `current`."""
+        engine = self.engine
+        engine.push(t_ms, xy, vis)
+        self.frames += 1
+        if not engine.half_cycle() or self.frames - self.last_classified < self.min_gap:
+            return None
+        # idle: nothing moves enough to be a rep
+        if engine.scaled_range().max() < self.min_range:
+            self.streak = 0
+            return None
+        query = engine.trajectory(self.classifier.n_points, engine.window / 30.0)
+        if query is None:
+            return None
+        self.last_classified = self.frames
+        self.classifications += 1
+        exercise, confidence, self.distances = self.classifier.classify(query)
+        self.prediction, self.confidence = exercise, confidence
+        if confidence < self.min_confidence or self.distances[exercise] > self.max_distance:
+            self.streak = 0
+            return None
+        if exercise == current:
+            self.streak = 0
+            return None
+        if exercise != self.candidate or self.streak == 0:
+            # the voting trajectory spans the last period, so the motion began about then
+            self.since_ms = t_ms - 1000.0 * engine.period_s[engine.dominant()]
+            self.streak = 0
+        self.streak += 1
+        self.candidate = exercise
+        if self.streak >= self.votes:
+            self.streak = 0
+            return exercise
+        return None
+
+
+def templates_from_recording(path, exercise, classifier, stride=6, limit=64):
+    """Add rep trajectories of one labelled recording to classifier; returns how many."""
+    import fitflex_mediapipe_multi as ff
+
+    engine = FeatureEngine()
+    smoother = ff.PoseSmoother()
+    added = 0
+    for k, (ts, landmarks, vis) in enumerate(ff.read_landmarks(str(path))):
+        xy = smoother.smooth_array(np.asarray(landmarks, dtype=np.float64)[:, :3], ts)[:, :2]
+        engine.push(ts, xy, vis)
+        if k % stride or added >= limit:
+            continue
+        traj = engine.trajectory(classifier.n_points)
+        if traj is not None:
+            classifier.add(exercise, traj, np.ones(len(SIGNALS)), rotate=False)
+            added += 1
+    return added
+
+
+def main():
+    from fitflex_eval import find_recordings, label_path
+    import json
+
+    parser = argparse.ArgumentParser(description="Build an exercise template index from labelled recordings")
+    parser.add_argument("corpus", help="Directory of .ffla/.fflm/.csv recordings with .labels.json sidecars")
+    parser.add_argument("--out", type=str, default="fitflex_templates.npz", help="Template index to write")
+    parser.add_argument("--per_file", type=int, default=32, help="Maximum templates taken from one recording")
+    args = parser.parse_args()
+
+    clf = TemplateClassifier()
+    counts = {}
+    for path in find_recordings(args.corpus):
+        lp = label_path(path)
+        if not lp.exists():
+            continue
+        exercise = json.loads(lp.read_text()).get("exercise")
+        if exercise is None:
+            continue    # whole-file labels only
+        n = templates_from_recording(path, exercise, clf, limit=args.per_file)
+        counts[exercise] = counts.get(exercise, 0) + n
+    if not counts:
+        parser.error(f"no recordings with a whole-file exercise label under {args.corpus}")
+    clf.save(args.out)
+    print(f"[Templates] {counts} -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+FitFlex corpus evaluator
+
+Replays a directory of landmark recordings (.ffla, .fflm or CSV) headlessly across a
+process pool and compares the results with hand labels:
+
+    python fitflex_eval.py recordings/ --workers 8 --out report.json
+
+Each recording may have a label sidecar next to it, <stem>.labels.json:
+
+    {"reps": {"bicep_curl": 12},
+     "exercise": "bicep_curl",                      # whole-file exercise, or
+     "segments": [{"start": 1700000000000, "end": 1700000030000, "exercise": "bicep_curl"}]}
+
+The report has per-exercise rep error, a per-frame auto-switch confusion matrix (labelled
+exercise vs. the exercise the manager had selected) and frames per second per worker.
+Recordings that fail to replay are listed under "failed" and their labelled reps count
+as missed, so a corrupt file lowers the score instead of vanishing from it.
+Workers only exchange small result dicts, so throughput scales with core count.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+RECORDING_SUFFIXES = (".ffla", ".fflm", ".csv")
+# the --synthetic smoke run fails below these (clean synthetic reps should all count;
+# auto-switch starts on the default exercise, so the first seconds of lat_pulldown miss)
+SYNTHETIC_MIN_REP_ACCURACY = 0.97
+SYNTHETIC_MIN_SWITCH_ACCURACY = 0.9
+
+
+def label_path(path):
+    path = Path(path)
+    return path.with_name(path.stem + ".labels.json")
+
+
+def find_recordings(root):
+    root = Path(root)
+    if root.is_file():
+        return [root]
+    return sorted(p for p in root.rglob("*") if p.suffix.lower() in RECORDING_SUFFIXES)
+
+
+def _quiet_worker():
+    # auto-switch logging from thousands of replays is noise here
+    sys.stdout = open(os.devnull, "w")
+
+
+def _label_at(labels, ts):
+    segments = labels.get("segments")
+    if segments:
+        for seg in segments:
+            if seg["start"] <= ts <= seg["end"]:
+                return seg["exercise"]
+        return None
+    return labels.get("exercise")
+
+
+def failed_file(path, error):
+    """Report entry for a recording that could not be replayed; keeps its labels if readable."""
+    try:
+        label_reps = json.loads(label_path(path).read_text()).get("reps")
+    except (OSError, ValueError):
+        label_reps = None
+    return {"path": str(path), "error": f"{type(error).__name__}: {error}", "label_reps": label_reps}
+
+
+def evaluate_file(path, profile=None, templates=None):
+    """Replay one recording; returns counts, timing and the per-frame confusion counts."""
+    import fitflex_mediapipe_multi as ff
+
+    lp = label_path(path)
+    labels = json.loads(lp.read_text()) if lp.exists() else {}
+    confusion = defaultdict(lambda: defaultdict(int))
+
+    def on_frame(ts, exercise, angle):
+        truth = _label_at(labels, ts)
+        if truth is not None:
+            confusion[truth][exercise] += 1
+
+    classifier = ff.TemplateClassifier.load(templates) if templates else None
+    t0 = time.perf_counter()
+    summary = ff.replay_session(ff.read_landmarks(str(path)), mode='eval',
+                                on_frame=on_frame if labels else None, profile=profile,
+                                classifier=classifier)
+    elapsed = time.perf_counter() - t0
+    return {
+        "path": str(path),
+        "pid": os.getpid(),
+        "frames": summary["frames"],
+        "elapsed_s": elapsed,
+        "reps": summary["reps"],
+        "sets": summary["sets"],
+        "label_reps": labels.get("reps"),
+        "confusion": {t: dict(p) for t, p in confusion.items()},
+    }
+
+
+def build_report(results, wall_s, workers, failed=()):
+    per_worker = defaultdict(lambda: {"files": 0, "frames": 0, "busy_s": 0.0})
+    per_exercise = defaultdict(lambda: {"files": 0, "failed": 0, "label_reps": 0, "pred_reps": 0,
+                                        "abs_error": 0, "exact": 0})
+    confusion = defaultdict(lambda: defaultdict(int))
+    total_frames = 0
+    for r in results:
+        w = per_worker[r["pid"]]
+        w["files"] += 1
+        w["frames"] += r["frames"]
+        w["busy_s"] += r["elapsed_s"]
+        total_frames += r["frames"]
+        for ex, n in (r["label_reps"] or {}).items():
+            pred = r["reps"].get(ex, 0)
+            e = per_exercise[ex]
+            e["files"] += 1
+            e["label_reps"] += n
+            e["pred_reps"] += pred
+            e["abs_error"] += abs(pred - n)
+            e["exact"] += int(pred == n)
+        for truth, preds in r["confusion"].items():
+            for pred, n in preds.items():
+                confusion[truth][pred] += n
+    # a file that did not replay counted none of its labelled reps
+    for f in failed:
+        for ex, n in (f["label_reps"] or {}).items():
+            e = per_exercise[ex]
+            e["files"] += 1
+            e["failed"] += 1
+            e["label_reps"] += n
+            e["abs_error"] += n
+
+    for e in per_exercise.values():
+        e["mae"] = round(e["abs_error"] / e["files"], 3) if e["files"] else 0.0
+        e["bias"] = round((e["pred_reps"] - e["label_reps"]) / e["files"], 3) if e["files"] else 0.0
+        e["exact_rate"] = round(e["exact"] / e["files"], 3) if e["files"] else 0.0
+    for w in per_worker.values():
+        w["fps"] = round(w["frames"] / w["busy_s"], 1) if w["busy_s"] else 0.0
+        w["busy_s"] = round(w["busy_s"], 3)
+    labelled = sum(n for preds in confusion.values() for n in preds.values())
+    correct = sum(preds.get(truth, 0) for truth, preds in confusion.items())
+    busy = sum(r["elapsed_s"] for r in results)
+    return {
+        "files": len(results),
+        "frames": total_frames,
+        "workers": workers,
+        "wall_s": round(wall_s, 3),
+        "aggregate_fps": round(total_frames / wall_s, 1) if wall_s else 0.0,
+        # busy time / wall time: close to `workers` when scaling is linear
+        "parallel_efficiency": round(busy / wall_s / workers, 3) if wall_s else 0.0,
+        "per_exercise": dict(per_exercise),
+        "confusion": {t: dict(p) for t, p in confusion.items()},
+        "switch_accuracy": round(correct / labelled, 4) if labelled else None,
+        "per_worker": {str(pid): w for pid, w in per_worker.items()},
+        "per_file": [{k: r[k] for k in ("path", "frames", "reps", "label_reps")} for r in results],
+        "failed": [dict(f) for f in failed],
+    }
+
+
+def evaluate_corpus(paths, workers=None, profile=None, templates=None):
+    workers = workers or os.cpu_count() or 1
+    # largest files first so the pool does not end on one long straggler
+    paths = sorted(paths, key=lambda p: os.path.getsize(p), reverse=True)
+    results, failed = [], []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_quiet_worker) as pool:
+        futures = {pool.submit(evaluate_file, str(p), profile, templates): p for p in paths}
+        for fut in as_completed(futures):
+            try:
+                results.append(fut.result())
+            except Exception as e:
+                failed.append(failed_file(futures[fut], e))
+                print(f"[Eval] {futures[fut]}: {e}")
+    return build_report(results, time.perf_counter() - t0, workers, failed)
+
+
+def make_synthetic_corpus(out_dir, count=8, seconds=60.0):
+    """Write synthetic .fflm recordings with label sidecars (for smoke-testing the evaluator)."""
+    import fitflex_synth as synth
+    from fitflex_recording import LandmarkWriter
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    kinds = ("bicep_curl", "lat_pulldown")
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        ts, frames = synth.synth_stream(kind, seconds=seconds, seed=i)
+        path = out_dir / f"synthetic_{i:03d}_{kind}.fflm"
+        with LandmarkWriter(path) as w:
+            for t, f in zip(ts.tolist(), frames):
+                w.write(t, f)
+        labels = {"reps": {kind: synth.expected_reps(kind, seconds)}, "exercise": kind}
+        label_path(path).write_text(json.dumps(labels))
+    print(f"[Eval] Wrote {count} synthetic recordings -> {out_dir}")
+
+
+def check_synthetic(report, min_rep_accuracy=SYNTHETIC_MIN_REP_ACCURACY,
+                    min_switch_accuracy=SYNTHETIC_MIN_SWITCH_ACCURACY):
+    """Problems with a report over the synthetic corpus (empty when it scores near 100%)."""
+    problems = []
+    if not report["per_exercise"]:
+        problems.append("no labelled reps evaluated")
+    for f in report["failed"]:
+        problems.append(f"{f['path']} failed: {f['error']}")
+    for ex, e in report["per_exercise"].items():
+        accuracy = 1.0 - e["abs_error"] / e["label_reps"] if e["label_reps"] else 0.0
+        if accuracy < min_rep_accuracy:
+            problems.append(f"{ex}: rep accuracy {accuracy:.1%} (label={e['label_reps']} pred={e['pred_reps']})")
+    switch = report["switch_accuracy"]
+    if switch is None or switch < min_switch_accuracy:
+        problems.append(f"auto-switch accuracy {switch}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate rep counting over a corpus of landmark recordings")
+    parser.add_argument("corpus", help="Directory of .ffla/.fflm/.csv recordings (or a single file)")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: all cores)")
+    parser.add_argument("--out", type=str, help="Write the JSON report here")
+    parser.add_argument("--profile", type=str, help="Calibration profile JSON (fitflex_calibrate.py) to evaluate with")
+    parser.add_argument("--templates", type=str, help="Auto-switch template index (fitflex_classifier.py) to evaluate with")
+    parser.add_argument("--synthetic", type=int, default=0, help="First write N synthetic labelled recordings into corpus/")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        make_synthetic_corpus(args.corpus, args.synthetic)
+    paths = find_recordings(args.corpus)
+    if not paths:
+        parser.error(f"no recordings found under {args.corpus}")
+    profile = json.loads(Path(args.profile).read_text()) if args.profile else None
+    report = evaluate_corpus(paths, args.workers or None, profile, args.templates)
+
+    print(f"[Eval] {report['files']} files, {report['frames']} frames in {report['wall_s']}s "
+          f"({report['aggregate_fps']} fps, {report['workers']} workers, "
+          f"efficiency {report['parallel_efficiency']})")
+    for ex, e in report["per_exercise"].items():
+        print(f"  {ex:14s} files={e['files']:4d} reps label={e['label_reps']} pred={e['pred_reps']} "
+              f"mae={e['mae']} bias={e['bias']} exact={e['exact_rate']:.0%}"
+              + (f" failed={e['failed']}" if e['failed'] else ""))
+    for f in report["failed"]:
+        print(f"  failed: {f['path']}: {f['error']}")
+    if report["switch_accuracy"] is not None:
+        print(f"  auto-switch accuracy: {report['switch_accuracy']:.1%}  confusion: {report['confusion']}")
+    for pid, w in report["per_worker"].items():
+        print(f"  worker {pid}: {w['files']} files, {w['fps']} fps")
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"[Saved] Evaluation report -> {args.out}")
+    if args.synthetic:
+        problems = check_synthetic(report)
+        for problem in problems:
+            print(f"[Eval] Synthetic sanity check failed: {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
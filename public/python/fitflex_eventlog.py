@@ -0,0 +1,281 @@
+"""
+FitFlex session event log
+
+Live sessions stream their events (rep, set, reset, ...) to an append-only JSON Lines
+log instead of keeping them in memory. Rep/set totals are kept incrementally, so a
+summary snapshot costs the same at minute 1 and hour 10.
+
+  sessions/session_<start_ms>_<run>.000.jsonl, .001.jsonl, ...   (size-based rotation)
+
+<run> is random per session: replays and video files restart their clocks, so two
+sessions can share a start timestamp. Segments are created exclusively, so a name
+collision fails instead of mixing two sessions in one log.
+
+Every segment starts with a "segment" record holding the running totals at that point,
+so a summary can be recovered from the last segment alone. Lines are flushed on write
+and fsync'd at most every fsync_interval_s; a crash loses at most a partial last line,
+which readers skip.
+
+Compact a log back into the classic session_summary JSON shape:
+
+    python fitflex_eventlog.py sessions/session_1700000000000_3f9c2a1b.000.jsonl -o summary.json
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+DEFAULT_LOG_DIR = Path("sessions")
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_FSYNC_S = 1.0
+SEGMENT_RE = re.compile(r"^(?P<stem>.+)\.(?P<seq>\d{3,})\.jsonl$")
+
+
+class SessionSummary:
+    """
+    Incremental session totals. record() applies one event in O(1); snapshot() returns
+    the summary dict. With keep_events=True events are also kept in memory (replay).
+    Events with a 'track' field (multi-person) are also totalled per track.
+    """
+    def __init__(self, mode, start_time, keep_events=False):
+        self.mode = mode
+        self.start_time = start_time
+        self.end_time = None
+        self.reps = defaultdict(int)
+        self.sets = defaultdict(int)
+        self.tracks = {}        # multi-person: str(track id) -> {'reps': ..., 'sets': ...}
+        self.event_count = 0
+        self.meta = {}
+        self.events = [] if keep_events else None
+        self.listeners = []     # called with every recorded event (e.g. the live stream)
+
+    def apply(self, event):
+        _tally(self.reps, self.sets, event)
+        if event.get('type') == 'reset':
+            # resets are session-wide
+            for track in self.tracks.values():
+                _tally(track['reps'], track['sets'], event)
+        elif 'track' in event:
+            track = self._track(str(event['track']))
+            _tally(track['reps'], track['sets'], event)
+        self.event_count += 1
+        if 'ts' in event:
+            self.end_time = event['ts']
+
+    def _track(self, key):
+        track = self.tracks.get(key)
+        if track is None:
+            track = self.tracks[key] = {'reps': defaultdict(int), 'sets': defaultdict(int)}
+        return track
+
+    def record(self, event):
+        self.apply(event)
+        if self.events is not None:
+            self.events.append(event)
+        for listener in self.listeners:
+            listener(event)
+
+    def _track_totals(self):
+        return {k: {'reps': dict(t['reps']), 'sets': dict(t['sets'])} for k, t in self.tracks.items()}
+
+    def totals(self):
+        out = {"reps": dict(self.reps), "sets": dict(self.sets), "event_count": self.event_count}
+        if self.tracks:
+            out["tracks"] = self._track_totals()
+        return out
+
+    def restore(self, totals):
+        """Continue from totals() as written in a segment header."""
+        self.reps.update(totals.get("reps", {}))
+        self.sets.update(totals.get("sets", {}))
+        for key, track in totals.get("tracks", {}).items():
+            t = self._track(key)
+            t['reps'].update(track.get('reps', {}))
+            t['sets'].update(track.get('sets', {}))
+        self.event_count = totals.get("event_count", 0)
+
+    def snapshot(self):
+        out = {
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "mode": self.mode,
+            "reps": dict(self.reps),
+            "sets": dict(self.sets),
+            "event_count": self.event_count,
+        }
+        if self.tracks:
+            out["tracks"] = self._track_totals()
+        out.update(self.meta)
+        if self.events is not None:
+            out["events"] = list(self.events)
+        return out
+
+
+def _tally(reps, sets, event):
+    etype = event.get('type')
+    if etype == 'rep':
+        reps[event['exercise']] += 1
+    elif etype == 'rep_undo':
+        # auto-switch re-attributed a rep to the exercise it switched to
+        reps[event['exercise']] = max(0, reps[event['exercise']] - 1)
+    elif etype == 'set':
+        sets[event['exercise']] += 1
+    elif etype == 'reset':
+        for k in reps: reps[k] = 0
+        for k in sets: sets[k] = 0
+
+
+class SessionLog(SessionSummary):
+    """SessionSummary that streams every event to rotating JSON Lines segments."""
+    def __init__(self, mode, start_time, log_dir=DEFAULT_LOG_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 fsync_interval_s=DEFAULT_FSYNC_S):
+        super().__init__(mode, start_time)
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.stem = f"session_{start_time}_{uuid.uuid4().hex[:8]}"
+        self.max_bytes = max_bytes
+        self.fsync_interval_s = fsync_interval_s
+        self.seq = -1
+        self.f = None
+        self.paths = []
+        self.last_fsync = time.monotonic()
+        self._open_segment()
+
+    def _open_segment(self):
+        if self.f:
+            self._sync()
+            self.f.close()
+        self.seq += 1
+        path = self.log_dir / f"{self.stem}.{self.seq:03d}.jsonl"
+        self.paths.append(str(path))
+        self.f = open(path, "x", encoding="utf-8")
+        self.bytes = self.f.tell()
+        self._write({"type": "segment", "seq": self.seq, "mode": self.mode,
+                     "start_time": self.start_time, "ts": self.end_time, **self.totals()})
+
+    def _write(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        self.f.write(line)
+        self.f.flush()
+        self.bytes += len(line)
+
+    def _sync(self):
+        os.fsync(self.f.fileno())
+        self.last_fsync = time.monotonic()
+
+    def record(self, event):
+        # rotate first so the new segment header does not already count this event
+        if self.bytes >= self.max_bytes:
+            self._open_segment()
+        super().record(event)
+        self._write(event)
+        if time.monotonic() - self.last_fsync >= self.fsync_interval_s:
+            self._sync()
+
+    def snapshot(self):
+        out = super().snapshot()
+        out["event_log"] = list(self.paths)
+        return out
+
+    def close(self, end_time=None):
+        if self.f is None:
+            return
+        if end_time is not None:
+            self.end_time = end_time
+        self._write({"type": "session_end", "ts": self.end_time, **self.totals()})
+        self._sync()
+        self.f.close()
+        self.f = None
+
+
+def segment_paths(path):
+    """All segments of the session that `path` (any one segment) belongs to, in order."""
+    m = SEGMENT_RE.match(os.path.basename(path))
+    if not m:
+        return [str(path)]
+    pattern = os.path.join(os.path.dirname(path), glob.escape(m.group("stem")) + ".*.jsonl")
+    found = [p for p in glob.glob(pattern) if SEGMENT_RE.match(os.path.basename(p))]
+    return sorted(found, key=lambda p: int(SEGMENT_RE.match(os.path.basename(p)).group("seq")))
+
+
+def read_records(paths):
+    """Yield log records from segments in order, skipping a torn (partial) line left by a crash."""
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def recover_summary(path):
+    """Session totals from the last segment only (its header carries the running totals)."""
+    paths = segment_paths(path)
+    summary = None
+    for rec in read_records(paths[-1:]):
+        if rec.get("type") == "segment":
+            summary = SessionSummary(rec.get("mode"), rec.get("start_time"))
+            summary.restore(rec)
+            summary.end_time = rec.get("ts")
+        elif summary is None:
+            continue
+        elif rec.get("type") == "session_end":
+            summary.end_time = rec.get("ts", summary.end_time)
+        else:
+            summary.apply(rec)
+    return summary
+
+
+def compact(path):
+    """Fold a whole session log into the session_summary JSON shape (with events)."""
+    summary = None
+    for rec in read_records(segment_paths(path)):
+        rtype = rec.get("type")
+        if rtype == "segment":
+            if summary is None:
+                summary = SessionSummary(rec.get("mode"), rec.get("start_time"), keep_events=True)
+            continue
+        if summary is None:
+            continue
+        if rtype == "session_end":
+            summary.end_time = rec.get("ts", summary.end_time)
+            continue
+        summary.record(rec)
+    if summary is None:
+        raise ValueError(f"{path}: no session log records")
+    out = summary.snapshot()
+    out.pop("event_count", None)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact a FitFlex session event log into a summary JSON")
+    parser.add_argument("log", help="Any segment of the session log (session_<ts>_<run>.NNN.jsonl)")
+    parser.add_argument("-o", "--out", help="Output JSON path (default: stdout)")
+    parser.add_argument("--summary_only", action="store_true", help="Recover totals from the last segment without events")
+    args = parser.parse_args()
+    if args.summary_only:
+        summary = recover_summary(args.log)
+        if summary is None:
+            parser.error(f"{args.log}: no segment header found")
+        result = summary.snapshot()
+    else:
+        result = compact(args.log)
+    text = json.dumps(result, indent=2)
+    if args.out:
+        Path(args.out).write_text(text)
+        print(f"[Saved] Session summary -> {args.out}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
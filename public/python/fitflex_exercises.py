@@ -0,0 +1,137 @@
+"""
+FitFlex exercise registry and joint-angle kernel
+
+An exercise is declared by the joint whose angle drives its rep state machine, how the
+side is chosen, its default thresholds and, for auto-switch, its motion over one rep:
+
+    register(ExerciseSpec('squat', 'knee', bottom_th=95, top_th=160, side='mean',
+                          motion={'hip': (175, 75), 'knee': (175, 80)}))
+
+A motion maps fitflex_classifier.SIGNALS to (extended, contracted) values; the classifier
+turns it into a reference rep trajectory. Signals left out are ignored when matching.
+
+AngleKernel gathers the joint triplets of all registered exercises and computes every
+primary angle of a frame (33, 2) or a batch (T, 33, 2) in one vectorized pass, so adding
+an exercise adds no per-frame Python work.
+"""
+import numpy as np
+
+# MediaPipe Pose landmark indices
+LEFT_SHOULDER, RIGHT_SHOULDER = 11, 12
+LEFT_ELBOW, RIGHT_ELBOW = 13, 14
+LEFT_WRIST, RIGHT_WRIST = 15, 16
+LEFT_HIP, RIGHT_HIP = 23, 24
+LEFT_KNEE, RIGHT_KNEE = 25, 26
+LEFT_ANKLE, RIGHT_ANKLE = 27, 28
+
+# skeleton edges of the 33-landmark model, as mediapipe.solutions.pose.POSE_CONNECTIONS;
+# kept here so drawing and export do not need MediaPipe loaded
+POSE_CONNECTIONS = (
+    (0, 1), (1, 2), (2, 3), (3, 7), (0, 4), (4, 5), (5, 6), (6, 8), (9, 10),
+    (11, 12), (11, 13), (13, 15), (15, 17), (15, 19), (15, 21), (17, 19),
+    (12, 14), (14, 16), (16, 18), (16, 20), (16, 22), (18, 20),
+    (11, 23), (12, 24), (23, 24), (23, 25), (24, 26), (25, 27), (26, 28),
+    (27, 29), (28, 30), (29, 31), (30, 32), (27, 31), (28, 32),
+)
+
+# joint -> (left triplet, right triplet); the angle is measured at the middle landmark
+JOINTS = {
+    'elbow': ((LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST), (RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST)),
+    'shoulder': ((LEFT_ELBOW, LEFT_SHOULDER, LEFT_HIP), (RIGHT_ELBOW, RIGHT_SHOULDER, RIGHT_HIP)),
+    'hip': ((LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE), (RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE)),
+    'knee': ((LEFT_HIP, LEFT_KNEE, LEFT_ANKLE), (RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE)),
+}
+
+# a side is usable only when all three of its landmarks are above this visibility
+VIS_MIN = 0.2
+# side rules: 'visible' = side with the higher summed visibility, 'mean' = average of usable sides
+SIDE_RULES = ('visible', 'mean')
+
+
+def joint_angles(xy, triplets):
+    """
+    Angles (degrees) at the middle landmark of each (a, b, c) triplet.
+    xy is (..., 33, 2): one frame or any batch of frames; triplets is (J, 3).
+    Returns (..., J).
+    """
+    pts = xy[..., np.asarray(triplets), :]              # (..., J, 3, 2)
+    ba = pts[..., 0, :] - pts[..., 1, :]
+    bc = pts[..., 2, :] - pts[..., 1, :]
+    dot = (ba * bc).sum(axis=-1)
+    norm = np.sqrt((ba * ba).sum(axis=-1) * (bc * bc).sum(axis=-1))
+    return np.degrees(np.arccos(np.clip(dot / (norm + 1e-8), -1.0, 1.0)))
+
+
+class ExerciseSpec:
+    """Declarative exercise definition: primary joint, side rule, default detector thresholds and motion."""
+    def __init__(self, name, joint, bottom_th, top_th, side='visible', min_amp=30, motion=None):
+        if joint not in JOINTS:
+            raise ValueError(f"{name}: unknown joint {joint!r} (one of {', '.join(JOINTS)})")
+        if side not in SIDE_RULES:
+            raise ValueError(f"{name}: unknown side rule {side!r} (one of {', '.join(SIDE_RULES)})")
+        self.name = name
+        self.joint = joint
+        self.bottom_th = bottom_th
+        self.top_th = top_th
+        self.side = side
+        self.min_amp = min_amp
+        self.motion = motion
+
+
+EXERCISES = {}
+
+
+def register(spec):
+    EXERCISES[spec.name] = spec
+    return spec
+
+
+# angles in degrees, wrist_h = wrist height above the shoulder in torso lengths
+register(ExerciseSpec('bicep_curl', 'elbow', bottom_th=40, top_th=160,
+                      motion={'elbow': (165, 40), 'shoulder': (10, 20), 'wrist_h': (-1.0, -0.15)}))
+register(ExerciseSpec('lat_pulldown', 'elbow', bottom_th=70, top_th=160,
+                      motion={'elbow': (165, 60), 'shoulder': (165, 65), 'wrist_h': (1.0, -0.3)}))
+register(ExerciseSpec('squat', 'knee', bottom_th=95, top_th=160, side='mean',
+                      motion={'hip': (175, 75), 'knee': (175, 80)}))
+register(ExerciseSpec('shoulder_press', 'elbow', bottom_th=85, top_th=155, side='mean',
+                      motion={'elbow': (165, 80), 'shoulder': (165, 95), 'wrist_h': (1.2, 0.3)}))
+register(ExerciseSpec('seated_row', 'elbow', bottom_th=80, top_th=150,
+                      motion={'elbow': (165, 80), 'shoulder': (80, 30), 'wrist_h': (-0.5, -0.6)}))
+
+
+class AngleKernel:
+    """
+    Primary angles of a fixed set of exercises from one joint_angles() pass.
+    Joints shared by several exercises (e.g. the elbow) are computed once.
+    """
+    def __init__(self, specs=None):
+        specs = list(EXERCISES.values()) if specs is None else list(specs)
+        self.names = [s.name for s in specs]
+        joints = list(dict.fromkeys(s.joint for s in specs))
+        # columns 2j / 2j+1 hold the left / right triplet of joint j
+        self.triplets = np.array([t for j in joints for t in JOINTS[j]])
+        col = {j: 2 * i for i, j in enumerate(joints)}
+        self.left = np.array([col[s.joint] for s in specs])
+        self.right = self.left + 1
+        self.mean = np.array([s.side == 'mean' for s in specs])
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    def angles(self, xy, vis):
+        """
+        xy (..., 33, 2), vis (..., 33) -> primary angle per exercise (..., S), in self.names
+        order. An exercise whose chosen side(s) are not visible gets 0.0, like the detector
+        input has always been on occlusion.
+        """
+        ang = joint_angles(np.asarray(xy, dtype=np.float64), self.triplets)
+        tv = np.asarray(vis, dtype=np.float64)[..., self.triplets]     # (..., 2J, 3)
+        ok = tv.min(axis=-1) > VIS_MIN
+        vsum = tv.sum(axis=-1)
+        usable = np.where(ok, ang, 0.0)
+        u_l, u_r = usable[..., self.left], usable[..., self.right]
+        best = np.where(vsum[..., self.right] > vsum[..., self.left], u_r, u_l)
+        n = ok[..., self.left].astype(np.float64) + ok[..., self.right]
+        mean = (u_l + u_r) / np.maximum(n, 1.0)
+        return np.where(self.mean, mean, best)
+
+    def angle(self, name, xy, vis):
+        return self.angles(xy, vis)[..., self.index[name]]
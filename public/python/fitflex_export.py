@@ -0,0 +1,152 @@
+"""
+FitFlex overlay export
+
+Exports run on background writer threads fed by a bounded queue, so PNG encoding and
+disk I/O never stall tracking. When the queue is full the frame is dropped and counted
+rather than blocking the main loop.
+
+Two exporters:
+  PngOverlayExporter     - RGBA PNG per frame (overlays/overlay_XXXXXX.png)
+  VectorOverlayExporter  - one JSON Lines stream of skeleton geometry; the web front end
+                           draws the neon skeleton itself from landmarks + connections
+"""
+import json
+import queue
+import threading
+import time
+
+import numpy as np
+
+from fitflex_frame import VIS_THRESHOLD
+
+
+class ExportWriterPool:
+    """Bounded job queue drained by a fixed number of writer threads."""
+    def __init__(self, workers=2, max_queue=32, name="fitflex-export"):
+        self.jobs = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.write_s = 0.0
+        self.threads = [threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True)
+                        for i in range(workers)]
+        for t in self.threads:
+            t.start()
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                break
+            fn, args = job
+            t0 = time.perf_counter()
+            try:
+                fn(*args)
+                ok = True
+            except Exception as e:
+                print(f"[Export] write failed: {e}")
+                ok = False
+            with self.lock:
+                self.write_s += time.perf_counter() - t0
+                if ok:
+                    self.written += 1
+                else:
+                    self.failed += 1
+            self.jobs.task_done()
+
+    def submit(self, fn, *args):
+        """Queue fn(*args); returns False (and counts a drop) if the queue is full."""
+        try:
+            self.jobs.put_nowait((fn, args))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+        with self.lock:
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self.jobs.qsize())
+        return True
+
+    def close(self):
+        """Drain pending jobs and stop the workers."""
+        for _ in self.threads:
+            self.jobs.put(None)
+        for t in self.threads:
+            t.join()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "submitted": self.submitted,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "queue_depth": self.jobs.qsize(),
+                "max_queue_depth": self.max_depth,
+                "avg_write_ms": round(1000.0 * self.write_s / self.written, 2) if self.written else 0.0,
+            }
+
+
+def _write_png(path, overlay_rgba):
+    import cv2
+    # convert RGBA to BGRA for OpenCV saving
+    bgra = cv2.cvtColor(overlay_rgba, cv2.COLOR_RGBA2BGRA)
+    cv2.imwrite(str(path), bgra)
+
+
+class PngOverlayExporter:
+    def __init__(self, out_dir, workers=2, max_queue=32):
+        self.out_dir = out_dir
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.pool = ExportWriterPool(workers=workers, max_queue=max_queue, name="fitflex-png")
+
+    def export(self, frame_idx, state, overlay_rgba):
+        path = self.out_dir / f"overlay_{frame_idx:06d}.png"
+        # the compositor reuses its overlay buffer, so hand the writer a copy
+        return self.pool.submit(_write_png, path, overlay_rgba.copy())
+
+    def close(self):
+        self.pool.close()
+
+    def stats(self):
+        return self.pool.stats()
+
+
+class VectorOverlayExporter:
+    """
+    Skeleton geometry as JSON Lines. The first line is a header with frame size and
+    the connection list; each following line is one frame:
+      {"f": frame_idx, "ts": t_ms, "p": [x0, y0, x1, y1, ...], "v": [v0, v1, ...]}
+    with pixel coordinates rounded to ints and visibility as 0-100 ints.
+    """
+    def __init__(self, path, width, height, connections, max_queue=256):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.f = open(self.path, "w")
+        header = {"type": "header", "width": width, "height": height,
+                  "vis_threshold": VIS_THRESHOLD,
+                  "connections": [list(c) for c in connections]}
+        self.f.write(json.dumps(header, separators=(",", ":")) + "\n")
+        # single writer keeps frames in order
+        self.pool = ExportWriterPool(workers=1, max_queue=max_queue, name="fitflex-vector")
+
+    def _write(self, frame_idx, ts, pts, vis):
+        rec = {"f": frame_idx, "ts": ts, "p": pts.ravel().tolist(), "v": vis.tolist()}
+        self.f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+
+    def export(self, frame_idx, state, overlay_rgba=None):
+        # the FrameState is reused for the next frame, so hand the writer rounded copies
+        pts = np.rint(state.xy).astype(np.int64)
+        vis = np.rint(state.vis * 100).astype(np.int64)
+        return self.pool.submit(self._write, frame_idx, state.t_ms, pts, vis)
+
+    def close(self):
+        self.pool.close()
+        self.f.close()
+
+    def stats(self):
+        return self.pool.stats()
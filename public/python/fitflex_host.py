@@ -0,0 +1,502 @@
+"""
+FitFlex multi-stream host
+
+Runs several stations (cameras or video files) on one machine:
+
+  supervisor   opens every source, captures/decodes it on a thread and publishes frames
+               into a per-stream shared-memory ring (fitflex_shm); nothing is pickled
+  workers      a pool of processes, each pinned to its own cores and owning a few
+               streams: one MediaPipe graph, smoother and exercise manager per stream
+  aggregator   workers send rep/set events and stats back over a queue; the supervisor
+               logs them per stream (sessions/<stream>/), stores each stream as a
+               session of the station's store (station = stream name) and keeps totals
+  restarts     a worker that dies is restarted on the same cores and streams (with
+               backoff, up to --max_restarts); the other workers never notice, rings
+               and totals live in the supervisor
+
+    python fitflex_host.py --camera 0 --camera 1 --video bay3.mp4 --model_complexity 0
+    python fitflex_host.py --video a.mp4 --video b.mp4 --workers 2 --metrics_port 9108
+
+Cameras drop stale frames when their worker falls behind; video files are processed
+losslessly on their own timestamps. The host is headless: the summary (per stream
+and total reps/sets, worker restarts, drops) is served with --metrics_port and written
+to host_summary_final_<ts>.json on exit.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import re
+import signal
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from fitflex_eventlog import SessionLog, DEFAULT_LOG_DIR
+from fitflex_shm import ShmFrameRing, RING_SLOTS, POLL_S
+from fitflex_store import SessionStore, DEFAULT_STORE, DEFAULT_USER, log_key
+
+STATS_INTERVAL_S = 1.0
+STATUS_INTERVAL_S = 10.0
+MAX_RESTARTS = 5
+RESTART_BACKOFF_S = 1.0
+
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def plan_workers(n_streams, workers=None, cores=None):
+    """
+    Split streams and cores between worker processes. The first core is left to the
+    supervisor's capture/decode threads when there are more than two. Returns a list
+    of (cores, stream indexes), one per worker; streams are dealt round-robin.
+    """
+    cores = list(cores or available_cores())
+    spare = cores[1:] if len(cores) > 2 else cores
+    n = max(1, min(n_streams, workers or len(spare)))
+    if n <= len(spare):
+        core_sets = [spare[i::n] for i in range(n)]
+    else:
+        core_sets = [[spare[i % len(spare)]] for i in range(n)]
+    return [(core_sets[i], list(range(i, n_streams, n))) for i in range(n)]
+
+
+# Sources (supervisor side)
+class StreamSource:
+    """
+    One station: a camera index or a video file, pumped into a ShmFrameRing by a thread.
+    Cameras publish with wall-clock timestamps and overwrite old frames; videos block on
+    a full ring and use frame_index * 1000 / fps.
+    """
+    def __init__(self, name, camera=None, video=None, slots=RING_SLOTS):
+        self.name = name
+        self.camera = camera
+        self.video = video
+        self.live = video is None
+        self.stop_event = threading.Event()
+        if self.live:
+            import cv2
+            import fitflex_mediapipe_multi as ff
+            self.cap = cv2.VideoCapture(camera)
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, ff.FRAME_W)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, ff.FRAME_H)
+            ok, self.first = self.cap.read()
+            if not ok:
+                self.cap.release()
+                raise ValueError(f"{name}: camera {camera} gives no frames")
+            shape = self.first.shape
+        else:
+            from fitflex_video import VideoDecoder
+            self.decoder = VideoDecoder(video)
+            shape = (self.decoder.height, self.decoder.width, 3)
+        self.ring = ShmFrameRing.create(shape, slots)
+        self.thread = threading.Thread(target=self._pump, name=f"fitflex-src-{name}", daemon=True)
+
+    def start(self):
+        if not self.live:
+            self.decoder.start()
+        self.thread.start()
+        return self
+
+    def spec(self):
+        return {'name': self.name, 'ring': self.ring.spec(), 'live': self.live}
+
+    def _pump(self):
+        try:
+            if self.live:
+                frame = self.first
+                while not self.stop_event.is_set():
+                    self.ring.put(frame, int(time.time() * 1000))
+                    ok, frame = self.cap.read()
+                    if not ok:
+                        print(f"[Host] {self.name}: camera read failed")
+                        break
+            else:
+                for batch in self.decoder:
+                    for t_ms, frame in batch:
+                        if not self.ring.put(frame, t_ms, block=True, stop=self.stop_event):
+                            return
+        finally:
+            self.ring.close()
+
+    def stop(self):
+        self.stop_event.set()
+        if not self.live:
+            self.decoder.stop()
+        self.thread.join(timeout=2.0)
+        if self.live:
+            self.cap.release()
+
+    def release(self):
+        self.ring.release()
+
+
+# Workers (one process each)
+class _EventSink:
+    """Stands in for the session in track_frame(): forwards events to the aggregator."""
+    def __init__(self, results, name):
+        self.results = results
+        self.name = name
+
+    def record(self, event):
+        self.results.put(('event', self.name, event))
+
+
+class StreamLane:
+    """One stream inside a worker: its ring, Pose graph, smoother and exercise manager."""
+    def __init__(self, spec, results, pose_settings, profile, classifier):
+        import fitflex_mediapipe_multi as ff
+        from fitflex_frame import FrameState
+        from fitflex_metrics import Metrics
+        self.ff = ff
+        self.name = spec['name']
+        self.live = spec['live']
+        self.ring = ShmFrameRing.attach(spec['ring'])
+        self.frame = np.empty(self.ring.shape, dtype=np.uint8)
+        self.state = FrameState()
+        self.clock = ff.ReplayClock()
+        self.smoother = ff.make_smoother(profile)
+        self.manager = ff.make_manager(self.clock, profile, classifier)
+        self.pose = ff.load_mediapipe().Pose(**pose_settings)
+        self.sink = _EventSink(results, self.name)
+        self.metrics = Metrics()
+        self.frames = 0
+
+    def step(self):
+        """Process the next frame if one is ready; returns whether one was."""
+        t_ms = self.ring.get(self.frame, latest=self.live)
+        if t_ms is None:
+            return False
+        ff = self.ff
+        self.clock.set(t_ms)
+        if ff.detect_landmarks(self.pose, self.frame, self.state, t_ms, self.metrics):
+            with self.metrics.stage('smooth'):
+                self.smoother.smooth_state(self.state)
+        ff.track_frame(self.manager, self.sink, self.state, self.metrics)
+        self.metrics.frame()
+        self.frames += 1
+        return True
+
+    def stats(self):
+        return dict(self.ring.stats(), frames=self.frames, fps=round(self.metrics.fps(), 1),
+                    pose_p95_ms=round(self.metrics.p95('pose_process'), 1),
+                    exercise=self.manager.current)
+
+    def close(self):
+        self.pose.close()
+        self.ring.release()
+
+
+def worker_main(worker_id, cores, specs, results, stop, pose_settings, profile, templates):
+    """Worker process entry point: serve `specs` streams until they end or `stop` is set."""
+    # the supervisor handles Ctrl+C and shuts workers down in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    import cv2
+    cv2.setNumThreads(max(1, len(cores)))
+    from fitflex_classifier import TemplateClassifier
+    # built once per worker and shared by its streams (read-only after build)
+    classifier = TemplateClassifier.load(templates) if templates else TemplateClassifier().add_motions().build()
+    lanes = [StreamLane(spec, results, pose_settings, profile, classifier) for spec in specs]
+    results.put(('ready', worker_id, os.getpid()))
+    next_stats = time.monotonic() + STATS_INTERVAL_S
+    try:
+        while lanes and not stop.is_set():
+            busy = False
+            for lane in list(lanes):
+                if lane.step():
+                    busy = True
+                elif lane.ring.finished():
+                    results.put(('done', lane.name, lane.stats()))
+                    lane.close()
+                    lanes.remove(lane)
+            if time.monotonic() >= next_stats:
+                for lane in lanes:
+                    results.put(('stats', lane.name, lane.stats()))
+                next_stats = time.monotonic() + STATS_INTERVAL_S
+            if not busy:
+                time.sleep(POLL_S)
+    finally:
+        for lane in lanes:
+            results.put(('stats', lane.name, lane.stats()))
+            lane.close()
+
+
+class WorkerHandle:
+    """Supervisor's view of one worker process: its cores, streams and restarts."""
+    def __init__(self, worker_id, cores, specs):
+        self.id = worker_id
+        self.cores = cores
+        self.specs = specs
+        self.proc = None
+        self.restarts = 0
+        self.restart_at = None
+        self.failed = False
+
+    @property
+    def streams(self):
+        return [s['name'] for s in self.specs]
+
+    def start(self, ctx, results, stop, pose_settings, profile, templates):
+        self.proc = ctx.Process(target=worker_main, name=f"fitflex-worker-{self.id}", daemon=True,
+                                args=(self.id, self.cores, self.specs, results, stop,
+                                      pose_settings, profile, templates))
+        self.proc.start()
+        self.restart_at = None
+
+
+# Aggregator (supervisor side)
+class Aggregator:
+    """
+    Per-stream session logs and stats fed by the workers' result queue, plus station
+    totals. snapshot() is safe to call from another thread (metrics endpoint).
+    """
+    def __init__(self, names, log_dir=DEFAULT_LOG_DIR, store=None, user=DEFAULT_USER):
+        self.log_dir = Path(log_dir)
+        self.store = store
+        self.user = user
+        self.stored = {}
+        self.sessions = {}
+        self.stats = {name: {} for name in names}
+        self.done = set()
+        self.ready = {}
+        self.workers = {}
+        self.lock = threading.Lock()
+
+    def handle(self, msg):
+        kind, name, payload = msg
+        with self.lock:
+            if kind == 'event':
+                session = self.sessions.get(name)
+                if session is None:
+                    session = self.sessions[name] = SessionLog(
+                        'host', payload.get('ts', int(time.time() * 1000)), log_dir=self.log_dir / name)
+                    if self.store:
+                        stored = self.stored[name] = self.store.open_session(
+                            'host', session.start_time, user=self.user, station=name, log=log_key(session.paths[0]))
+                        session.listeners.append(stored.record)
+                session.record(payload)
+            elif kind == 'stats':
+                self.stats[name] = payload
+            elif kind == 'done':
+                self.stats[name] = payload
+                self.done.add(name)
+                print(f"[Host] {name} finished: {payload['frames']} frames")
+            elif kind == 'ready':
+                self.ready[name] = payload
+
+    def drain(self, results, timeout=0.0):
+        try:
+            msg = results.get(timeout=timeout) if timeout else results.get_nowait()
+            while True:
+                self.handle(msg)
+                msg = results.get_nowait()
+        except queue.Empty:
+            pass
+
+    def totals(self):
+        reps, sets = defaultdict(int), defaultdict(int)
+        for s in self.sessions.values():
+            for k, v in s.reps.items():
+                reps[k] += v
+            for k, v in s.sets.items():
+                sets[k] += v
+        return {'reps': dict(reps), 'sets': dict(sets)}
+
+    def snapshot(self):
+        with self.lock:
+            streams = {}
+            for name, stats in self.stats.items():
+                session = self.sessions.get(name)
+                streams[name] = {
+                    'reps': dict(session.reps) if session else {},
+                    'sets': dict(session.sets) if session else {},
+                    'event_log': list(session.paths) if session else [],
+                    'done': name in self.done,
+                    'stats': dict(stats),
+                }
+            return {'streams': streams, 'totals': self.totals(), 'workers': dict(self.workers)}
+
+    def status_line(self):
+        with self.lock:
+            parts = []
+            for name, stats in self.stats.items():
+                session = self.sessions.get(name)
+                reps = sum(session.reps.values()) if session else 0
+                parts.append(f"{name} {stats.get('fps', 0.0):.0f}fps {reps} reps")
+        return " | ".join(parts)
+
+    def close(self):
+        with self.lock:
+            for name, session in self.sessions.items():
+                session.close()
+                if name in self.stored:
+                    self.stored[name].close(session.end_time, {'event_log': session.paths, 'stats': self.stats[name]})
+
+
+def stream_names(cameras, videos):
+    """Unique file-system-safe stream names: cam<index>, then video file stems."""
+    names, seen = [], set()
+    for c in cameras:
+        names.append(f"cam{c}")
+    for v in videos:
+        names.append(re.sub(r"[^A-Za-z0-9_.-]", "_", Path(v).stem) or "video")
+    out = []
+    for name in names:
+        unique, k = name, 1
+        while unique in seen:
+            k += 1
+            unique = f"{name}-{k}"
+        seen.add(unique)
+        out.append(unique)
+    return out
+
+
+def run_host(cameras=(), videos=(), workers=None, pose_settings=None, profile=None, templates=None,
+             log_dir=DEFAULT_LOG_DIR, max_restarts=MAX_RESTARTS, metrics_port=0, slots=RING_SLOTS,
+             store_path=DEFAULT_STORE, user=DEFAULT_USER):
+    """
+    Serve every stream until all have ended (or Ctrl+C); returns the final summary dict.
+    store_path=None keeps the streams out of the session store.
+    """
+    import fitflex_mediapipe_multi as ff
+    pose_settings = dict(pose_settings or ff.POSE_SETTINGS)
+    names = stream_names(cameras, videos)
+    kinds = [('camera', c) for c in cameras] + [('video', v) for v in videos]
+    sources = []
+    try:
+        for name, (kind, src) in zip(names, kinds):
+            if kind == 'camera':
+                sources.append(StreamSource(name, camera=src, slots=slots))
+            else:
+                sources.append(StreamSource(name, video=src, slots=slots))
+    except Exception:
+        for s in sources:
+            s.stop()
+            s.release()
+        raise
+    # spawn: workers must not inherit the supervisor's capture threads
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+    stop = ctx.Event()
+    store = SessionStore(store_path) if store_path else None
+    aggregator = Aggregator(names, log_dir, store, user)
+    handles = []
+    for i, (cores, idx) in enumerate(plan_workers(len(sources), workers)):
+        handles.append(WorkerHandle(i, cores, [sources[k].spec() for k in idx]))
+    for h in handles:
+        print(f"[Host] worker {h.id}: cores {h.cores} streams {', '.join(h.streams)}")
+        h.start(ctx, results, stop, pose_settings, profile, templates)
+    for s in sources:
+        s.start()
+    server = None
+    if metrics_port:
+        from fitflex_metrics import MetricsServer
+        server = MetricsServer(aggregator, port=metrics_port).start()
+        print(f"[Host] Serving http://127.0.0.1:{server.port}/metrics")
+    t_start = time.time()
+    next_status = time.monotonic() + STATUS_INTERVAL_S
+    try:
+        while True:
+            aggregator.drain(results, timeout=0.2)
+            for h in handles:
+                _supervise(h, aggregator, max_restarts, ctx, results, stop, pose_settings, profile, templates)
+            with aggregator.lock:
+                aggregator.workers = {h.id: {'pid': h.proc.pid, 'alive': h.proc.is_alive(),
+                                             'restarts': h.restarts, 'failed': h.failed,
+                                             'streams': h.streams} for h in handles}
+            if all(h.failed or h.proc.exitcode == 0 for h in handles):
+                break
+            if time.monotonic() >= next_status:
+                print(f"[Host] {aggregator.status_line()}")
+                next_status = time.monotonic() + STATUS_INTERVAL_S
+    except KeyboardInterrupt:
+        print("[Host] Stopping...")
+    finally:
+        stop.set()
+        for s in sources:
+            s.stop()
+        for h in handles:
+            h.proc.join(timeout=5.0)
+            if h.proc.is_alive():
+                h.proc.terminate()
+                h.proc.join()
+        aggregator.drain(results)
+        if server:
+            server.stop()
+        summary = aggregator.snapshot()
+        for s in sources:
+            summary['streams'][s.name]['ring'] = s.ring.stats()
+            s.release()
+        aggregator.close()
+        if store:
+            store.close()
+    summary['start_time'] = int(t_start * 1000)
+    summary['end_time'] = int(time.time() * 1000)
+    summary['pose_settings'] = pose_settings
+    return summary
+
+
+def _supervise(h, aggregator, max_restarts, ctx, results, stop, pose_settings, profile, templates):
+    """Restart a crashed worker after a backoff, or give its streams up after max_restarts."""
+    if h.failed or h.proc.is_alive() or h.proc.exitcode == 0 or stop.is_set():
+        return
+    now = time.monotonic()
+    if h.restart_at is None:
+        if h.restarts >= max_restarts:
+            h.failed = True
+            print(f"[Host] worker {h.id} failed {h.restarts + 1} times; giving up on {', '.join(h.streams)}")
+            return
+        h.restart_at = now + RESTART_BACKOFF_S * 2 ** h.restarts
+        print(f"[Host] worker {h.id} exited with {h.proc.exitcode}; restarting")
+    elif now >= h.restart_at:
+        h.restarts += 1
+        # streams that ended meanwhile are not handed out again
+        h.specs = [s for s in h.specs if s['name'] not in aggregator.done]
+        h.start(ctx, results, stop, pose_settings, profile, templates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several FitFlex stations in one worker pool")
+    parser.add_argument("--camera", type=int, action="append", default=[], help="Camera index (repeatable)")
+    parser.add_argument("--video", type=str, action="append", default=[], help="Video file (repeatable)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per spare core, at most one per stream)")
+    parser.add_argument("--model_complexity", type=int, choices=(0, 1, 2), help="Pose model for every stream (0 is fastest)")
+    parser.add_argument("--profile", type=str, help="Calibration profile JSON from fitflex_calibrate.py")
+    parser.add_argument("--templates", type=str, help="Auto-switch template index from fitflex_classifier.py")
+    parser.add_argument("--log_dir", type=str, default=str(DEFAULT_LOG_DIR), help="Per-stream session event logs go to LOG_DIR/<stream>/")
+    parser.add_argument("--max_restarts", type=int, default=MAX_RESTARTS, help="Restarts per worker before its streams are given up")
+    parser.add_argument("--slots", type=int, default=RING_SLOTS, help="Frames buffered per stream in shared memory")
+    parser.add_argument("--metrics_port", type=int, default=0, help="Serve the live host summary as JSON on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--store", type=str, default=str(DEFAULT_STORE), help="SQLite session store; each stream is stored as a session")
+    parser.add_argument("--no_store", action="store_true", help="Do not write the streams to the store")
+    parser.add_argument("--user", type=str, default=DEFAULT_USER, help="Athlete the stream sessions are stored under")
+    args = parser.parse_args()
+    if not args.camera and not args.video:
+        parser.error("give at least one --camera or --video")
+
+    import fitflex_mediapipe_multi as ff
+    settings = dict(ff.POSE_SETTINGS)
+    if args.model_complexity is not None:
+        settings['model_complexity'] = args.model_complexity
+    profile = ff.load_profile(args.profile) if args.profile else None
+    summary = run_host(args.camera, args.video, args.workers, settings, profile, args.templates,
+                       args.log_dir, args.max_restarts, args.metrics_port, args.slots,
+                       None if args.no_store else args.store, args.user)
+    for name, stream in summary['streams'].items():
+        print(f"[Host] {name}: reps={stream['reps']} sets={stream['sets']} ring={stream.get('ring')}")
+    print(f"[Host] total reps={summary['totals']['reps']} sets={summary['totals']['sets']}")
+    outp = ff.save_session(summary, "host_summary_final")
+    print(f"[Saved] Host summary -> {outp}")
+
+
+if __name__ == "__main__":
+    main()
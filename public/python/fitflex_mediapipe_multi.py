@@ -1,23 +1,42 @@
 """
-FitFlex MediaPipe multi-exercise tracker (bicep curl + lat pulldown)
+FitFlex MediaPipe multi-exercise tracker (exercises from fitflex_exercises)
 
-Camera mode and CSV playback
+Camera mode, video files and CSV playback
 One-Euro smoothing per landmark
+Multi-person mode: per-athlete counts for up to 4 people (fitflex_multiperson)
+Live WebSocket feed of landmarks and reps for the web app (fitflex_stream)
 Ensemble heuristics + calibration
 Transparent overlay export (RGBA PNG frames)
 Session summary JSON export (no raw video)
+
+OpenCV and MediaPipe are imported on first use: smoothing, angles, detectors and
+session logic (replay, eval, calibration, headless CSV) load without either.
 """
-import cv2
-import mediapipe as mp
 import numpy as np
 import time
 import json
 import argparse
-from collections import deque, defaultdict
+import contextlib
+import threading
+from collections import deque
 from pathlib import Path
 import os
 import math
 
+from fitflex_adaptive import AdaptiveInference
+from fitflex_archive import ARCHIVE_EXT, LandmarkArchive, LandmarkArchiveWriter, clip_range, is_archive
+from fitflex_eventlog import SessionLog, SessionSummary, DEFAULT_LOG_DIR
+from fitflex_classifier import ExerciseClassifier, TemplateClassifier
+from fitflex_exercises import EXERCISES, POSE_CONNECTIONS, AngleKernel
+from fitflex_export import PngOverlayExporter, VectorOverlayExporter
+from fitflex_frame import FrameState, FramePool
+from fitflex_metrics import Metrics, MetricsServer
+from fitflex_multiperson import MAX_TRACKS, MultiPersonTracker, PoseLandmarkerDetector, draw_track_labels
+from fitflex_pipeline import FramePipeline
+from fitflex_recording import LandmarkWriter, LandmarkRecording, is_recording
+from fitflex_store import SessionStore, DEFAULT_STORE, DEFAULT_USER, log_key
+from fitflex_video import PoseCache, POSE_CACHE_DIR, POSE_CACHE_MAX_MB, video_frames, video_info, video_landmarks
+
 # Configurable parameters
 FRAME_W = 640
 FRAME_H = 480
@@ -39,19 +58,84 @@ SET_IDLE_S = 10
 # Calibration
 CALIB_SAMPLES = 3
 
-# Overlay export
+# Pose model; these settings are part of the video pose cache key
+POSE_SETTINGS = {'model_complexity': 1, 'min_detection_confidence': 0.6, 'min_tracking_confidence': 0.6}
+
+# Overlay export (created by the exporters when first used)
 OVERLAY_DIR = Path("overlays")
-OVERLAY_DIR.mkdir(exist_ok=True)
 
 # Privacy: do not save raw video by default
 SAVE_RAW_VIDEO = False
 
-# Utilities
-mp_pose = mp.solutions.pose
+# Heavy backends, loaded on first use
+_mp_pose = None
+_mp_lock = threading.Lock()
+
+def load_mediapipe():
+    """mediapipe.solutions.pose, imported on first call (seconds: TFLite runtime, protobuf)."""
+    global _mp_pose
+    with _mp_lock:
+        if _mp_pose is None:
+            import mediapipe as mp
+            _mp_pose = mp.solutions.pose
+    return _mp_pose
+
+class PoseWarmup:
+    """
+    Imports MediaPipe and builds a Pose on a background thread, running one blank frame
+    through it so the graph and model are initialized, while the caller opens the camera
+    and loads profiles. get() waits for it and returns the Pose.
+    """
+    def __init__(self, settings=None):
+        self.settings = settings or POSE_SETTINGS
+        self.pose = None
+        self.error = None
+        self.elapsed_s = None
+        self.thread = threading.Thread(target=self._run, name="fitflex-prewarm", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        t0 = time.perf_counter()
+        try:
+            pose = load_mediapipe().Pose(**self.settings)
+            pose.process(np.zeros((64, 64, 3), dtype=np.uint8))
+            self.pose = pose
+        except Exception as e:
+            self.error = e
+        self.elapsed_s = time.perf_counter() - t0
 
+    def get(self):
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.pose
+
+# Utilities
 def now_ms():
     return int(time.time() * 1000)
 
+# Clocks: detectors and the manager read time through a clock object so that
+# playback can be driven by recorded timestamps instead of the wall clock.
+class WallClock:
+    def now_ms(self):
+        return now_ms()
+
+class ReplayClock:
+    """Clock that only moves when the replay loop sets it to the next recorded timestamp."""
+    def __init__(self, t_ms=0):
+        self.t_ms = int(t_ms)
+
+    def set(self, t_ms):
+        self.t_ms = int(t_ms)
+
+    def now_ms(self):
+        return self.t_ms
+
+WALL_CLOCK = WallClock()
+
+# stage timing is a no-op unless a live Metrics instance is passed in
+NULL_METRICS = Metrics(enabled=False)
+
 def angle_deg(a, b, c):
     """Calculate angle at point b given points a, b, c in (x, y) coords."""
     ba = np.array(a) - np.array(b)
@@ -97,38 +181,135 @@ class OneEuro:
 
 # Pose smoothing manager
 class PoseSmoother:
-    def __init__(self, num_landmarks=33):
+    """
+    Vectorized One-Euro smoothing for a whole skeleton.
+    Filter state (x_prev, dx_prev, t_prev) is kept as (num_landmarks, 3) arrays,
+    so a frame is filtered in a handful of array ops instead of 99 OneEuro calls.
+    Semantics and parameters match OneEuro.
+    """
+    def __init__(self, num_landmarks=33, freq=ONE_EURO_FREQ, min_cutoff=ONE_EURO_MIN_CUTOFF,
+                 beta=ONE_EURO_BETA, d_cutoff=ONE_EURO_D_CUTOFF):
         self.num = num_landmarks
-        # per-landmark per-axis filters
-        self.filters = {}
-        for i in range(self.num):
-            self.filters[(i,'x')] = OneEuro()
-            self.filters[(i,'y')] = OneEuro()
-            self.filters[(i,'z')] = OneEuro()
+        self.freq = float(freq)
+        self.min_cutoff = float(min_cutoff)
+        self.beta = float(beta)
+        self.d_cutoff = float(d_cutoff)
+        self.reset()
+
+    def reset(self):
+        shape = (self.num, 3)
+        self.x_prev = np.zeros(shape, dtype=np.float64)
+        self.dx_prev = np.zeros(shape, dtype=np.float64)
+        self.t_prev = np.full(shape, np.nan, dtype=np.float64)
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        # 1 / (1 + tau/dt) with tau = 1 / (2*pi*cutoff)
+        return 1.0 / (1.0 + 1.0 / (2.0 * math.pi * cutoff * dt))
+
+    def smooth_array(self, xyz, t_ms):
+        """Filter one frame given as a (num_landmarks, 3) array; returns a new (num_landmarks, 3) array."""
+        return self._filter(np.asarray(xyz, dtype=np.float64), t_ms).copy()
+
+    def smooth_state(self, state):
+        """Filter a FrameState's positions in place."""
+        np.copyto(state.xyz, self._filter(state.xyz, state.t_ms))
+
+    def _filter(self, x, t_ms):
+        # returns the new filter state x_prev; callers copy it out
+        t = t_ms / 1000.0
+        self.x_prev, self.dx_prev = self._step(x, t, self.x_prev, self.dx_prev, self.t_prev)
+        self.t_prev.fill(t)
+        return self.x_prev
+
+    def _step(self, x, t, x_prev, dx_prev, t_prev):
+        """One filter update of any shape; returns (x_hat, dx_hat)."""
+        fresh = np.isnan(t_prev)
+        dt = np.maximum(1e-6, t - np.where(fresh, t, t_prev))
+        dx = (x - x_prev) / dt
+        a_d = self._alpha(self.d_cutoff, dt)
+        dx_hat = a_d * dx + (1.0 - a_d) * dx_prev
+        cutoff = self.min_cutoff + self.beta * np.abs(dx_hat)
+        a = self._alpha(cutoff, dt)
+        x_hat = a * x + (1.0 - a) * x_prev
+        # first sample of a filter passes through unchanged
+        if fresh.any():
+            x_hat = np.where(fresh, x, x_hat)
+            dx_hat = np.where(fresh, 0.0, dx_hat)
+        return x_hat, dx_hat
+
+    def predict(self, t_ms, max_dt_s=0.25):
+        """
+        Extrapolate the filtered positions to t_ms using the filtered velocity (dx_prev).
+        Returns a (num_landmarks, 3) array; landmarks never filtered stay at zero.
+        """
+        dt = np.nan_to_num(t_ms / 1000.0 - self.t_prev)
+        return self.x_prev + self.dx_prev * np.clip(dt, 0.0, max_dt_s)
+
+    def smooth_batch(self, frames, t_ms):
+        """
+        Filter an offline batch: frames is (n_frames, num_landmarks, 3), t_ms is (n_frames,).
+        Filter state carries over between calls, so a long recording can be fed in chunks.
+        """
+        frames = np.asarray(frames, dtype=np.float64)
+        out = np.empty_like(frames)
+        for k in range(frames.shape[0]):
+            out[k] = self.smooth_array(frames[k], float(t_ms[k]))
+        return out
 
     def smooth(self, landmarks, t_ms):
         # landmarks: list of (x_px, y_px, z, visibility)
-        out = []
-        for i, lm in enumerate(landmarks):
-            x, y, z, v = lm
-            sx = self.filters[(i,'x')].filter(x, t_ms)
-            sy = self.filters[(i,'y')].filter(y, t_ms)
-            sz = self.filters[(i,'z')].filter(z, t_ms)
-            out.append((sx, sy, sz, v))
-        return out
+        arr = np.asarray(landmarks, dtype=np.float64)
+        xyz = self.smooth_array(arr[:, :3], t_ms)
+        return [(x, y, z, v) for (x, y, z), v in zip(xyz.tolist(), arr[:, 3].tolist())]
+
+class TrackSmoother(PoseSmoother):
+    """
+    PoseSmoother for up to `slots` people (fitflex_multiperson): filter state is
+    (slots, num_landmarks, 3) and smooth_tracks() filters everyone detected in a frame
+    in one pass. predict() extrapolates every slot at once.
+    """
+    def __init__(self, slots, num_landmarks=33, **params):
+        self.slots = slots
+        super().__init__(num_landmarks, **params)
+
+    def reset(self):
+        shape = (self.slots, self.num, 3)
+        self.x_prev = np.zeros(shape, dtype=np.float64)
+        self.dx_prev = np.zeros(shape, dtype=np.float64)
+        self.t_prev = np.full(shape, np.nan, dtype=np.float64)
+
+    def reset_slot(self, slot):
+        """Start a new person in `slot`: their first frame passes through unfiltered."""
+        self.x_prev[slot] = 0.0
+        self.dx_prev[slot] = 0.0
+        self.t_prev[slot] = np.nan
+
+    def smooth_tracks(self, slots, xyz, t_ms):
+        """Filter xyz (len(slots), num_landmarks, 3) into the given slots; returns the filtered array."""
+        t = t_ms / 1000.0
+        x_hat, dx_hat = self._step(xyz, t, self.x_prev[slots], self.dx_prev[slots], self.t_prev[slots])
+        self.x_prev[slots] = x_hat
+        self.dx_prev[slots] = dx_hat
+        self.t_prev[slots] = t
+        return x_hat
 
 # Rep detectors for exercises
 class ExerciseDetector:
-    def __init__(self, name, bottom_th, top_th, min_amp=25):
+    def __init__(self, name, bottom_th, top_th, min_amp=25, clock=None,
+                 angle_window=ANGLE_WINDOW, min_rep_ms=MIN_REP_MS, max_rep_ms=MAX_REP_MS):
         self.name = name
+        self.clock = clock or WALL_CLOCK
         self.bottom_th = bottom_th
         self.top_th = top_th
         self.min_amp = min_amp
+        self.min_rep_ms = min_rep_ms
+        self.max_rep_ms = max_rep_ms
         self.rep_count = 0
         self.set_count = 0
         self.stage = None
-        self.last_rep_ts = 0
-        self.angle_hist = deque(maxlen=ANGLE_WINDOW)
+        self.last_rep_ts = None
+        self.angle_hist = deque(maxlen=angle_window)
         self.set_timer_start = None
         self.calib_mode = False
         self.calib_samples = []
@@ -154,14 +335,14 @@ class ExerciseDetector:
         self.rep_count = 0
         self.set_count = 0
         self.stage = None
-        self.last_rep_ts = 0
+        self.last_rep_ts = None
         self.angle_hist.clear()
         self.set_timer_start = None
         self.calib_mode = False
         self.calib_samples = []
 
     def update(self, angle_deg):
-        tnow = now_ms()
+        tnow = self.clock.now_ms()
         self.angle_hist.append(angle_deg)
         avg_angle = float(np.mean(self.angle_hist))
 
@@ -185,36 +366,78 @@ class ExerciseDetector:
         if avg_angle < self.bottom_th and self.stage == 'down':
             self.stage = 'up'
             # register rep if timing ok
-            if self.last_rep_ts == 0 or (tnow - self.last_rep_ts >= MIN_REP_MS and tnow - self.last_rep_ts <= MAX_REP_MS):
+            if self.last_rep_ts is None or (tnow - self.last_rep_ts >= self.min_rep_ms and tnow - self.last_rep_ts <= self.max_rep_ms):
                 self.rep_count += 1
                 rep_inc = True
                 self.last_rep_ts = tnow
-                self.set_timer_start = time.time()
+                self.set_timer_start = tnow
         # set completion
-        if self.set_timer_start and (time.time() - self.set_timer_start) > SET_IDLE_S and self.rep_count > 0:
+        if self.set_timer_start is not None and (tnow - self.set_timer_start) > SET_IDLE_S * 1000 and self.rep_count > 0:
             self.set_count += 1
             set_inc = True
             self.rep_count = 0
             self.set_timer_start = None
+            # the next set starts fresh; otherwise the rest would exceed max_rep_ms forever
+            self.last_rep_ts = None
 
         return rep_inc, set_inc
 
+    def apply_params(self, params):
+        """Apply tuned parameters (one exercise entry of a calibration profile)."""
+        self.bottom_th = float(params.get('bottom_th', self.bottom_th))
+        self.top_th = float(params.get('top_th', self.top_th))
+        self.min_rep_ms = float(params.get('min_rep_ms', self.min_rep_ms))
+        self.max_rep_ms = float(params.get('max_rep_ms', self.max_rep_ms))
+        if 'angle_window' in params:
+            self.angle_hist = deque(self.angle_hist, maxlen=int(params['angle_window']))
+
 # Multi-exercise manager (auto-switch)
 class MultiExerciseManager:
-    def __init__(self):
-        # detectors: bicep curl and lat pulldown
+    def __init__(self, clock=None, exercises=None, classifier=None):
+        self.clock = clock or WALL_CLOCK
+        # one detector per registered exercise (fitflex_exercises.EXERCISES)
+        specs = list((exercises or EXERCISES).values())
         self.detectors = {
-            'bicep_curl': ExerciseDetector('bicep_curl', bottom_th=40, top_th=160, min_amp=30),
-            'lat_pulldown': ExerciseDetector('lat_pulldown', bottom_th=70, top_th=160, min_amp=30)
+            s.name: ExerciseDetector(s.name, bottom_th=s.bottom_th, top_th=s.top_th, min_amp=s.min_amp, clock=self.clock)
+            for s in specs
         }
-        self.current = 'bicep_curl'  # default
+        self.kernel = AngleKernel(specs)
+        self.default = 'bicep_curl' if 'bicep_curl' in self.detectors else specs[0].name
+        self.current = self.default
         self.last_switch = 0
-        self.history = deque(maxlen=30)
+        # classifier: optional TemplateClassifier (e.g. loaded with --templates)
+        self.auto = ExerciseClassifier(classifier)
+        # recent (t_ms, primary angle of every exercise), replayed into a newly selected detector
+        self.angle_log = deque(maxlen=2 * self.auto.engine.window)
+        self.rep_log = deque(maxlen=64)     # (t_ms, exercise) of recent live reps
+        self.backfill = []
 
     def reset_all(self):
         for d in self.detectors.values():
             d.reset()
 
+    def clear(self):
+        """Forget the athlete entirely (counts, auto-switch state, history), e.g. when a pooled manager is reused."""
+        self.reset_all()
+        self.auto.reset()
+        self.angle_log.clear()
+        self.rep_log.clear()
+        self.backfill = []
+        self.current = self.default
+        self.last_switch = 0
+
+    def apply_profile(self, profile):
+        for name, params in profile.get('exercises', {}).items():
+            if name in self.detectors:
+                self.detectors[name].apply_params(params)
+
+    def cycle(self):
+        """Manually select the next registered exercise."""
+        names = list(self.detectors)
+        self.current = names[(names.index(self.current) + 1) % len(names)]
+        self.auto.streak = 0
+        return self.current
+
     def start_calibration(self, name=None):
         if name:
             self.detectors[name].start_calibration()
@@ -231,115 +454,196 @@ class MultiExerciseManager:
 
     def analyze_and_switch(self, landmarks, vis):
         """
-        Compute simple movement signatures and pick between bicep_curl and lat_pulldown.
-        Signatures:
-        - bicep_curl: large elbow flexion/extension with wrist vertical movement near shoulder level
-        - lat_pulldown: large shoulder depression (wrist moves down from overhead) and torso involvement
+        Feed the frame to the windowed feature engine and switch exercise when the template
+        classifier (fitflex_classifier) has confidently agreed on another one several
+        times in a row. Returns the current exercise.
         """
-        # helper to get pixel coords
-        def p(idx):
-            x,y,z,v = landmarks[idx]
-            return (x,y)
-        # indices
-        L = mp_pose.PoseLandmark
-        # compute elbow angles both sides
-        left_elbow_angle = angle_deg(p(L.LEFT_SHOULDER.value), p(L.LEFT_ELBOW.value), p(L.LEFT_WRIST.value)) if vis[L.LEFT_SHOULDER.value] > 0.3 else 0.0
-        right_elbow_angle = angle_deg(p(L.RIGHT_SHOULDER.value), p(L.RIGHT_ELBOW.value), p(L.RIGHT_WRIST.value)) if vis[L.RIGHT_SHOULDER.value] > 0.3 else 0.0
-        elbow_amp = max(0.0, 180.0 - min(left_elbow_angle, right_elbow_angle))  # larger when flexed
-
-        # wrist vertical displacement relative to shoulder
-        wrist_disp = 0.0
-        if vis[L.LEFT_WRIST.value] > 0.3 and vis[L.LEFT_SHOULDER.value] > 0.3:
-            wrist_disp += abs(landmarks[L.LEFT_WRIST.value][1] - landmarks[L.LEFT_SHOULDER.value][1])
-        if vis[L.RIGHT_WRIST.value] > 0.3 and vis[L.RIGHT_SHOULDER.value] > 0.3:
-            wrist_disp += abs(landmarks[L.RIGHT_WRIST.value][1] - landmarks[L.RIGHT_SHOULDER.value][1])
-
-        # shoulder vertical range (for pulldown: wrist starts high then moves down)
-        shoulder_y = 0.0
-        cnt = 0
-        if vis[L.LEFT_SHOULDER.value] > 0.3:
-            shoulder_y += landmarks[L.LEFT_SHOULDER.value][1]; cnt += 1
-        if vis[L.RIGHT_SHOULDER.value] > 0.3:
-            shoulder_y += landmarks[L.RIGHT_SHOULDER.value][1]; cnt += 1
-        shoulder_y = shoulder_y / cnt if cnt else 0.0
-
-        # hip involvement (lat pulldown often has torso lean)
-        hip_y = 0.0; cnt2 = 0
-        if vis[L.LEFT_HIP.value] > 0.3:
-            hip_y += landmarks[L.LEFT_HIP.value][1]; cnt2 += 1
-        if vis[L.RIGHT_HIP.value] > 0.3:
-            hip_y += landmarks[L.RIGHT_HIP.value][1]; cnt2 += 1
-        hip_y = hip_y / cnt2 if cnt2 else 0.0
-
-        # signature scoring
-        # bicep score: elbow amplitude high and wrist_disp moderate
-        bicep_score = elbow_amp * 1.2 + wrist_disp * 0.5
-        # lat pulldown score: wrist moves from high to low relative to shoulder and torso involvement
-        lat_score = wrist_disp * 1.5 + max(0.0, (hip_y - shoulder_y)) * 0.8
-
-        scores = {'bicep_curl': bicep_score, 'lat_pulldown': lat_score}
-        chosen = max(scores.items(), key=lambda x: x[1])[0]
-
-        # hysteresis: only switch if chosen score significantly higher and 1s since last switch
-        tnow = time.time()
-        if chosen != self.current and (tnow - self.last_switch) > 1.0:
-            if scores[chosen] > scores[self.current] * 1.2 + 1.0:
-                print(f"[AutoSwitch] {self.current} -> {chosen} (scores: {scores})")
-                self.current = chosen
-                self.last_switch = tnow
-
+        xy = np.asarray(landmarks, dtype=np.float64)[:, :2]
+        chosen = self.auto.update(self.clock.now_ms(), xy, vis, self.current)
+        if chosen is not None and chosen in self.detectors:
+            print(f"[AutoSwitch] {self.current} -> {chosen} (confidence {self.auto.confidence:.2f})")
+            self._replay_log(chosen, max(self.last_switch, self.auto.since_ms or 0))
+            self.current = chosen
+            self.last_switch = self.clock.now_ms()
         return self.current
 
+    def _replay_log(self, name, since_ms):
+        """
+        Re-attribute the frames after since_ms (where the new motion began) to the newly
+        selected exercise, so reps made while the classifier was still collecting votes are
+        neither lost nor left with the old exercise: reps the old detector counted there are
+        retracted ('rep_undo') and the buffered angles are replayed through the new detector.
+        The resulting events are queued for drain_backfill().
+        """
+        old = self.detectors[self.current]
+        for t, exercise in self.rep_log:
+            if t > since_ms and exercise == self.current:
+                old.rep_count = max(0, old.rep_count - 1)
+                self.backfill.append({'type':'rep_undo','exercise':exercise,'ts':t})
+        det = self.detectors[name]
+        col = self.kernel.index[name]
+        live_clock = det.clock
+        det.clock = replay = ReplayClock()
+        for t, angles in self.angle_log:
+            if t <= since_ms:
+                continue
+            replay.set(t)
+            angle = float(angles[col])
+            rep_inc, _ = det.update(angle)
+            if rep_inc:
+                self.backfill.append({'type':'rep','exercise':name,'ts':t,'angle':angle,'backfill':True})
+        det.clock = live_clock
+
+    def drain_backfill(self):
+        events, self.backfill = self.backfill, []
+        return events
+
+    def primary_angle(self, landmarks, vis):
+        """Primary joint angle of the current exercise (one kernel pass for all exercises)."""
+        xy = np.asarray(landmarks, dtype=np.float64)[:, :2]
+        return self.log_angles(self.kernel.angles(xy, vis))
+
+    def log_angles(self, angles):
+        """primary_angle() for angles already computed by self.kernel (e.g. for several people at once)."""
+        self.angle_log.append((self.clock.now_ms(), angles))
+        return float(angles[self.kernel.index[self.current]])
+
     def update_current(self, angle):
         det = self.detectors[self.current]
-        return det.update(angle)
+        rep_inc, set_inc = det.update(angle)
+        if rep_inc:
+            self.rep_log.append((self.clock.now_ms(), self.current))
+        return rep_inc, set_inc
 
 # Drawing overlay (transparent)
-def draw_overlay_rgba(frame, landmarks, vis, connections):
+class OverlayCompositor:
     """
-    Draw neon exoskeleton on transparent overlay and composite with frame.
-    Returns composited BGR image (no alpha) for display and optionally saves RGBA overlay.
+    Neon exoskeleton renderer with reusable buffers.
+    Only the bounding box of the visible skeleton (plus a margin covering line width,
+    joint radius and the glow blur) is blurred and blended; the rest of the output is a
+    plain copy of the frame. Blending is done in uint16 fixed point.
+    Returned arrays are owned by the compositor and overwritten on the next call.
+    Landmarks come from a FrameState; visible bones are drawn with one polylines call
+    per pass instead of one cv2.line per connection.
     """
-    h, w = frame.shape[:2]
-    # create RGBA overlay
-    overlay = np.zeros((h, w, 4), dtype=np.uint8)
-    glow_color = (46, 230, 166, 255)  # RGBA
-    bone_color = (255, 255, 255, 30)
-
-    # draw faint bones
-    for (a,b) in connections:
-        if vis[a] < 0.3 or vis[b] < 0.3:
-            continue
-        p1 = (int(landmarks[a][0]), int(landmarks[a][1]))
-        p2 = (int(landmarks[b][0]), int(landmarks[b][1]))
-        cv2.line(overlay, p1, p2, bone_color, 6, lineType=cv2.LINE_AA)
+    GLOW_COLOR = (46, 230, 166, 255)  # RGBA
+    BONE_COLOR = (255, 255, 255, 30)
+    JOINT_FILL = (11, 18, 32, 255)
+    BLUR_KSIZE = 21
+    # bone half-width + AA (4) + blur radius (10), rounded up with headroom
+    MARGIN = 24
 
-    # neon bones
-    for (a,b) in connections:
-        if vis[a] < 0.3 or vis[b] < 0.3:
-            continue
-        p1 = (int(landmarks[a][0]), int(landmarks[a][1]))
-        p2 = (int(landmarks[b][0]), int(landmarks[b][1]))
-        cv2.line(overlay, p1, p2, glow_color, 2, lineType=cv2.LINE_AA)
-
-    # blur glow (approx)
-    rgb = overlay[..., :3]
-    alpha = overlay[..., 3]
-    blurred = cv2.GaussianBlur(rgb, (21,21), 0)
-    overlay[..., :3] = cv2.addWeighted(rgb, 0.4, blurred, 0.6, 0)
-
-    # joints
-    for i, (x,y,z,v) in enumerate(landmarks):
-        if vis[i] < 0.3:
-            continue
-        cx, cy = int(x), int(y)
-        cv2.circle(overlay, (cx, cy), 8, (11,18,32,255), -1, lineType=cv2.LINE_AA)
-        cv2.circle(overlay, (cx, cy), 8, glow_color, 2, lineType=cv2.LINE_AA)
+    def __init__(self):
+        self.shape = None
+        self.roi = None
+        self.conn_src = None
+        self.pts = None
+
+    def _alloc(self, h, w):
+        self.shape = (h, w)
+        self.overlay = np.zeros((h, w, 4), dtype=np.uint8)
+        self.out = np.empty((h, w, 3), dtype=np.uint8)
+        # flat scratch buffers, viewed at the size of the current ROI
+        self._rgb = np.empty(h * w * 3, dtype=np.uint8)
+        self._blur = np.empty(h * w * 3, dtype=np.uint8)
+        self._inv = np.empty(h * w, dtype=np.uint8)
+        self._acc = np.empty(h * w * 3, dtype=np.uint16)
+        self._tmp = np.empty(h * w * 3, dtype=np.uint16)
+        self.roi = None
+
+    @staticmethod
+    def _view(buf, shape):
+        return buf[:int(np.prod(shape))].reshape(shape)
+
+    def _bounds(self, state, h, w):
+        if not state.valid.any():
+            return None
+        pts = state.xy[state.valid]
+        (xmin, ymin), (xmax, ymax) = pts.min(axis=0).tolist(), pts.max(axis=0).tolist()
+        m = self.MARGIN
+        x0 = max(0, int(xmin) - m)
+        x1 = min(w, int(xmax) + m + 1)
+        y0 = max(0, int(ymin) - m)
+        y1 = min(h, int(ymax) + m + 1)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return y0, y1, x0, x1
+
+    def draw(self, frame, state, connections):
+        import cv2
+        h, w = frame.shape[:2]
+        if self.shape != (h, w):
+            self._alloc(h, w)
+        if connections is not self.conn_src:
+            self.conn_src = connections
+            self.conn = np.asarray(connections, dtype=np.intp).reshape(-1, 2)
+        if self.pts is None or len(self.pts) != state.num:
+            self.pts = np.empty((state.num, 2), dtype=np.int32)
+        overlay = self.overlay
+        # only the previous ROI can hold stale pixels
+        if self.roi is not None:
+            y0, y1, x0, x1 = self.roi
+            overlay[y0:y1, x0:x1] = 0
+        np.copyto(self.out, frame)
+        self.roi = self._bounds(state, h, w)
+        if self.roi is None:
+            return self.out, overlay
+        # pixel coords truncated like int(x)
+        pts = self.pts
+        np.copyto(pts, state.xy, casting='unsafe')
+
+        # faint bones, then neon bones, as (K, 2, 2) segments
+        conn = self.conn
+        visible = state.valid[conn[:, 0]] & state.valid[conn[:, 1]]
+        if visible.any():
+            segs = pts[conn[visible]]
+            cv2.polylines(overlay, segs, False, self.BONE_COLOR, 6, lineType=cv2.LINE_AA)
+            cv2.polylines(overlay, segs, False, self.GLOW_COLOR, 2, lineType=cv2.LINE_AA)
+
+        # blur glow (approx), ROI only
+        y0, y1, x0, x1 = self.roi
+        sub = overlay[y0:y1, x0:x1]
+        shape3 = (y1 - y0, x1 - x0, 3)
+        rgb = self._view(self._rgb, shape3)
+        blurred = self._view(self._blur, shape3)
+        np.copyto(rgb, sub[..., :3])
+        cv2.GaussianBlur(rgb, (self.BLUR_KSIZE, self.BLUR_KSIZE), 0, dst=blurred)
+        cv2.addWeighted(rgb, 0.4, blurred, 0.6, 0, dst=rgb)
+        sub[..., :3] = rgb
+
+        # joints
+        for cx, cy in pts[state.valid].tolist():
+            cv2.circle(overlay, (cx, cy), 8, self.JOINT_FILL, -1, lineType=cv2.LINE_AA)
+            cv2.circle(overlay, (cx, cy), 8, self.GLOW_COLOR, 2, lineType=cv2.LINE_AA)
+
+        # composite overlay onto frame: (ov*a + fr*(255-a)) / 255 in uint16
+        alpha = sub[..., 3:4]
+        inv = self._view(self._inv, shape3[:2] + (1,))
+        acc = self._view(self._acc, shape3)
+        tmp = self._view(self._tmp, shape3)
+        np.subtract(255, alpha, out=inv)
+        np.multiply(sub[..., :3], alpha, out=acc, dtype=np.uint16)
+        np.multiply(frame[y0:y1, x0:x1], inv, out=tmp, dtype=np.uint16)
+        acc += tmp
+        # exact floor(acc / 255) for acc <= 255*255
+        np.right_shift(acc, 8, out=tmp)
+        acc += tmp
+        acc += 1
+        acc >>= 8
+        np.copyto(self.out[y0:y1, x0:x1], acc, casting='unsafe')
+        return self.out, overlay
 
-    # composite overlay onto frame (alpha blending)
-    alpha_f = overlay[..., 3:4].astype(float) / 255.0
-    out_rgb = (overlay[..., :3].astype(float) * alpha_f + frame.astype(float) * (1 - alpha_f)).astype(np.uint8)
-    return out_rgb, overlay  # overlay RGBA available for saving
+_default_compositor = OverlayCompositor()
+_default_state = FrameState()
+
+def draw_overlay_rgba(frame, landmarks, vis, connections):
+    """
+    Draw neon exoskeleton on transparent overlay and composite with frame.
+    Returns composited BGR image (no alpha) for display and the RGBA overlay for saving.
+    Both arrays are reused by the next call; copy them to keep a frame.
+    """
+    _default_state.fill(0, landmarks, vis)
+    return _default_compositor.draw(frame, _default_state, connections)
 
 # CSV helpers
 def export_landmarks_to_csv(landmarks, vis, out_path):
@@ -377,178 +681,612 @@ def read_landmarks_csv(path):
                 vis.append(vi)
             yield ts, landmarks, vis
 
+def read_landmarks(path, start_s=None, end_s=None):
+    """
+    Playback source for a .ffla archive, a binary .fflm recording or a landmarks CSV.
+    start_s/end_s (seconds from the first frame) play a clip; archives and recordings
+    seek straight to it.
+    """
+    if is_archive(path):
+        source = LandmarkArchive(path)
+        first_ts = source.first_ts
+    elif is_recording(path):
+        source = LandmarkRecording(path)
+        first_ts = int(source.ts[0]) if len(source) else 0
+    else:
+        frames = read_landmarks_csv(path)
+        if start_s is None and end_s is None:
+            return frames
+        return clip_frames(frames, start_s, end_s)
+    return source.iter_frames(*clip_range(first_ts, start_s, end_s))
+
+def clip_frames(frames, start_s=None, end_s=None):
+    """Frames from start_s to end_s (seconds from the first frame) of a (ts, landmarks, vis) stream."""
+    start_ms = end_ms = None
+    for ts, landmarks, vis in frames:
+        if start_ms is None:
+            start_ms, end_ms = clip_range(ts, start_s, end_s)
+            start_ms = ts if start_ms is None else start_ms
+        if ts < start_ms:
+            continue
+        if end_ms is not None and ts >= end_ms:
+            return
+        yield ts, landmarks, vis
+
+def open_recorder(path, fps, width, height):
+    """Landmark recorder for --record: a .ffla archive by suffix, otherwise .fflm."""
+    if Path(path).suffix.lower() == ARCHIVE_EXT:
+        return LandmarkArchiveWriter(path, fps=fps, width=width, height=height)
+    return LandmarkWriter(path, fps=fps, width=width, height=height)
+
+# Calibration profiles (written by fitflex_calibrate.py)
+def load_profile(path):
+    profile = json.loads(Path(path).read_text())
+    print(f"[Profile] Loaded {path}: {', '.join(profile.get('exercises', {}))}")
+    return profile
+
+def load_templates(path):
+    classifier = TemplateClassifier.load(path)
+    print(f"[Templates] Loaded {path}: {len(classifier.labels)} reference trajectories")
+    return classifier
+
+def make_smoother(profile=None):
+    """PoseSmoother using the profile's One-Euro parameters when given."""
+    params = (profile or {}).get('one_euro', {})
+    return PoseSmoother(num_landmarks=33, min_cutoff=params.get('min_cutoff', ONE_EURO_MIN_CUTOFF),
+                        beta=params.get('beta', ONE_EURO_BETA))
+
+# Tracking helpers shared by the live loop and headless replay
+def new_session(mode, t_ms):
+    """In-memory session (events kept in a list), used for bounded replays."""
+    return SessionSummary(mode, t_ms, keep_events=True)
+
+def track_frame(manager, session, state, metrics=NULL_METRICS, angles=None, track=None):
+    """
+    Run one smoothed FrameState through auto-switch and the current detector, recording
+    rep/set events in the session. angles, if given, are the frame's precomputed
+    manager.kernel angles; track tags the events with a multi-person track id.
+    Returns (exercise, angle).
+    """
+    t_ms = state.t_ms
+    tag = {} if track is None else {'track': track}
+    with metrics.stage('analyze_and_switch'):
+        current = manager.analyze_and_switch(state.xy, state.vis)
+    for event in manager.drain_backfill():
+        session.record(dict(event, **tag))
+        metrics.count('reps' if event['type'] == 'rep' else 'reps_undone')
+    with metrics.stage('update_current'):
+        if angles is None:
+            angle = manager.primary_angle(state.xy, state.vis)
+        else:
+            angle = manager.log_angles(angles)
+        rep_inc, set_inc = manager.update_current(angle)
+    if rep_inc:
+        session.record({'type':'rep','exercise':current,'ts':t_ms,'angle':angle, **tag})
+        metrics.count('reps')
+    if set_inc:
+        session.record({'type':'set','exercise':current,'ts':t_ms,'sets':manager.detectors[current].set_count, **tag})
+        metrics.count('sets')
+    return current, angle
+
+def make_manager(clock, profile=None, classifier=None):
+    manager = MultiExerciseManager(clock=clock, classifier=classifier)
+    if profile:
+        manager.apply_profile(profile)
+    return manager
+
+def make_tracker(clock, profile=None, classifier=None, max_tracks=MAX_TRACKS, detector=None, metrics=NULL_METRICS):
+    """MultiPersonTracker whose athletes share the profile, templates and clock."""
+    params = (profile or {}).get('one_euro', {})
+    smoother = TrackSmoother(max_tracks, min_cutoff=params.get('min_cutoff', ONE_EURO_MIN_CUTOFF),
+                             beta=params.get('beta', ONE_EURO_BETA))
+    # the templates are read-only once built, so every athlete's classifier shares one set
+    classifier = classifier or TemplateClassifier().add_motions().build()
+    return MultiPersonTracker(lambda: make_manager(clock, profile, classifier), smoother,
+                              max_tracks=max_tracks, detector=detector, metrics=metrics)
+
+def track_athletes(tracker, session, metrics=NULL_METRICS):
+    """track_frame() for every athlete the tracker saw in the current frame."""
+    for track in tracker.ended:
+        session.record({'type':'track_end','track':track.id,'ts':tracker.render_state.t_ms,
+                        'first_seen':track.first_seen,'last_seen':track.last_seen,'frames':track.frames})
+    for track in tracker.seen:
+        track_frame(track.manager, session, track.state, metrics, angles=track.angles, track=track.id)
+
+def replay_session(frames, mode='replay', on_frame=None, profile=None, classifier=None):
+    """
+    Headless fast-forward replay. frames yields (ts_ms, landmarks, vis) as produced by
+    read_landmarks_csv. Smoothing, auto-switch and rep/set timing all run on the recorded
+    timestamps, so results do not depend on machine speed and are identical across runs.
+    on_frame(ts_ms, exercise, angle), if given, is called after every frame.
+    profile is an optional calibration profile dict (see load_profile), classifier an
+    optional TemplateClassifier for auto-switch (see load_templates).
+    Returns the session summary dict (session_summary JSON shape plus frame count).
+    """
+    clock = ReplayClock()
+    smoother = make_smoother(profile)
+    manager = MultiExerciseManager(clock=clock, classifier=classifier)
+    if profile:
+        manager.apply_profile(profile)
+    state = FrameState()
+    session = None
+    n = 0
+    for ts, landmarks, vis in frames:
+        clock.set(ts)
+        if session is None:
+            session = new_session(mode, ts)
+        state.fill(ts, landmarks, vis)
+        smoother.smooth_state(state)
+        current, angle = track_frame(manager, session, state)
+        if on_frame:
+            on_frame(ts, current, angle)
+        n += 1
+    if session is None:
+        session = new_session(mode, 0)
+    session.end_time = clock.now_ms()
+    session.meta['frames'] = n
+    return session.snapshot()
+
+def replay_multi(frames, mode='replay', profile=None, classifier=None, max_tracks=MAX_TRACKS):
+    """
+    Headless multi-person replay. frames yields (ts_ms, people) with people a list of
+    (landmarks, vis) in pixel coords, one per detected person in any order.
+    Returns the session summary dict with per-track totals under 'tracks'.
+    """
+    clock = ReplayClock()
+    tracker = make_tracker(clock, profile, classifier, max_tracks)
+    session = None
+    n = 0
+    for ts, people in frames:
+        clock.set(ts)
+        if session is None:
+            session = new_session(mode, ts)
+        people = people[:max_tracks]
+        for state, (landmarks, vis) in zip(tracker.detections, people):
+            state.fill(ts, landmarks, vis)
+        tracker.update(ts, len(people))
+        track_athletes(tracker, session)
+        n += 1
+    if session is None:
+        session = new_session(mode, 0)
+    session.end_time = clock.now_ms()
+    session.meta['frames'] = n
+    session.meta['multi'] = tracker.stats()
+    return session.snapshot()
+
+def save_session(summary, prefix="session_summary"):
+    outp = Path(f"{prefix}_{int(time.time())}.json")
+    outp.write_text(json.dumps(summary, indent=2))
+    return outp
+
+def run_headless(path, profile=None, classifier=None, video=False, cache=None, clip=(None, None)):
+    """
+    Replay a recording, or with video=True a video file through the pose cache. clip is
+    (start_s, end_s) of a recording to replay.
+    """
+    t0 = time.perf_counter()
+    detector = None
+    if video:
+        detector = LazyPoseDetector()
+        frames, mode = video_landmarks(path, detector, pose_settings(), cache), 'video'
+    else:
+        frames, mode = read_landmarks(path, *clip), 'csv'
+    try:
+        session = replay_session(frames, mode=mode, profile=profile, classifier=classifier)
+    finally:
+        if detector:
+            detector.close()
+    elapsed = time.perf_counter() - t0
+    if detector:
+        print(f"[Video] {detector.calls} pose inferences")
+    if cache:
+        print(f"[PoseCache] {cache.stats()}")
+    recorded_s = (session['end_time'] - session['start_time']) / 1000.0
+    speed = recorded_s / elapsed if elapsed > 0 else float('inf')
+    print(f"[Replay] {session['frames']} frames in {elapsed:.2f}s ({speed:.0f}x real time)")
+    print(f"[Replay] reps={dict(session['reps'])} sets={dict(session['sets'])}")
+    outp = save_session(session, "session_summary_final")
+    print(f"[Saved] Final session summary -> {outp}")
+    return session
+
+# Frame sources: each yields (t_ms, frame_bgr, state), state being a FrameState in
+# pixel coords (state.detected False when no pose was found). A source may reuse the
+# state once the next frame is requested.
+def detect_landmarks(pose, frame, state, t_ms, metrics=NULL_METRICS):
+    """Run pose on a BGR frame and fill state; returns whether a pose was found."""
+    import cv2
+    h, w = frame.shape[:2]
+    with metrics.stage('pose_process'):
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        frame_rgb.flags.writeable = False
+        results = pose.process(frame_rgb)
+    if not results.pose_landmarks:
+        metrics.count('no_pose')
+        state.clear(t_ms)
+        return False
+    with metrics.stage('landmark_conversion'):
+        state.fill_landmarks(results.pose_landmarks.landmark, t_ms, w, h)
+    return True
+
+def pose_settings():
+    """POSE_SETTINGS plus the MediaPipe version, identifying cached video landmarks."""
+    # read from package metadata so that a pose-cache hit never imports MediaPipe
+    import importlib.metadata
+    try:
+        version = importlib.metadata.version('mediapipe')
+    except importlib.metadata.PackageNotFoundError:
+        version = 'unknown'
+    return dict(POSE_SETTINGS, model='mediapipe.pose', mediapipe=version)
+
+class LazyPoseDetector:
+    """detect(frame, state, t_ms) that builds its Pose on the first call, so pose-cache hits never load the model."""
+    def __init__(self, metrics=NULL_METRICS):
+        self.metrics = metrics
+        self.pose = None
+        self.calls = 0
+
+    def __call__(self, frame, state, t_ms):
+        if self.pose is None:
+            self.pose = load_mediapipe().Pose(**POSE_SETTINGS)
+        self.calls += 1
+        return detect_landmarks(self.pose, frame, state, t_ms, self.metrics)
+
+    def close(self):
+        if self.pose is not None:
+            self.pose.close()
+            self.pose = None
+
+def timed_read(cap, metrics=NULL_METRICS):
+    with metrics.stage('capture'):
+        return cap.read()
+
+def camera_frames(cap, detect, metrics=NULL_METRICS, state=None):
+    """detect(frame, state, t_ms) fills state, e.g. detect_landmarks bound to a Pose."""
+    if state is None:
+        state = FrameState()
+    while True:
+        ret, frame = timed_read(cap, metrics)
+        if not ret:
+            print("Camera read failed.")
+            return
+        tms = now_ms()
+        detect(frame, state, tms)
+        yield tms, frame, state
+
+def playback_frames(frames, clock):
+    # landmarks already pixel coords; the blank background is never drawn on
+    blank = np.zeros((FRAME_H, FRAME_W, 3), dtype=np.uint8)
+    state = FrameState()
+    for tms, landmarks, vis in frames:
+        clock.set(tms)
+        state.fill(tms, landmarks, vis)
+        yield tms, blank, state
+    print("[CSV] Playback finished.")
+
+def video_file_frames(frames, clock):
+    for tms, frame, state in frames:
+        clock.set(tms)
+        yield tms, frame, state
+    print("[Video] Playback finished.")
+
+def draw_metrics_hud(img, metrics):
+    import cv2
+    lines = [f"FPS {metrics.fps():.1f}"]
+    for name in ('pose_process', 'draw_overlay', 'frame_total'):
+        lines.append(f"{name} p95 {metrics.p95(name):.1f}ms")
+    x = img.shape[1] - 230
+    cv2.rectangle(img, (x - 8, 0), (img.shape[1], 18 * len(lines) + 10), (10,10,12), -1)
+    for i, line in enumerate(lines):
+        cv2.putText(img, line, (x, 20 + 18 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (220,240,230), 1, cv2.LINE_AA)
+
+def make_exporter(args, width, height, connections):
+    """Background overlay exporter for the selected --export_mode (writes under OVERLAY_DIR)."""
+    if args.export_mode == 'vector':
+        path = OVERLAY_DIR / f"skeleton_{int(time.time())}.jsonl"
+        print(f"[Export] Streaming skeleton geometry -> {path}")
+        return VectorOverlayExporter(path, width, height, connections)
+    return PngOverlayExporter(OVERLAY_DIR, workers=args.export_workers)
+
 # Main application
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--csv", type=str, help="Path to landmarks CSV for playback (optional)")
-    parser.add_argument("--export_overlay", action="store_true", help="Save RGBA overlay PNG frames to overlays/")
+    parser.add_argument("--csv", type=str, help="Path to landmarks recording (.ffla, .fflm or CSV) for playback (optional)")
+    parser.add_argument("--start", type=float, help="With --csv: start playback this many seconds into the recording")
+    parser.add_argument("--end", type=float, help="With --csv: stop playback this many seconds into the recording")
+    parser.add_argument("--record", type=str, help="Camera mode: record raw landmarks to a binary .fflm file (or a compressed .ffla archive)")
+    parser.add_argument("--export_overlay", action="store_true", help="Export overlay frames to overlays/")
+    parser.add_argument("--export_mode", choices=("png", "vector"), default="png",
+                        help="png: RGBA PNG per frame; vector: skeleton geometry stream (JSON Lines)")
+    parser.add_argument("--export_workers", type=int, default=2, help="Background writer threads for PNG export")
+    parser.add_argument("--pipeline", action="store_true", help="Camera mode: run capture and inference on separate threads, dropping stale frames")
+    parser.add_argument("--metrics_port", type=int, default=0, help="Serve runtime metrics as JSON on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--hud_metrics", action="store_true", help="Show FPS and stage latencies on the HUD")
+    parser.add_argument("--log_dir", type=str, default=str(DEFAULT_LOG_DIR), help="Directory for append-only session event logs")
+    parser.add_argument("--adaptive", action="store_true", help="Camera mode: ROI cropping, frame skipping and model autotuning")
+    parser.add_argument("--target_fps", type=float, default=ONE_EURO_FREQ, help="With --adaptive: frame rate to hold")
+    parser.add_argument("--profile", type=str, help="Calibration profile JSON from fitflex_calibrate.py")
+    parser.add_argument("--templates", type=str, help="Auto-switch template index from fitflex_classifier.py")
+    parser.add_argument("--video", type=str, help="Track a recorded video file instead of the camera")
+    parser.add_argument("--pose_cache", type=str, default=str(POSE_CACHE_DIR), help="With --video: pose landmark cache directory")
+    parser.add_argument("--cache_max_mb", type=float, default=POSE_CACHE_MAX_MB, help="With --video: evict least recently used cache entries above this size")
+    parser.add_argument("--no_cache", action="store_true", help="With --video: always run inference and leave the cache untouched")
+    parser.add_argument("--headless", action="store_true", help="With --csv or --video: replay as fast as possible without a window")
+    parser.add_argument("--no_prewarm", action="store_true", help="Camera mode: do not load MediaPipe in the background while the camera opens")
+    parser.add_argument("--multi", type=int, default=0, metavar="N", help="Camera mode: track up to N people, each with their own counts (needs --pose_model)")
+    parser.add_argument("--pose_model", type=str, help="With --multi: MediaPipe pose landmarker model bundle (.task)")
+    parser.add_argument("--serve", type=int, default=0, metavar="PORT", help="Stream landmarks and rep/set events to WebSocket clients on PORT")
+    parser.add_argument("--serve_host", type=str, default="127.0.0.1", help="With --serve: interface to listen on")
+    parser.add_argument("--store", type=str, default=str(DEFAULT_STORE), help="SQLite session store (history and daily totals)")
+    parser.add_argument("--no_store", action="store_true", help="Do not write the session to the store")
+    parser.add_argument("--user", type=str, default=DEFAULT_USER, help="Athlete the session is stored under")
     args = parser.parse_args()
 
-    mode = 'camera' if not args.csv else 'csv'
+    if args.csv and args.video:
+        parser.error("--csv and --video are mutually exclusive")
+    mode = 'video' if args.video else 'csv' if args.csv else 'camera'
+    if args.multi:
+        if mode != 'camera' or args.headless:
+            parser.error("--multi runs on the camera only")
+        if args.adaptive or args.pipeline or args.record:
+            parser.error("--multi cannot be combined with --adaptive, --pipeline or --record")
+        if not args.pose_model:
+            parser.error("--multi requires --pose_model")
+    if args.adaptive and args.pipeline:
+        # adaptive reads the smoother from the inference thread while the main loop updates it
+        parser.error("--adaptive cannot be combined with --pipeline")
+    if args.serve and args.headless:
+        parser.error("--serve streams a live loop; it cannot be combined with --headless")
+    if (args.start is not None or args.end is not None) and not args.csv:
+        parser.error("--start/--end select a clip of a --csv recording")
+    # start loading the model first; everything below overlaps with it
+    prewarm = mode == 'camera' and not args.headless and not args.no_prewarm and not args.multi
+    warmup = PoseWarmup() if prewarm else None
+    profile = load_profile(args.profile) if args.profile else None
+    classifier = load_templates(args.templates) if args.templates else None
+    cache = None
+    if args.video and not args.no_cache:
+        cache = PoseCache(args.pose_cache, int(args.cache_max_mb * 2**20))
+    if args.headless:
+        if not (args.csv or args.video):
+            parser.error("--headless requires --csv or --video")
+        run_headless(args.video or args.csv, profile, classifier, video=bool(args.video), cache=cache,
+                     clip=(args.start, args.end))
+        return
+
+    import cv2
     cap = None
     csv_gen = None
     if mode == 'camera':
+        clock = WALL_CLOCK
         cap = cv2.VideoCapture(0)
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_W)
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_H)
     else:
-        csv_gen = read_landmarks_csv(args.csv)
-
-    smoother = PoseSmoother(num_landmarks=33)
-    manager = MultiExerciseManager()
-    session = {
-        "start_time": now_ms(),
-        "events": [],
-        "reps": defaultdict(int),
-        "sets": defaultdict(int),
-        "mode": mode
-    }
-
-    prev_landmarks = None
+        # playback follows the recorded timestamps, not the render loop
+        clock = ReplayClock()
+        if mode == 'csv':
+            csv_gen = read_landmarks(args.csv, args.start, args.end)
+    recorder = None
+    if args.record and mode == 'camera':
+        fps = cap.get(cv2.CAP_PROP_FPS) or ONE_EURO_FREQ
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or FRAME_W
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or FRAME_H
+        recorder = open_recorder(args.record, fps, width, height)
+
+    smoother = make_smoother(profile)
+    manager = MultiExerciseManager(clock=clock, classifier=classifier)
+    if profile:
+        manager.apply_profile(profile)
+    compositor = OverlayCompositor()
+    metrics = Metrics()
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = MetricsServer(metrics, port=args.metrics_port).start()
+        print(f"[Metrics] Serving http://127.0.0.1:{metrics_server.port}/metrics")
+    session = None
+    store = stored = None
+    if not args.no_store:
+        store = SessionStore(args.store)
+
     frame_idx = 0
     overlay_export = args.export_overlay
+    exporter = None
 
-    with mp_pose.Pose(min_detection_confidence=0.6, min_tracking_confidence=0.6) as pose:
-        connections = list(mp_pose.POSE_CONNECTIONS)
+    # only single-person camera mode needs a Pose up front: playback never runs
+    # inference, video builds one on its first pose-cache miss and --multi uses the
+    # pose landmarker
+    if mode != 'camera' or args.multi:
+        pose_ctx = contextlib.nullcontext()
+    elif warmup:
+        pose_ctx = warmup.get()
+        print(f"[FitFlex] Pose model ready ({warmup.elapsed_s:.2f}s, loaded in background)")
+    else:
+        pose_ctx = load_mediapipe().Pose(**POSE_SETTINGS)
+    lazy_detector = None
+    with pose_ctx as pose:
+        connections = POSE_CONNECTIONS
         print("[FitFlex] Multi-exercise tracker started. Mode:", mode)
         print("Controls: c=calibrate r=reset s=save e=exercise toggle o=overlay q=quit")
-        while True:
-            if mode == 'camera':
-                ret, frame = cap.read()
-                if not ret:
-                    print("Camera read failed.")
-                    break
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frame_rgb.flags.writeable = False
-                results = pose.process(frame_rgb)
-                frame_rgb.flags.writeable = True
-                frame_bgr = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR)
-                h, w = frame_bgr.shape[:2]
-                if results.pose_landmarks:
-                    lm = results.pose_landmarks.landmark
-                    landmarks = []
-                    vis = []
-                    tms = now_ms()
-                    for i, l in enumerate(lm):
-                        x = l.x * w
-                        y = l.y * h
-                        z = l.z
-                        v = l.visibility if hasattr(l, 'visibility') else 1.0
-                        landmarks.append((x,y,z,v))
-                        vis.append(v)
-                    # smooth
-                    landmarks = smoother.smooth(landmarks, now_ms())
-                else:
-                    landmarks = [(0.0,0.0,0.0,0.0)] * 33
-                    vis = [0.0] * 33
+        pipeline = None
+        adaptive = None
+        tracker = None
+        detect = lambda frame, state, t_ms: detect_landmarks(pose, frame, state, t_ms, metrics)
+        if mode == 'video':
+            detect = lazy_detector = LazyPoseDetector(metrics)
+        if mode == 'camera' and args.adaptive:
+            adaptive = AdaptiveInference(
+                lambda c: load_mediapipe().Pose(**dict(POSE_SETTINGS, model_complexity=c)),
+                smoother, target_fps=args.target_fps, initial_pose=pose, metrics=metrics)
+            detect = adaptive.process
+        if mode == 'camera' and args.pipeline:
+            # states travel from the inference thread to this one; the pipeline returns
+            # them to the pool once rendered or dropped
+            pool = FramePool()
+            def infer(frame, t_ms):
+                state = pool.acquire()
+                detect(frame, state, t_ms)
+                return state
+            pipeline = FramePipeline(lambda: timed_read(cap, metrics), infer, release=pool.release).start()
+            source = pipeline.frames()
+        elif mode == 'camera' and args.multi:
+            detector = PoseLandmarkerDetector(args.pose_model, num_poses=args.multi)
+            tracker = make_tracker(clock, profile, classifier, args.multi, detector, metrics)
+            connections = tracker.connections
+            print(f"[Multi] Tracking up to {args.multi} people")
+            source = camera_frames(cap, tracker.detect, metrics, state=tracker.render_state)
+        elif mode == 'camera':
+            source = camera_frames(cap, detect, metrics)
+        elif mode == 'video':
+            source = video_file_frames(video_frames(args.video, detect, pose_settings(), cache), clock)
+        else:
+            source = playback_frames(csv_gen, clock)
+        server = None
+        if args.serve:
+            # asyncio is only loaded when streaming
+            from fitflex_stream import StreamServer
+            width, height = video_info(args.video)[1:] if mode == 'video' else (FRAME_W, FRAME_H)
+            server = StreamServer(args.serve_host, args.serve, exercises=list(manager.detectors),
+                                  connections=connections, num_landmarks=tracker.render_state.num if tracker else 33,
+                                  width=width, height=height).start()
+            print(f"[Stream] Serving ws://{args.serve_host}:{server.port}/")
+        for tms, frame_bgr, state in source:
+            if session is None:
+                session = SessionLog(mode, tms, log_dir=args.log_dir)
+                print(f"[Session] Event log -> {session.paths[0]}")
+                if server:
+                    session.listeners.append(server.publish_event)
+                if store:
+                    stored = store.open_session(mode, tms, user=args.user, log=log_key(session.paths[0]))
+                    session.listeners.append(stored.record)
+            if tracker:
+                # every athlete is already smoothed; state holds all skeletons
+                track_athletes(tracker, session, metrics)
+                current = None
             else:
-                try:
-                    ts, landmarks, vis = next(csv_gen)
-                except StopIteration:
-                    print("[CSV] Playback finished.")
-                    break
-                # landmarks already pixel coords
-                landmarks = smoother.smooth(landmarks, now_ms())
-                frame_bgr = np.zeros((FRAME_H, FRAME_W, 3), dtype=np.uint8)
-                h, w = FRAME_H, FRAME_W
-
-            # auto-switch exercise
-            current = manager.analyze_and_switch(landmarks, vis)
-
-            # compute primary angle for current exercise
-            L = mp_pose.PoseLandmark
-            def p(idx): return (landmarks[idx][0], landmarks[idx][1])
-            angle = 0.0
-            if current == 'bicep_curl':
-                # choose side with better visibility
-                left_vis = vis[L.LEFT_SHOULDER.value] + vis[L.LEFT_ELBOW.value] + vis[L.LEFT_WRIST.value]
-                right_vis = vis[L.RIGHT_SHOULDER.value] + vis[L.RIGHT_ELBOW.value] + vis[L.RIGHT_WRIST.value]
-                side = 'RIGHT' if right_vis > left_vis else 'LEFT'
-                s = getattr(L, f"{side}_SHOULDER").value
-                e = getattr(L, f"{side}_ELBOW").value
-                widx = getattr(L, f"{side}_WRIST").value
-                if vis[s] > 0.2 and vis[e] > 0.2 and vis[widx] > 0.2:
-                    angle = angle_deg(p(s), p(e), p(widx))
-            elif current == 'lat_pulldown':
-                # lat pulldown: track shoulder-elbow-wrist angle and wrist vertical displacement from overhead
-                left_vis = vis[L.LEFT_SHOULDER.value] + vis[L.LEFT_ELBOW.value] + vis[L.LEFT_WRIST.value]
-                right_vis = vis[L.RIGHT_SHOULDER.value] + vis[L.RIGHT_ELBOW.value] + vis[L.RIGHT_WRIST.value]
-                side = 'RIGHT' if right_vis > left_vis else 'LEFT'
-                s = getattr(L, f"{side}_SHOULDER").value
-                e = getattr(L, f"{side}_ELBOW").value
-                widx = getattr(L, f"{side}_WRIST").value
-                if vis[s] > 0.2 and vis[e] > 0.2 and vis[widx] > 0.2:
-                    angle = angle_deg(p(s), p(e), p(widx))
-                # for pulldown, also consider wrist y relative to shoulder y
-                # we'll incorporate this in ensemble heuristics inside manager.update_current if needed
-
-            # update detector for current exercise
-            rep_inc, set_inc = manager.update_current(angle)
-            if rep_inc:
-                session['reps'][current] += 1
-                session['events'].append({'type':'rep','exercise':current,'ts':now_ms(),'angle':angle})
-            if set_inc:
-                session['sets'][current] += 1
-                session['events'].append({'type':'set','exercise':current,'ts':now_ms(),'sets':manager.detectors[current].set_count})
+                if state.detected and not state.predicted:
+                    if recorder:
+                        recorder.write(tms, state.xyz, state.vis)
+                    # smooth in place
+                    with metrics.stage('smooth'):
+                        smoother.smooth_state(state)
+                # auto-switch exercise and update detector for current exercise
+                current, angle = track_frame(manager, session, state, metrics)
+
+            if server:
+                server.publish_frame(state, current)
 
             # draw overlay and composite
-            out_img, overlay_rgba = draw_overlay_rgba(frame_bgr, landmarks, vis, connections)
+            with metrics.stage('draw_overlay'):
+                out_img, overlay_rgba = compositor.draw(frame_bgr, state, connections)
 
             # HUD
-            cv2.rectangle(out_img, (0,0), (360,96), (10,10,12), -1)
-            cv2.putText(out_img, f"Exercise: {current}", (12,22), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (220,240,230), 1, cv2.LINE_AA)
-            cv2.putText(out_img, f"Reps ({current}): {session['reps'][current]}", (12,48), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (46,230,166), 2, cv2.LINE_AA)
-            cv2.putText(out_img, f"Sets ({current}): {session['sets'][current]}", (12,76), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (220,240,230), 1, cv2.LINE_AA)
+            if tracker:
+                cv2.rectangle(out_img, (0,0), (360,34), (10,10,12), -1)
+                cv2.putText(out_img, f"Athletes: {len(tracker.seen)} in view, {len(tracker.live)} tracked", (12,22), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (220,240,230), 1, cv2.LINE_AA)
+                draw_track_labels(out_img, tracker.seen, session)
+            else:
+                cv2.rectangle(out_img, (0,0), (360,96), (10,10,12), -1)
+                conf = f" ({manager.auto.confidence:.0%})" if manager.auto.prediction == current else ""
+                cv2.putText(out_img, f"Exercise: {current}{conf}", (12,22), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (220,240,230), 1, cv2.LINE_AA)
+                cv2.putText(out_img, f"Reps ({current}): {session.reps[current]}", (12,48), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (46,230,166), 2, cv2.LINE_AA)
+                cv2.putText(out_img, f"Sets ({current}): {session.sets[current]}", (12,76), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (220,240,230), 1, cv2.LINE_AA)
             cv2.putText(out_img, "Keys: c=calib r=reset s=save e=exercise o=overlay q=quit", (12, out_img.shape[0]-12), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (160,160,160), 1, cv2.LINE_AA)
+            if args.hud_metrics:
+                draw_metrics_hud(out_img, metrics)
 
-            cv2.imshow("FitFlex Multi-Exercise Tracker (Overlay)", out_img)
-
-            # optionally save overlay RGBA as PNG for web embedding
+            # optionally export overlay (PNG or skeleton geometry) for web embedding
             if overlay_export:
-                # overlay_rgba is uint8 RGBA; save as PNG with alpha
-                overlay_path = OVERLAY_DIR / f"overlay_{frame_idx:06d}.png"
-                # convert RGBA to BGRA for OpenCV saving
-                bgra = cv2.cvtColor(overlay_rgba, cv2.COLOR_RGBA2BGRA)
-                cv2.imwrite(str(overlay_path), bgra)
+                with metrics.stage('export'):
+                    if exporter is None:
+                        exporter = make_exporter(args, out_img.shape[1], out_img.shape[0], connections)
+                    if not exporter.export(frame_idx, state, overlay_rgba):
+                        metrics.count('export_dropped')
                 frame_idx += 1
 
-            key = cv2.waitKey(1) & 0xFF
+            with metrics.stage('display'):
+                cv2.imshow("FitFlex Multi-Exercise Tracker (Overlay)", out_img)
+                key = cv2.waitKey(1) & 0xFF
+            metrics.frame()
+            if mode == 'camera':
+                # capture timestamp to frame on screen
+                metrics.observe('frame_total', now_ms() - tms)
+            if pipeline:
+                for k, v in pipeline.stats().items():
+                    metrics.set_counter(f"pipeline_{k}", v)
+            # keys act on every tracked athlete in --multi mode
+            managers = [t.manager for t in tracker.live] if tracker else [manager]
             if key == ord('q'):
                 break
             elif key == ord('r'):
-                manager.reset_all()
-                for k in session['reps']: session['reps'][k] = 0
-                for k in session['sets']: session['sets'][k] = 0
-                session['events'].append({'type':'reset','ts':now_ms()})
+                for m in managers:
+                    m.reset_all()
+                session.record({'type':'reset','ts':clock.now_ms()})
                 print("[Action] Reset all counts.")
             elif key == ord('c'):
-                print("[Action] Starting calibration for both exercises.")
-                manager.start_calibration()
+                print("[Action] Starting calibration for all exercises.")
+                for m in managers:
+                    m.start_calibration()
             elif key == ord('s'):
-                session['end_time'] = now_ms()
-                outp = Path(f"session_summary_{int(time.time())}.json")
-                outp.write_text(json.dumps(session, indent=2))
+                session.end_time = clock.now_ms()
+                session.meta['metrics'] = metrics.snapshot()
+                outp = save_session(session.snapshot())
                 print(f"[Saved] Session summary -> {outp}")
             elif key == ord('e'):
-                # toggle explicit exercise selection: auto -> bicep_curl -> lat_pulldown -> auto
-                if manager.current == 'bicep_curl' and manager.current != 'lat_pulldown':
-                    manager.current = 'lat_pulldown'
-                elif manager.current == 'lat_pulldown':
-                    manager.current = 'bicep_curl'
-                print(f"[Action] Exercise forced to: {manager.current}")
+                # cycle through the registered exercises
+                for m in managers:
+                    m.cycle()
+                    print(f"[Action] Exercise forced to: {m.current}")
             elif key == ord('o'):
                 overlay_export = not overlay_export
                 print(f"[Action] Overlay export {'enabled' if overlay_export else 'disabled'}.")
 
     # cleanup
+    if session is None:
+        session = SessionLog(mode, clock.now_ms(), log_dir=args.log_dir)
+    if pipeline:
+        pipeline.stop()
+        if pipeline.capture_failed:
+            print("Camera read failed.")
+        print(f"[Pipeline] {pipeline.stats()}")
+    if adaptive:
+        adaptive.close()
+        session.meta['adaptive'] = adaptive.stats()
+        print(f"[Adaptive] {session.meta['adaptive']}")
+    if exporter:
+        exporter.close()
+        session.meta['export'] = exporter.stats()
+        print(f"[Export] {session.meta['export']}")
+    if lazy_detector:
+        lazy_detector.close()
+    if tracker:
+        tracker.close()
+        session.meta['multi'] = tracker.stats()
+        print(f"[Multi] {session.meta['multi']}")
+    if server:
+        server.stop()
+        session.meta['stream'] = server.stats()
+        print(f"[Stream] {session.meta['stream']}")
+    if cache:
+        session.meta['pose_cache'] = cache.stats()
+        print(f"[PoseCache] {session.meta['pose_cache']}")
+    if metrics_server:
+        metrics_server.stop()
     if cap:
         cap.release()
+    if recorder:
+        recorder.close()
+        print(f"[Saved] Landmark recording -> {args.record} ({recorder.count} frames)")
     cv2.destroyAllWindows()
     # final save
-    session['end_time'] = now_ms()
-    outp = Path(f"session_summary_final_{int(time.time())}.json")
-    outp.write_text(json.dumps(session, indent=2))
+    session.meta['metrics'] = metrics.snapshot()
+    session.close(clock.now_ms())
+    outp = save_session(session.snapshot(), "session_summary_final")
     print(f"[Saved] Final session summary -> {outp}")
+    if store:
+        if stored:
+            stored.close(session.end_time, dict(session.meta, event_log=session.paths))
+            print(f"[Store] Session {stored.id} -> {args.store}")
+        store.close()
 
 if __name__ == "__main__":
     main()
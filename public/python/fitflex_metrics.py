@@ -0,0 +1,206 @@
+"""
+FitFlex runtime metrics
+
+Per-stage latency histograms over a rolling window (p50/p95/p99), throughput and
+counters, plus an optional local HTTP endpoint serving them as JSON.
+
+    metrics = Metrics()
+    with metrics.stage("pose_process"):
+        results = pose.process(frame)
+    metrics.count("no_pose")
+    metrics.snapshot()
+"""
+import json
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_WINDOW = 600  # samples per stage (~20 s at 30 fps)
+
+
+class RollingHistogram:
+    """Ring buffer of the last `window` latency samples (ms)."""
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.samples = np.zeros(window, dtype=np.float64)
+        self.idx = 0
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        self.samples[self.idx] = ms
+        self.idx = (self.idx + 1) % len(self.samples)
+        self.total += 1
+        self.sum_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = float(ms)
+
+    def summary(self):
+        n = min(self.total, len(self.samples))
+        if n == 0:
+            return {"count": 0}
+        p50, p95, p99 = np.percentile(self.samples[:n], (50, 95, 99))
+        return {
+            "count": self.total,
+            "mean_ms": round(self.sum_ms / self.total, 3),
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "name", "t0")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.t0 = 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, (time.perf_counter() - self.t0) * 1000.0)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Thread-safe stage timings and counters. Each stage timer object is reused, so a
+    given stage name should be timed from one thread at a time.
+    With enabled=False every call is a no-op.
+    """
+    def __init__(self, window=DEFAULT_WINDOW, enabled=True):
+        self.window = window
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.hists = {}
+        self.timers = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+        self.frame_times = np.zeros(window, dtype=np.float64)
+        self.frame_idx = 0
+        self.frames = 0
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = _StageTimer(self, name)
+        return timer
+
+    def observe(self, name, ms):
+        if not self.enabled:
+            return
+        with self.lock:
+            hist = self.hists.get(name)
+            if hist is None:
+                hist = self.hists[name] = RollingHistogram(self.window)
+            hist.add(ms)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_counter(self, name, value):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = value
+
+    def frame(self):
+        """Mark one displayed frame (drives the FPS figure)."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.frame_times[self.frame_idx % self.window] = time.perf_counter()
+            self.frame_idx += 1
+            self.frames += 1
+
+    def fps(self):
+        with self.lock:
+            n = min(self.frame_idx, self.window)
+            if n < 2:
+                return 0.0
+            newest = self.frame_times[(self.frame_idx - 1) % self.window]
+            oldest = self.frame_times[self.frame_idx % self.window] if self.frame_idx > self.window else self.frame_times[0]
+        span = newest - oldest
+        return (n - 1) / span if span > 0 else 0.0
+
+    def p95(self, name):
+        with self.lock:
+            hist = self.hists.get(name)
+            if hist is None:
+                return 0.0
+            return hist.summary().get("p95_ms", 0.0)
+
+    def snapshot(self):
+        fps = self.fps()
+        with self.lock:
+            uptime = time.perf_counter() - self.started
+            return {
+                "uptime_s": round(uptime, 3),
+                "frames": self.frames,
+                "fps": round(fps, 2),
+                "avg_fps": round(self.frames / uptime, 2) if uptime > 0 else 0.0,
+                "stages": {name: h.summary() for name, h in self.hists.items()},
+                "counters": dict(self.counters),
+            }
+
+
+class MetricsServer:
+    """Serves Metrics.snapshot() as JSON on GET /metrics (localhost only by default)."""
+    def __init__(self, metrics, port=9108, host="127.0.0.1"):
+        # http.server is only imported when an endpoint is requested
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        snapshot = metrics.snapshot
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = json.dumps(snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fitflex-metrics", daemon=True)
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,287 @@
+"""
+FitFlex multi-person tracking
+
+Tracks up to MAX_TRACKS athletes in front of one station, each with their own rep
+counts, auto-switch and smoothing:
+
+  detect     - PoseLandmarkerDetector runs MediaPipe's Tasks pose landmarker for several
+               poses per frame (mp.solutions.pose only ever finds one person)
+  associate  - detections are matched greedily to live tracks by the mean distance of the
+               landmarks both can see, measured against each track's extrapolated
+               position and relative to its skeleton size; an unmatched detection starts
+               a new track
+  state      - each track takes a MultiExerciseManager and a smoother slot from a bounded
+               TrackPool; a track unseen for idle_ms is evicted and its state cleared and
+               returned to the pool, so memory stays fixed however many people walk past
+  batch      - smoothing and joint angles run once per frame for everyone (one
+               (people, 33, 3) array pass each), and all skeletons are drawn in a single
+               compositor pass through one combined FrameState
+
+Track IDs increase monotonically and are not reused within a session; session events
+carry them in a 'track' field.
+"""
+import numpy as np
+
+from fitflex_exercises import POSE_CONNECTIONS, AngleKernel
+from fitflex_frame import FrameState, VIS_THRESHOLD
+from fitflex_metrics import Metrics
+
+MAX_TRACKS = 4
+TRACK_IDLE_MS = 2000
+# a detection joins a track when the mean landmark distance is below this fraction of the track's size
+MATCH_MAX_COST = 0.35
+# landmarks both must see for a match to be considered
+MATCH_MIN_SHARED = 4
+MIN_TRACK_PX = 40.0
+
+
+class AthleteTrack:
+    """One athlete's pooled state. slot indexes the shared smoother and the combined overlay state."""
+    __slots__ = ('slot', 'id', 'manager', 'state', 'angles', 'first_seen', 'last_seen', 'frames')
+
+    def __init__(self, slot, manager, num_landmarks=33):
+        self.slot = slot
+        self.id = None
+        self.manager = manager
+        self.state = FrameState(num_landmarks)
+        self.angles = None
+        self.first_seen = 0
+        self.last_seen = 0
+        self.frames = 0
+
+    def size(self):
+        """Bounding-box diagonal (px) of the landmarks seen last frame."""
+        xy = self.state.xy[self.state.valid]
+        if len(xy) < 2:
+            return MIN_TRACK_PX
+        return max(MIN_TRACK_PX, float(np.hypot(*(xy.max(axis=0) - xy.min(axis=0)))))
+
+
+class TrackPool:
+    """
+    At most max_tracks AthleteTracks. acquire() hands out a free one (its manager cleared)
+    or None when all are live; managers are built on first use of a slot and reused.
+    """
+    def __init__(self, max_tracks, make_manager, num_landmarks=33):
+        self.make_manager = make_manager
+        self.num = num_landmarks
+        self.tracks = [None] * max_tracks
+        self.free = list(range(max_tracks - 1, -1, -1))     # lowest slot first
+
+    def acquire(self, track_id, t_ms):
+        if not self.free:
+            return None
+        slot = self.free.pop()
+        track = self.tracks[slot]
+        if track is None:
+            track = self.tracks[slot] = AthleteTrack(slot, self.make_manager(), self.num)
+        else:
+            track.manager.clear()
+        track.id = track_id
+        track.first_seen = track.last_seen = t_ms
+        track.frames = 0
+        track.state.clear(t_ms)
+        return track
+
+    def release(self, track):
+        self.free.append(track.slot)
+
+    def built(self):
+        return sum(t is not None for t in self.tracks)
+
+
+class MultiPersonTracker:
+    """
+    make_manager() builds a MultiExerciseManager for one athlete; smoother is a
+    TrackSmoother with at least max_tracks slots. detector(frame, states, t_ms), if given,
+    fills the first n of `states` and returns n (see PoseLandmarkerDetector).
+
+    update(t_ms, n) runs on the first n entries of self.detections and returns the
+    tracks seen this frame (also in self.seen), each with its smoothed state and
+    primary angles; render_state holds every seen skeleton for one compositor pass with
+    self.connections.
+    """
+    def __init__(self, make_manager, smoother, max_tracks=MAX_TRACKS, idle_ms=TRACK_IDLE_MS,
+                 max_cost=MATCH_MAX_COST, detector=None, kernel=None, num_landmarks=33,
+                 connections=POSE_CONNECTIONS, metrics=None):
+        if smoother.slots < max_tracks:
+            raise ValueError(f"smoother has {smoother.slots} slots, need {max_tracks}")
+        self.pool = TrackPool(max_tracks, make_manager, num_landmarks)
+        self.smoother = smoother
+        self.max_tracks = max_tracks
+        self.idle_ms = idle_ms
+        self.max_cost = max_cost
+        self.detector = detector
+        # must cover the managers' exercises in the same order (the default registry)
+        self.kernel = kernel or AngleKernel()
+        self.num = n = num_landmarks
+        self.metrics = metrics or Metrics(enabled=False)
+        self.detections = [FrameState(n) for _ in range(max_tracks)]
+        self.live = []
+        self.seen = []
+        self.ended = []
+        self.next_id = 1
+        # every slot's skeleton in one state; slot k owns landmarks [k*n, (k+1)*n)
+        self.render_state = FrameState(n * max_tracks)
+        self._render_xyz = self.render_state.xyz.reshape(max_tracks, n, 3)
+        self._render_vis = self.render_state.vis.reshape(max_tracks, n)
+        self.connections = tuple((a + k * n, b + k * n) for k in range(max_tracks) for a, b in connections)
+        self.counts = {'started': 0, 'ended': 0, 'rejected': 0, 'matched': 0}
+
+    def detect(self, frame, state, t_ms):
+        """detect(frame, state, t_ms) for camera_frames, with state = self.render_state."""
+        with self.metrics.stage('pose_process'):
+            n = self.detector(frame, self.detections, t_ms)
+        with self.metrics.stage('multi_track'):
+            self.update(t_ms, n)
+        if not n:
+            self.metrics.count('no_pose')
+        return bool(self.seen)
+
+    def update(self, t_ms, n):
+        self._evict(t_ms)
+        dets = self.detections[:n]
+        pairs = self._associate(dets, t_ms)
+        matched = {i for i, _ in pairs}
+        for i in range(n):
+            if i in matched:
+                continue
+            track = self.pool.acquire(self.next_id, t_ms)
+            if track is None:
+                self.counts['rejected'] += 1
+                continue
+            self.next_id += 1
+            self.smoother.reset_slot(track.slot)
+            self.live.append(track)
+            self.counts['started'] += 1
+            pairs.append((i, track))
+        pairs.sort(key=lambda p: p[1].id)
+        self.seen = [track for _, track in pairs]
+        self._smooth(dets, pairs, t_ms)
+        return self.seen
+
+    def _evict(self, t_ms):
+        self.ended = [t for t in self.live if t_ms - t.last_seen > self.idle_ms]
+        if self.ended:
+            for track in self.ended:
+                self.pool.release(track)
+                self.counts['ended'] += 1
+            self.live = [t for t in self.live if t_ms - t.last_seen <= self.idle_ms]
+
+    def _associate(self, dets, t_ms):
+        """Greedy lowest-cost matching of detections to live tracks; returns [(det index, track)]."""
+        if not dets or not self.live:
+            return []
+        slots = [t.slot for t in self.live]
+        pred = self.smoother.predict(t_ms)[slots, :, :2]                    # (K, n, 2)
+        track_ok = np.array([t.state.valid for t in self.live])            # (K, n)
+        det_xy = np.array([d.xy for d in dets])                             # (m, n, 2)
+        det_ok = np.array([d.valid for d in dets])                          # (m, n)
+        shared = det_ok[:, None, :] & track_ok[None, :, :]                 # (m, K, n)
+        dist = np.sqrt(((det_xy[:, None] - pred[None]) ** 2).sum(axis=-1))
+        count = shared.sum(axis=-1)
+        sizes = np.array([t.size() for t in self.live])
+        cost = (dist * shared).sum(axis=-1) / np.maximum(count, 1) / sizes[None, :]
+        cost[count < MATCH_MIN_SHARED] = np.inf
+        pairs = []
+        used_det, used_track = set(), set()
+        for flat in np.argsort(cost, axis=None):
+            i, j = divmod(int(flat), len(self.live))
+            if not cost[i, j] < self.max_cost:
+                break
+            if i in used_det or j in used_track:
+                continue
+            used_det.add(i)
+            used_track.add(j)
+            pairs.append((i, self.live[j]))
+        return pairs
+
+    def _smooth(self, dets, pairs, t_ms):
+        """Smooth and measure every seen track in one batch and rebuild render_state."""
+        rs = self.render_state
+        rs.t_ms = t_ms
+        self._render_vis.fill(0.0)
+        if not pairs:
+            rs.detected = False
+            rs.valid.fill(False)
+            return
+        slots = np.array([track.slot for _, track in pairs])
+        xyz = np.array([dets[i].xyz for i, _ in pairs])
+        vis = np.array([dets[i].vis for i, _ in pairs])
+        xyz = self.smoother.smooth_tracks(slots, xyz, t_ms)
+        angles = self.kernel.angles(xyz[..., :2], vis)
+        for k, (_, track) in enumerate(pairs):
+            track.state.fill(t_ms, xyz[k], vis[k])
+            track.angles = angles[k]
+            track.last_seen = t_ms
+            track.frames += 1
+        self.counts['matched'] += len(pairs)
+        self._render_xyz[slots] = xyz
+        self._render_vis[slots] = vis
+        np.greater_equal(rs.vis, VIS_THRESHOLD, out=rs.valid)
+        rs.detected = True
+
+    def stats(self):
+        return dict(self.counts, live=len(self.live), pooled=self.pool.built())
+
+    def close(self):
+        if self.detector is not None:
+            self.detector.close()
+
+
+class PoseLandmarkerDetector:
+    """
+    Several poses per frame from MediaPipe's Tasks PoseLandmarker in VIDEO mode.
+    model_path is a pose landmarker bundle (.task, e.g. pose_landmarker_full.task from the
+    MediaPipe models page). Call as detector(frame_bgr, states, t_ms) -> poses found.
+    """
+    def __init__(self, model_path, num_poses=MAX_TRACKS, min_confidence=0.5):
+        import mediapipe as mp
+        from mediapipe.tasks.python import BaseOptions, vision
+        options = vision.PoseLandmarkerOptions(
+            base_options=BaseOptions(model_asset_path=str(model_path)),
+            running_mode=vision.RunningMode.VIDEO,
+            num_poses=num_poses,
+            min_pose_detection_confidence=min_confidence,
+            min_pose_presence_confidence=min_confidence,
+            min_tracking_confidence=min_confidence)
+        self.mp = mp
+        self.landmarker = vision.PoseLandmarker.create_from_options(options)
+        self.last_ts = -1
+        self.calls = 0
+
+    def __call__(self, frame, states, t_ms):
+        import cv2
+        h, w = frame.shape[:2]
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        image = self.mp.Image(image_format=self.mp.ImageFormat.SRGB, data=rgb)
+        # VIDEO mode rejects timestamps that do not increase
+        ts = max(int(t_ms), self.last_ts + 1)
+        self.last_ts = ts
+        self.calls += 1
+        result = self.landmarker.detect_for_video(image, ts)
+        n = min(len(result.pose_landmarks), len(states))
+        for i in range(n):
+            states[i].fill_landmarks(result.pose_landmarks[i], t_ms, w, h)
+        return n
+
+    def close(self):
+        self.landmarker.close()
+
+
+def draw_track_labels(img, tracks, session):
+    """Label each seen athlete above their skeleton: track id, exercise and reps."""
+    import cv2
+    for track in tracks:
+        xy = track.state.xy[track.state.valid]
+        if not len(xy):
+            continue
+        x, y = int(xy[:, 0].min()), int(xy[:, 1].min()) - 12
+        exercise = track.manager.current
+        reps = session.tracks.get(str(track.id), {}).get('reps', {}).get(exercise, 0)
+        text = f"#{track.id} {exercise}: {reps}"
+        (tw, th), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.55, 1)
+        x = min(max(x, 0), img.shape[1] - tw - 8)
+        y = max(y, th + 8)
+        cv2.rectangle(img, (x, y - th - 6), (x + tw + 8, y + 4), (10,10,12), -1)
+        cv2.putText(img, text, (x + 4, y), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (46,230,166), 1, cv2.LINE_AA)
@@ -0,0 +1,139 @@
+"""
+FitFlex pipelined runtime
+
+Capture and inference run on their own threads, connected to the render loop by
+bounded latest-frame-wins queues:
+
+  capture thread --[LatestQueue]--> inference thread --[LatestQueue]--> render (main thread)
+
+When a downstream stage falls behind, the oldest queued item is dropped instead of
+blocking the producer, so the camera is always drained and the HUD shows the freshest
+result. Drop counters are kept per queue.
+"""
+import threading
+import time
+from collections import deque
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class LatestQueue:
+    """
+    Bounded queue that drops the oldest item when full (latest frame wins).
+    on_drop(item), if given, is called for every dropped item.
+    """
+    def __init__(self, maxsize=1, on_drop=None):
+        self.items = deque()
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self.cond = threading.Condition()
+        self.closed = False
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item):
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                old = self.items.popleft()
+                self.dropped += 1
+                if self.on_drop:
+                    self.on_drop(old)
+            self.items.append(item)
+            self.put_count += 1
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        """Next item, or None once the queue is closed and drained (or on timeout)."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.items or self.closed, timeout):
+                return None
+            if self.items:
+                return self.items.popleft()
+            return None
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class FramePipeline:
+    """
+    Runs read_frame() on a capture thread and infer(frame, t_ms) on an inference thread.
+    read_frame follows the cv2.VideoCapture.read() contract and returns (ok, frame);
+    frames() yields (t_ms, frame, result) to the caller's thread. release(result), if
+    given, is called for results dropped before render and for each rendered result
+    once the caller asks for the next frame, so results can be pooled buffers.
+    """
+    def __init__(self, read_frame, infer, maxsize=1, release=None):
+        self.read_frame = read_frame
+        self.infer = infer
+        self.release = release
+        self.captured = LatestQueue(maxsize)
+        self.inferred = LatestQueue(maxsize, on_drop=(lambda item: release(item[2])) if release else None)
+        self.stop_event = threading.Event()
+        self.capture_failed = False
+        self.rendered = 0
+        self.threads = [
+            threading.Thread(target=self._capture_loop, name="fitflex-capture", daemon=True),
+            threading.Thread(target=self._inference_loop, name="fitflex-inference", daemon=True),
+        ]
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+        return self
+
+    def _capture_loop(self):
+        try:
+            while not self.stop_event.is_set():
+                ok, frame = self.read_frame()
+                if not ok:
+                    self.capture_failed = True
+                    break
+                self.captured.put((now_ms(), frame))
+        finally:
+            self.captured.close()
+
+    def _inference_loop(self):
+        try:
+            while not self.stop_event.is_set():
+                item = self.captured.get(timeout=0.5)
+                if item is None:
+                    if self.captured.closed:
+                        break
+                    continue
+                t_ms, frame = item
+                self.inferred.put((t_ms, frame, self.infer(frame, t_ms)))
+        finally:
+            self.inferred.close()
+
+    def frames(self):
+        while not self.stop_event.is_set():
+            item = self.inferred.get(timeout=0.5)
+            if item is None:
+                if self.inferred.closed:
+                    break
+                continue
+            self.rendered += 1
+            yield item
+            if self.release:
+                self.release(item[2])
+
+    def stop(self):
+        self.stop_event.set()
+        self.captured.close()
+        self.inferred.close()
+        for t in self.threads:
+            t.join(timeout=2.0)
+
+    def stats(self):
+        return {
+            "captured": self.captured.put_count,
+            "inferred": self.inferred.put_count,
+            "rendered": self.rendered,
+            "dropped_before_inference": self.captured.dropped,
+            "dropped_before_render": self.inferred.dropped,
+        }
@@ -0,0 +1,158 @@
+"""
+FitFlex binary landmark recordings (.fflm)
+
+Fixed-size header followed by fixed-dtype frame records:
+  header: magic, version, header size, fps, width, height, landmark count, frame count
+  record: ts (int64 ms), xyz (float32 [n, 3], pixel x/y + MediaPipe z), vis (float32 [n])
+
+Frames are written through a buffered writer that keeps the file open and read back
+zero-copy with np.memmap; ts/xyz/vis are exposed as column views of the mapping.
+"""
+import struct
+import numpy as np
+
+MAGIC = b"FFLMREC1"
+VERSION = 1
+# magic, version, header_size, fps, width, height, num_landmarks, frame_count
+HEADER_FMT = "<8sHHfHHHxxQ"
+HEADER_SIZE = 64
+FRAME_COUNT_OFFSET = struct.calcsize("<8sHHfHHHxx")
+RECORDING_EXT = ".fflm"
+
+
+def frame_dtype(num_landmarks=33):
+    return np.dtype([
+        ("ts", "<i8"),
+        ("xyz", "<f4", (num_landmarks, 3)),
+        ("vis", "<f4", (num_landmarks,)),
+    ])
+
+
+def is_recording(path):
+    """True if path starts with the binary recording magic."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class LandmarkWriter:
+    """
+    Buffered writer for .fflm recordings. Frames are staged in a preallocated record
+    array and written in blocks; the frame count in the header is patched on close.
+    """
+    def __init__(self, path, fps=30.0, width=640, height=480, num_landmarks=33, buffer_frames=256):
+        self.path = str(path)
+        self.num = num_landmarks
+        self.dtype = frame_dtype(num_landmarks)
+        self.buf = np.zeros(buffer_frames, dtype=self.dtype)
+        self.pending = 0
+        self.count = 0
+        self.f = open(self.path, "wb")
+        header = struct.pack(HEADER_FMT, MAGIC, VERSION, HEADER_SIZE, float(fps),
+                             int(width), int(height), num_landmarks, 0)
+        self.f.write(header.ljust(HEADER_SIZE, b"\0"))
+
+    def write(self, ts, landmarks, vis=None):
+        """
+        Append one frame. landmarks is a list of (x, y, z, v) tuples or an (n, 3)/(n, 4)
+        array; vis overrides the per-landmark visibility when given.
+        """
+        rec = self.buf[self.pending]
+        arr = np.asarray(landmarks, dtype=np.float32)
+        rec["ts"] = ts
+        rec["xyz"] = arr[:, :3]
+        if vis is not None:
+            rec["vis"] = vis
+        elif arr.shape[1] > 3:
+            rec["vis"] = arr[:, 3]
+        else:
+            rec["vis"] = 1.0
+        self.pending += 1
+        if self.pending == len(self.buf):
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.f.write(self.buf[:self.pending].tobytes())
+            self.count += self.pending
+            self.pending = 0
+        self.f.flush()
+
+    def close(self):
+        if self.f.closed:
+            return
+        self.flush()
+        self.f.seek(FRAME_COUNT_OFFSET)
+        self.f.write(struct.pack("<Q", self.count))
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LandmarkRecording:
+    """
+    Read-only view of an .fflm recording. ts, xyz and vis are memmap-backed arrays of
+    shape (frames,), (frames, n, 3) and (frames, n); nothing is parsed or copied up front.
+    """
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, "rb") as f:
+            raw = f.read(HEADER_SIZE)
+            f.seek(0, 2)
+            size = f.tell()
+        if len(raw) < HEADER_SIZE or raw[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path}: not a FitFlex landmark recording")
+        (_, version, header_size, fps, width, height,
+         num, count) = struct.unpack(HEADER_FMT, raw[:struct.calcsize(HEADER_FMT)])
+        if version != VERSION:
+            raise ValueError(f"{self.path}: unsupported recording version {version}")
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self.num_landmarks = num
+        self.dtype = frame_dtype(num)
+        # a writer that did not close cleanly leaves count=0; recover from file size
+        available = (size - header_size) // self.dtype.itemsize
+        self.count = min(count, available) if count else available
+        if self.count:
+            self.frames = np.memmap(self.path, dtype=self.dtype, mode="r",
+                                    offset=header_size, shape=(self.count,))
+        else:
+            self.frames = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def ts(self):
+        return self.frames["ts"]
+
+    @property
+    def xyz(self):
+        return self.frames["xyz"]
+
+    @property
+    def vis(self):
+        return self.frames["vis"]
+
+    def iter_frames(self, start_ms=None, end_ms=None):
+        """
+        Yield (ts, landmarks, vis) in the same shape as read_landmarks_csv, optionally
+        only for frames with start_ms <= ts < end_ms.
+        """
+        frames = self.frames
+        if start_ms is not None or end_ms is not None:
+            lo = 0 if start_ms is None else int(np.searchsorted(self.ts, start_ms))
+            hi = self.count if end_ms is None else int(np.searchsorted(self.ts, end_ms))
+            frames = frames[lo:hi]
+        for rec in frames:
+            xyz = rec["xyz"].tolist()
+            vis = rec["vis"].tolist()
+            landmarks = [(x, y, z, v) for (x, y, z), v in zip(xyz, vis)]
+            yield int(rec["ts"]), landmarks, vis
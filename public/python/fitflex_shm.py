@@ -0,0 +1,138 @@
+"""
+FitFlex shared-memory frame ring
+
+Moves BGR frames from a capture/decode process to a worker process without pickling:
+one SharedMemory block per stream holds a small control header, a sequence number and
+timestamp per slot, and `slots` fixed-size frames.
+
+  header   int64[8]        write_seq, read_seq, closed, dropped
+  slot_seq int64[slots]    sequence number held by each slot (-1 while being written)
+  slot_ts  int64[slots]    capture timestamp (ms) of each slot
+  frames   uint8[slots, h, w, 3]
+
+There is exactly one writer and one reader. put() never blocks a live camera: old
+frames are overwritten and the reader counts what it missed. With block=True (video
+files) the writer waits for a free slot instead, so nothing is lost. The reader checks
+a slot's sequence number again after copying it out, so a frame overwritten while it
+was being read is dropped rather than used torn. Counters are aligned 8-byte stores.
+
+    ring = ShmFrameRing.create((480, 640, 3))         # owner (supervisor)
+    peer = ShmFrameRing.attach(ring.spec())            # in the worker process
+"""
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+RING_SLOTS = 4
+POLL_S = 0.001
+
+# header fields
+_WRITE, _READ, _CLOSED, _DROPPED = range(4)
+_HEADER = 8
+
+
+class ShmFrameRing:
+    def __init__(self, shm, slots, shape, owner):
+        self.shm = shm
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.owner = owner
+        buf = shm.buf
+        self.ctrl = np.ndarray((_HEADER,), dtype=np.int64, buffer=buf, offset=0)
+        self.slot_seq = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=_HEADER * 8)
+        self.slot_ts = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=(_HEADER + slots) * 8)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=buf,
+                                 offset=(_HEADER + 2 * slots) * 8)
+
+    @staticmethod
+    def nbytes(shape, slots=RING_SLOTS):
+        return (_HEADER + 2 * slots) * 8 + slots * int(np.prod(shape))
+
+    @classmethod
+    def create(cls, shape, slots=RING_SLOTS):
+        shm = shared_memory.SharedMemory(create=True, size=cls.nbytes(shape, slots))
+        ring = cls(shm, slots, shape, owner=True)
+        ring.ctrl[:] = 0
+        ring.slot_seq[:] = -1
+        return ring
+
+    @classmethod
+    def attach(cls, spec):
+        # meant for multiprocessing children: they share the owner's resource tracker,
+        # so the block is unlinked exactly once, by the owner
+        shm = shared_memory.SharedMemory(name=spec['name'])
+        return cls(shm, spec['slots'], spec['shape'], owner=False)
+
+    def spec(self):
+        """Picklable description for attach() in another process."""
+        return {'name': self.shm.name, 'slots': self.slots, 'shape': self.shape}
+
+    # writer side
+    def put(self, frame, t_ms, block=False, stop=None):
+        """
+        Publish one frame. With block=True wait while the reader is a full ring behind
+        (returns False if the ring is closed or `stop` is set meanwhile).
+        """
+        ctrl = self.ctrl
+        seq = int(ctrl[_WRITE])
+        if block:
+            while seq - int(ctrl[_READ]) >= self.slots:
+                if ctrl[_CLOSED] or (stop is not None and stop.is_set()):
+                    return False
+                time.sleep(POLL_S)
+        k = seq % self.slots
+        self.slot_seq[k] = -1
+        np.copyto(self.frames[k], frame)
+        self.slot_ts[k] = t_ms
+        self.slot_seq[k] = seq
+        ctrl[_WRITE] = seq + 1
+        return True
+
+    def close(self):
+        """No more frames; the reader finishes once it has drained the ring."""
+        self.ctrl[_CLOSED] = 1
+
+    # reader side
+    def get(self, out, latest=False):
+        """
+        Copy the next frame into `out` and return its timestamp, or None when nothing
+        new is ready. latest=True skips to the newest frame (live cameras).
+        """
+        ctrl = self.ctrl
+        r = int(ctrl[_READ])
+        w = int(ctrl[_WRITE])
+        if r >= w:
+            return None
+        skip = w - 1 - r if latest else max(0, w - self.slots - r)
+        if skip:
+            ctrl[_DROPPED] += skip
+            r += skip
+        k = r % self.slots
+        ts = int(self.slot_ts[k])
+        ok = self.slot_seq[k] == r
+        if ok:
+            np.copyto(out, self.frames[k])
+            ok = self.slot_seq[k] == r
+        if not ok:
+            # overwritten before or while copying
+            ctrl[_DROPPED] += 1
+            ctrl[_READ] = r + 1
+            return None
+        ctrl[_READ] = r + 1
+        return ts
+
+    def finished(self):
+        return bool(self.ctrl[_CLOSED]) and self.ctrl[_READ] >= self.ctrl[_WRITE]
+
+    def stats(self):
+        ctrl = self.ctrl
+        return {'written': int(ctrl[_WRITE]), 'read': int(ctrl[_READ]), 'dropped': int(ctrl[_DROPPED])}
+
+    def release(self):
+        """Detach; the owner also frees the block."""
+        # numpy views must go before the buffer can be closed
+        self.ctrl = self.slot_seq = self.slot_ts = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
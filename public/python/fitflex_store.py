@@ -0,0 +1,430 @@
+"""
+FitFlex session store
+
+Sessions and their events in one SQLite database (WAL mode, so the web app's exporter
+or a History query can read while a tracker writes). Aggregates are kept current as
+events arrive instead of being recomputed from files:
+
+  sessions           one row per session: user, station, day, start/end, rep/set totals
+  session_exercises  reps/sets per (session, exercise)
+  events             every recorded event (rep, set, reset, rep_undo, ...), JSON payload
+  daily              sessions/reps/sets per (day, user, exercise)
+  totals             lifetime sessions/reps/sets per (user, exercise)
+
+A live session is a SessionSummary listener (StoreSession.record); writes are committed
+at most every COMMIT_INTERVAL_S and on close. Existing session_summary*.json files,
+host summaries and session event logs are imported with:
+
+    python fitflex_store.py import session_summary_*.json sessions/*.000.jsonl
+    python fitflex_store.py daily --user alice --days 30
+    python fitflex_store.py sessions --limit 20
+
+Days are local calendar days of the session start. Sessions whose timestamps are not
+wall-clock times (video files, recordings) fall back to when they were stored or to
+the imported file's modification time.
+"""
+import argparse
+import datetime
+import glob
+import hashlib
+import json
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+
+from fitflex_eventlog import SessionSummary, DEFAULT_LOG_DIR, SEGMENT_RE, compact
+
+DEFAULT_STORE = DEFAULT_LOG_DIR / "fitflex.db"
+DEFAULT_USER = "default"
+COMMIT_INTERVAL_S = 1.0
+# timestamps before 2001-09-09 are taken as stream-relative, not wall-clock, times
+MIN_WALL_MS = 1_000_000_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    uid TEXT NOT NULL UNIQUE,
+    user TEXT NOT NULL,
+    station TEXT NOT NULL,
+    mode TEXT,
+    day TEXT NOT NULL,
+    start_time INTEGER,
+    end_time INTEGER,
+    reps INTEGER NOT NULL DEFAULT 0,
+    sets INTEGER NOT NULL DEFAULT 0,
+    source TEXT,
+    log TEXT,
+    meta TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_user_start ON sessions (user, start_time);
+CREATE INDEX IF NOT EXISTS sessions_day ON sessions (day);
+CREATE INDEX IF NOT EXISTS sessions_log ON sessions (log);
+CREATE TABLE IF NOT EXISTS session_exercises (
+    session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    exercise TEXT NOT NULL,
+    reps INTEGER NOT NULL DEFAULT 0,
+    sets INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (session_id, exercise)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    ts INTEGER,
+    type TEXT NOT NULL,
+    exercise TEXT,
+    track TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS events_session ON events (session_id, ts);
+CREATE TABLE IF NOT EXISTS daily (
+    day TEXT NOT NULL,
+    user TEXT NOT NULL,
+    exercise TEXT NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    reps INTEGER NOT NULL DEFAULT 0,
+    sets INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user, exercise)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS totals (
+    user TEXT NOT NULL,
+    exercise TEXT NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    reps INTEGER NOT NULL DEFAULT 0,
+    sets INTEGER NOT NULL DEFAULT 0,
+    first_day TEXT,
+    last_day TEXT,
+    PRIMARY KEY (user, exercise)
+) WITHOUT ROWID;
+"""
+
+
+def log_key(path, base="."):
+    """
+    Key shared by a live session, its summary JSON and its event log, so an import never
+    stores a session twice: the absolute path of the first log segment. Relative paths
+    are taken from `base` (summaries are written next to where their logs were).
+    """
+    path = Path(base, path).resolve()
+    m = SEGMENT_RE.match(path.name)
+    if m:
+        path = path.with_name(f"{m.group('stem')}.000.jsonl")
+    return f"log:{path}"
+
+
+def day_of(t_ms, fallback_ms=None):
+    """Local calendar day (YYYY-MM-DD) of a wall-clock ms timestamp."""
+    if t_ms is None or t_ms < MIN_WALL_MS:
+        t_ms = fallback_ms if fallback_ms is not None else time.time() * 1000
+    return datetime.date.fromtimestamp(t_ms / 1000.0).isoformat()
+
+
+class SessionStore:
+    def __init__(self, path=DEFAULT_STORE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        columns = {r[1] for r in self.conn.execute("PRAGMA table_info(sessions)")}
+        if columns and 'log' not in columns:
+            # stores created before sessions had a log column
+            self.conn.execute("ALTER TABLE sessions ADD COLUMN log TEXT")
+        self.conn.executescript(SCHEMA)
+        self.last_commit = time.monotonic()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+        self.last_commit = time.monotonic()
+
+    def maybe_commit(self):
+        if time.monotonic() - self.last_commit >= COMMIT_INTERVAL_S:
+            self.commit()
+
+    # writing
+    def open_session(self, mode, start_time, user=DEFAULT_USER, station="", log=None):
+        """
+        Start a live session; returns a StoreSession to add as a SessionSummary listener.
+        log is the log_key() of the session's event log, if it has one.
+        """
+        day = day_of(start_time)
+        # start times repeat across replays, so the key is random per run
+        session_id = None
+        while session_id is None:
+            session_id = self._insert_session(f"live:{uuid.uuid4().hex}", user, station, mode, day,
+                                              start_time, None, "live", log=log)
+        self.commit()
+        return StoreSession(self, session_id, user, day, mode, start_time)
+
+    def _insert_session(self, uid, user, station, mode, day, start_time, end_time, source, meta=None, log=None):
+        """Row id of the new session, or None if uid is already stored."""
+        cur = self.conn.execute(
+            "INSERT INTO sessions (uid, user, station, mode, day, start_time, end_time, source, log, meta) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (uid) DO NOTHING",
+            (uid, user, station, mode, day, start_time, end_time, source, log,
+             json.dumps(meta, separators=(",", ":")) if meta else None))
+        return cur.lastrowid if cur.rowcount else None
+
+    def _insert_event(self, session_id, event):
+        track = event.get('track')
+        self.conn.execute(
+            "INSERT INTO events (session_id, ts, type, exercise, track, data) VALUES (?, ?, ?, ?, ?, ?)",
+            (session_id, event.get('ts'), event.get('type', ''), event.get('exercise'),
+             None if track is None else str(track), json.dumps(event, separators=(",", ":"))))
+
+    def _bump(self, session_id, user, day, exercise, d_reps, d_sets, new):
+        """Add rep/set deltas for one exercise of a session to every aggregate."""
+        c = self.conn
+        c.execute("INSERT INTO session_exercises (session_id, exercise, reps, sets) VALUES (?, ?, ?, ?) "
+                  "ON CONFLICT (session_id, exercise) DO UPDATE SET reps = reps + excluded.reps, sets = sets + excluded.sets",
+                  (session_id, exercise, d_reps, d_sets))
+        c.execute("UPDATE sessions SET reps = reps + ?, sets = sets + ? WHERE id = ?", (d_reps, d_sets, session_id))
+        c.execute("INSERT INTO daily (day, user, exercise, sessions, reps, sets) VALUES (?, ?, ?, ?, ?, ?) "
+                  "ON CONFLICT (day, user, exercise) DO UPDATE SET sessions = sessions + excluded.sessions, "
+                  "reps = reps + excluded.reps, sets = sets + excluded.sets",
+                  (day, user, exercise, int(new), d_reps, d_sets))
+        c.execute("INSERT INTO totals (user, exercise, sessions, reps, sets, first_day, last_day) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                  "ON CONFLICT (user, exercise) DO UPDATE SET sessions = sessions + excluded.sessions, "
+                  "reps = reps + excluded.reps, sets = sets + excluded.sets, "
+                  "first_day = min(first_day, excluded.first_day), last_day = max(last_day, excluded.last_day)",
+                  (user, exercise, int(new), d_reps, d_sets, day, day))
+
+    # importing
+    def import_summary(self, summary, uid, user=DEFAULT_USER, station="", source=None, fallback_ms=None, log=None):
+        """
+        Store one finished session given in the session_summary JSON shape. Totals come
+        from its reps/sets; its events, if any, are stored as they are. Returns the new
+        session id, or None if uid, or a session with the same log, is already stored.
+        """
+        if log and self.conn.execute("SELECT 1 FROM sessions WHERE log = ?", (log,)).fetchone():
+            return None
+        start = summary.get('start_time')
+        day = day_of(start, fallback_ms)
+        meta = {k: summary[k] for k in ('event_log', 'tracks', 'frames') if k in summary}
+        session_id = self._insert_session(uid, user, station, summary.get('mode'), day, start,
+                                          summary.get('end_time'), source, meta, log)
+        if session_id is None:
+            return None
+        reps, sets = summary.get('reps') or {}, summary.get('sets') or {}
+        for exercise in sorted(set(reps) | set(sets)):
+            self._bump(session_id, user, day, exercise, int(reps.get(exercise, 0)), int(sets.get(exercise, 0)), True)
+        for event in summary.get('events') or ():
+            self._insert_event(session_id, event)
+        return session_id
+
+    def import_path(self, path, user=DEFAULT_USER, station=""):
+        """
+        Import a session_summary*.json, a host_summary*.json (one session per stream) or a
+        session event log (*.jsonl, compacted first). Returns (imported, skipped).
+        Sessions already stored live or from another file of the same session are skipped.
+        """
+        path = Path(path)
+        raw = path.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()[:32]
+        fallback_ms = path.stat().st_mtime * 1000
+        if path.suffix == ".jsonl":
+            summaries = [("", compact(str(path)))]
+        else:
+            data = json.loads(raw)
+            if 'streams' in data:
+                # host summary: totals per stream, no events
+                summaries = [(name, dict(s, start_time=data.get('start_time'), end_time=data.get('end_time'),
+                                         mode='host'))
+                             for name, s in data['streams'].items()]
+            else:
+                summaries = [("", data)]
+        imported = skipped = 0
+        for name, summary in summaries:
+            uid = f"import:{digest}:{name}" if name else f"import:{digest}"
+            log = None
+            if path.suffix == ".jsonl":
+                log = log_key(path)
+            elif summary.get('event_log'):
+                log = log_key(summary['event_log'][0], path.parent)
+            if self.import_summary(summary, uid, user, name or station, str(path), fallback_ms, log) is None:
+                skipped += 1
+            else:
+                imported += 1
+        self.commit()
+        return imported, skipped
+
+    # queries
+    def sessions(self, user=None, since_day=None, until_day=None, exercise=None, limit=50, offset=0):
+        """Newest sessions first, each with its per-exercise reps/sets."""
+        where, args = _filters(user=user, since_day=since_day, until_day=until_day)
+        if exercise:
+            where.append("id IN (SELECT session_id FROM session_exercises WHERE exercise = ?)")
+            args.append(exercise)
+        rows = self.conn.execute(
+            "SELECT id, user, station, mode, day, start_time, end_time, reps, sets, source FROM sessions"
+            + _where(where) + " ORDER BY start_time DESC, id DESC LIMIT ? OFFSET ?", args + [limit, offset]).fetchall()
+        out = [dict(r) for r in rows]
+        if out:
+            per = {}
+            ids = [s['id'] for s in out]
+            for r in self.conn.execute(
+                    "SELECT session_id, exercise, reps, sets FROM session_exercises WHERE session_id IN (%s)"
+                    % ",".join("?" * len(ids)), ids):
+                per.setdefault(r['session_id'], {})[r['exercise']] = {'reps': r['reps'], 'sets': r['sets']}
+            for s in out:
+                s['exercises'] = per.get(s['id'], {})
+        return out
+
+    def session(self, session_id, events=False):
+        row = self.conn.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        out = dict(row)
+        out['meta'] = json.loads(out['meta']) if out['meta'] else {}
+        out['exercises'] = {r['exercise']: {'reps': r['reps'], 'sets': r['sets']} for r in self.conn.execute(
+            "SELECT exercise, reps, sets FROM session_exercises WHERE session_id = ?", (session_id,))}
+        if events:
+            out['events'] = self.events(session_id)
+        return out
+
+    def events(self, session_id, types=None):
+        sql = "SELECT data FROM events WHERE session_id = ?"
+        args = [session_id]
+        if types:
+            sql += " AND type IN (%s)" % ",".join("?" * len(types))
+            args += list(types)
+        return [json.loads(r['data']) for r in self.conn.execute(sql + " ORDER BY ts, id", args)]
+
+    def daily(self, user=None, since_day=None, until_day=None, exercise=None):
+        """[(day, exercise, sessions, reps, sets)] as dicts, oldest day first; summed over users unless user is given."""
+        where, args = _filters(user=user, since_day=since_day, until_day=until_day)
+        if exercise:
+            where.append("exercise = ?")
+            args.append(exercise)
+        rows = self.conn.execute(
+            "SELECT day, exercise, SUM(sessions) AS sessions, SUM(reps) AS reps, SUM(sets) AS sets FROM daily"
+            + _where(where) + " GROUP BY day, exercise ORDER BY day, exercise", args)
+        return [dict(r) for r in rows]
+
+    def totals(self, user=None):
+        """Lifetime sessions/reps/sets per exercise."""
+        where, args = _filters(user=user)
+        rows = self.conn.execute(
+            "SELECT exercise, SUM(sessions) AS sessions, SUM(reps) AS reps, SUM(sets) AS sets, "
+            "MIN(first_day) AS first_day, MAX(last_day) AS last_day FROM totals"
+            + _where(where) + " GROUP BY exercise ORDER BY exercise", args)
+        return [dict(r) for r in rows]
+
+    def users(self):
+        return [r[0] for r in self.conn.execute("SELECT DISTINCT user FROM totals ORDER BY user")]
+
+
+def _filters(user=None, since_day=None, until_day=None):
+    where, args = [], []
+    if user is not None:
+        where.append("user = ?")
+        args.append(user)
+    if since_day:
+        where.append("day >= ?")
+        args.append(since_day)
+    if until_day:
+        where.append("day <= ?")
+        args.append(until_day)
+    return where, args
+
+
+def _where(clauses):
+    return " WHERE " + " AND ".join(clauses) if clauses else ""
+
+
+class StoreSession:
+    """
+    Writes one live session: add record() to SessionSummary.listeners. Each event is
+    stored and its effect on the rep/set totals (including rep_undo and reset) is
+    applied to every aggregate right away.
+    """
+    def __init__(self, store, session_id, user, day, mode, start_time):
+        self.store = store
+        self.id = session_id
+        self.user = user
+        self.day = day
+        self.summary = SessionSummary(mode, start_time)
+        self.seen = set()
+
+    def record(self, event):
+        reps, sets = self.summary.reps, self.summary.sets
+        before = {k: (reps.get(k, 0), sets.get(k, 0)) for k in set(reps) | set(sets)}
+        self.summary.apply(event)
+        store = self.store
+        store._insert_event(self.id, event)
+        for k in set(reps) | set(sets):
+            b_reps, b_sets = before.get(k, (0, 0))
+            d_reps, d_sets = reps.get(k, 0) - b_reps, sets.get(k, 0) - b_sets
+            if d_reps or d_sets:
+                store._bump(self.id, self.user, self.day, k, d_reps, d_sets, k not in self.seen)
+                self.seen.add(k)
+        store.maybe_commit()
+
+    def close(self, end_time=None, meta=None):
+        self.store.conn.execute("UPDATE sessions SET end_time = ?, meta = ? WHERE id = ?",
+                                (end_time, json.dumps(meta, separators=(",", ":"), default=str) if meta else None, self.id))
+        self.store.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FitFlex session store: import summaries and query history")
+    parser.add_argument("--db", type=str, default=str(DEFAULT_STORE), help="SQLite store path")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("import", help="Import session_summary*.json, host_summary*.json or session logs (*.jsonl)")
+    p.add_argument("paths", nargs="+", help="Files or glob patterns")
+    p.add_argument("--user", type=str, default=DEFAULT_USER)
+    p.add_argument("--station", type=str, default="")
+    p = sub.add_parser("sessions", help="Newest sessions")
+    p.add_argument("--user", type=str)
+    p.add_argument("--exercise", type=str)
+    p.add_argument("--limit", type=int, default=20)
+    p = sub.add_parser("daily", help="Reps and sets per day and exercise")
+    p.add_argument("--user", type=str)
+    p.add_argument("--exercise", type=str)
+    p.add_argument("--days", type=int, default=30, help="Most recent days to include")
+    p = sub.add_parser("totals", help="Lifetime totals per exercise")
+    p.add_argument("--user", type=str)
+    p = sub.add_parser("session", help="One session with its events")
+    p.add_argument("id", type=int)
+    args = parser.parse_args()
+
+    store = SessionStore(args.db)
+    try:
+        if args.cmd == "import":
+            imported = skipped = 0
+            for pattern in args.paths:
+                paths = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+                for path in paths:
+                    if path.endswith(".jsonl") and not path.endswith(".000.jsonl"):
+                        continue        # later segments are read with the first
+                    try:
+                        i, s = store.import_path(path, args.user, args.station)
+                    except (OSError, ValueError) as e:
+                        print(f"[Store] Skipping {path}: {e}")
+                        continue
+                    imported += i
+                    skipped += s
+            print(f"[Store] Imported {imported} sessions ({skipped} already present) -> {args.db}")
+            return
+        if args.cmd == "sessions":
+            result = store.sessions(user=args.user, exercise=args.exercise, limit=args.limit)
+        elif args.cmd == "daily":
+            since = (datetime.date.today() - datetime.timedelta(days=args.days - 1)).isoformat()
+            result = store.daily(user=args.user, since_day=since, exercise=args.exercise)
+        elif args.cmd == "totals":
+            result = store.totals(user=args.user)
+        else:
+            result = store.session(args.id, events=True)
+        print(json.dumps(result, indent=2))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,533 @@
+"""
+FitFlex live stream server
+
+Streams smoothed landmarks, the current exercise and rep/set events to browsers over
+WebSocket (RFC 6455, standard library only). The server runs an asyncio loop on its own
+thread; the tracking loop calls publish_frame()/publish_event() and never waits on a
+client.
+
+On connect a client gets one JSON text message:
+
+  {"type": "hello", "version": 1, "landmarks": 33, "quant": 2, "width": 640, "height": 480,
+   "vis_threshold": 0.3, "exercises": [...], "connections": [[0, 1], ...],
+   "totals": {"reps": {...}, "sets": {...}}}
+
+Rep/set/reset events follow as JSON text, {"type": "event", "event": {...}, "totals": {...}}.
+Every frame is a binary message (little-endian):
+
+  u8 kind (1 key, 2 delta, 3 no pose), u8 exercise (index into hello.exercises, 255 none),
+  u16 seq (publish counter; gaps are coalesced frames), f64 t_ms, then
+  key:    n x (i16 x, i16 y) in 1/quant px, n x u8 visibility (0-255)
+  delta:  ceil(n/8)-byte mask of changed landmarks (bit i of byte i/8, LSB first), then
+          for each changed landmark i8 dx, i8 dy, u8 visibility
+  no pose: nothing (the next frame still deltas against the last skeleton)
+
+Deltas are against the last frame sent to that client, so a slow client gets fewer,
+larger steps instead of a backlog: while it cannot take a frame only the newest one is
+kept (coalesced). A client that sends the text message "ack <seq>" after drawing each
+frame has at most ACK_WINDOW frames in flight; other clients are paced by a small
+socket buffer only. Events are never coalesced. A key frame is sent every
+KEYFRAME_EVERY frames, whenever a step does not fit in i8, and when the client sends
+the text message "key".
+
+Test client (prints what it decodes):
+
+    python fitflex_stream.py ws://127.0.0.1:8765 --frames 300 --slow_ms 100
+"""
+import argparse
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from fitflex_eventlog import SessionSummary
+from fitflex_frame import VIS_THRESHOLD
+
+DEFAULT_PORT = 8765
+QUANT = 2                    # landmark units per pixel
+KEYFRAME_EVERY = 30
+MAX_EVENT_BACKLOG = 1000     # a client this far behind on events is disconnected
+MAX_MESSAGE = 4096           # largest message accepted from a client
+ACK_WINDOW = 2               # unacknowledged frames per acking client
+SEND_BUFFER = 16384          # bytes queued per client before it counts as busy
+
+KIND_KEY, KIND_DELTA, KIND_NONE = 1, 2, 3
+NO_EXERCISE = 255
+_HEADER = struct.Struct("<BBHd")
+_DELTA = np.dtype([('dx', 'i1'), ('dy', 'i1'), ('v', 'u1')])
+_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONT, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+class ProtocolError(Exception):
+    pass
+
+
+# WebSocket framing
+def ws_frame(opcode, payload, mask=False):
+    """One unfragmented frame; clients must mask (mask=True)."""
+    n = len(payload)
+    head = bytes([0x80 | opcode])
+    bit = 0x80 if mask else 0
+    if n < 126:
+        head += bytes([bit | n])
+    elif n < 65536:
+        head += struct.pack("!BH", bit | 126, n)
+    else:
+        head += struct.pack("!BQ", bit | 127, n)
+    if mask:
+        key = os.urandom(4)
+        return head + key + _unmask(payload, key)
+    return head + payload
+
+
+def _unmask(data, key):
+    a = np.frombuffer(data, dtype=np.uint8)
+    k = np.resize(np.frombuffer(key, dtype=np.uint8), len(a))
+    return (a ^ k).tobytes()
+
+
+async def read_message(reader, max_size):
+    """(opcode, payload) of the next message; continuation frames are joined."""
+    opcode, parts, size = None, [], 0
+    while True:
+        b0, b1 = await reader.readexactly(2)
+        op, n = b0 & 0x0F, b1 & 0x7F
+        if n == 126:
+            n = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif n == 127:
+            n = struct.unpack("!Q", await reader.readexactly(8))[0]
+        size += n
+        if size > max_size:
+            raise ProtocolError(f"message over {max_size} bytes")
+        key = await reader.readexactly(4) if b1 & 0x80 else None
+        data = await reader.readexactly(n)
+        if key:
+            data = _unmask(data, key)
+        if op >= OP_CLOSE:
+            # control frames may arrive between fragments
+            return op, data
+        if op != OP_CONT:
+            opcode = op
+        parts.append(data)
+        if b0 & 0x80:
+            return opcode, b"".join(parts)
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1((key + _GUID).encode()).digest()).decode()
+
+
+# Landmark encoding
+class FrameSnapshot:
+    """Quantized landmarks of one published frame, shared read-only by every client."""
+    __slots__ = ('seq', 't_ms', 'exercise', 'detected', 'q', 'v')
+
+    def __init__(self, seq, t_ms, exercise, detected, q, v):
+        self.seq = seq
+        self.t_ms = t_ms
+        self.exercise = exercise
+        self.detected = detected
+        self.q = q
+        self.v = v
+
+    @classmethod
+    def from_state(cls, seq, state, exercise=NO_EXERCISE, quant=QUANT):
+        q = np.clip(np.rint(state.xy * quant), -32768, 32767).astype(np.int16)
+        v = np.clip(np.rint(state.vis * 255.0), 0, 255).astype(np.uint8)
+        return cls(seq, float(state.t_ms), exercise, bool(state.detected), q, v)
+
+
+class FrameEncoder:
+    """Per-client key/delta encoder; keeps the last skeleton sent to that client."""
+    def __init__(self, keyframe_every=KEYFRAME_EVERY):
+        self.keyframe_every = keyframe_every
+        self.last_q = None
+        self.last_v = None
+        self.since_key = 0
+        self.force_key = False
+
+    def encode(self, snap):
+        kind = KIND_NONE
+        body = b""
+        if snap.detected:
+            kind, body = self._body(snap)
+        return _HEADER.pack(kind, snap.exercise, snap.seq & 0xFFFF, snap.t_ms) + body, kind
+
+    def _body(self, snap):
+        q, v = snap.q, snap.v
+        if (self.last_q is None or self.force_key or self.since_key >= self.keyframe_every
+                or len(q) != len(self.last_q)):
+            return self._key(q, v)
+        d = q.astype(np.int32) - self.last_q
+        if np.abs(d).max() > 127:
+            return self._key(q, v)
+        changed = (d != 0).any(axis=1) | (v != self.last_v)
+        rec = np.empty(int(changed.sum()), dtype=_DELTA)
+        rec['dx'] = d[changed, 0]
+        rec['dy'] = d[changed, 1]
+        rec['v'] = v[changed]
+        self.last_q, self.last_v = q, v
+        self.since_key += 1
+        return KIND_DELTA, np.packbits(changed, bitorder='little').tobytes() + rec.tobytes()
+
+    def _key(self, q, v):
+        self.last_q, self.last_v = q, v
+        self.since_key = 1
+        self.force_key = False
+        return KIND_KEY, q.astype('<i2').tobytes() + v.tobytes()
+
+
+class FrameDecoder:
+    """Reference decoder for the binary frames (the browser does the same with a DataView)."""
+    def __init__(self, num_landmarks=33, quant=QUANT):
+        self.n = num_landmarks
+        self.quant = quant
+        self.q = np.zeros((num_landmarks, 2), dtype=np.int32)
+        self.v = np.zeros(num_landmarks, dtype=np.uint8)
+        self.have_key = False
+
+    def decode(self, msg):
+        """dict(kind, exercise, seq, t_ms, xy (n, 2) px, vis (n,)); xy/vis are None without a pose."""
+        kind, exercise, seq, t_ms = _HEADER.unpack_from(msg)
+        body = memoryview(msg)[_HEADER.size:]
+        n = self.n
+        if kind == KIND_KEY:
+            self.q[:] = np.frombuffer(body, dtype='<i2', count=2 * n).reshape(n, 2)
+            self.v[:] = np.frombuffer(body, dtype=np.uint8, offset=4 * n, count=n)
+            self.have_key = True
+        elif kind == KIND_DELTA:
+            if not self.have_key:
+                raise ProtocolError("delta frame before the first key frame")
+            nmask = (n + 7) // 8
+            changed = np.unpackbits(np.frombuffer(body, dtype=np.uint8, count=nmask),
+                                    count=n, bitorder='little').astype(bool)
+            rec = np.frombuffer(body, dtype=_DELTA, offset=nmask)
+            self.q[changed, 0] += rec['dx']
+            self.q[changed, 1] += rec['dy']
+            self.v[changed] = rec['v']
+        out = {'kind': kind, 'exercise': exercise, 'seq': seq, 't_ms': t_ms, 'xy': None, 'vis': None}
+        if kind != KIND_NONE:
+            out['xy'] = self.q / self.quant
+            out['vis'] = self.v / 255.0
+        return out
+
+
+# Server
+class _Client:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.encoder = FrameEncoder()
+        self.pending = None
+        self.sent_seq = None
+        self.acked = None
+        self.events = collections.deque()
+        self.wake = asyncio.Event()
+        self.closed = False
+        self.counts = {'frames': 0, 'key': 0, 'coalesced': 0, 'events': 0, 'bytes': 0}
+
+
+class StreamServer:
+    """
+    WebSocket server on its own thread. num_landmarks/connections describe the published
+    states (the compositor's); exercises is the list frames index into.
+    """
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, exercises=(), connections=(),
+                 num_landmarks=33, width=0, height=0, quant=QUANT):
+        self.host = host
+        self.port = port
+        self.exercises = list(exercises)
+        self.index = {name: i for i, name in enumerate(self.exercises)}
+        self.connections = [list(c) for c in connections]
+        self.num = num_landmarks
+        self.width = width
+        self.height = height
+        self.quant = quant
+        # running totals, so late joiners see the session so far
+        self.summary = SessionSummary('stream', 0)
+        self.clients = set()
+        self.published = 0
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.counts = collections.Counter()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="fitflex-stream", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(timeout=5.0)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5.0)
+
+    async def _shutdown(self):
+        self.server.close()
+        for client in list(self.clients):
+            await self._close(client, 1001)
+        await self.server.wait_closed()
+
+    # called from the tracking thread
+    def publish_frame(self, state, exercise=None):
+        if self.loop is None:
+            return
+        snap = FrameSnapshot.from_state(self.published, state, self.index.get(exercise, NO_EXERCISE), self.quant)
+        self.published += 1
+        self.loop.call_soon_threadsafe(self._on_frame, snap)
+
+    def publish_event(self, event):
+        """Event listener for SessionSummary.listeners."""
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self._on_event, dict(event))
+
+    # event loop side
+    def _on_frame(self, snap):
+        for client in self.clients:
+            if client.pending is not None:
+                client.counts['coalesced'] += 1
+            client.pending = snap
+            client.wake.set()
+
+    def _on_event(self, event):
+        self.summary.apply(event)
+        msg = json.dumps({'type': 'event', 'event': event, 'totals': self._totals()}, separators=(",", ":"))
+        for client in list(self.clients):
+            if len(client.events) >= MAX_EVENT_BACKLOG:
+                self.loop.create_task(self._close(client, 1008))
+                continue
+            client.events.append(msg)
+            client.wake.set()
+
+    def _totals(self):
+        return {'reps': dict(self.summary.reps), 'sets': dict(self.summary.sets)}
+
+    def _hello(self):
+        return json.dumps({'type': 'hello', 'version': 1, 'landmarks': self.num, 'quant': self.quant,
+                           'width': self.width, 'height': self.height, 'vis_threshold': VIS_THRESHOLD,
+                           'keyframe_every': KEYFRAME_EVERY, 'ack_window': ACK_WINDOW, 'exercises': self.exercises,
+                           'connections': self.connections, 'totals': self._totals()},
+                          separators=(",", ":"))
+
+    async def _handle(self, reader, writer):
+        try:
+            if not await self._handshake(reader, writer):
+                return
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            writer.close()
+            return
+        # keep little in the kernel and transport, so a slow reader shows up as a busy socket
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        writer.transport.set_write_buffer_limits(high=SEND_BUFFER)
+        client = _Client(reader, writer)
+        self.clients.add(client)
+        self.counts['connected'] += 1
+        writer.write(ws_frame(OP_TEXT, self._hello().encode()))
+        sender = asyncio.ensure_future(self._send_loop(client))
+        try:
+            await self._read_loop(client)
+        finally:
+            client.closed = True
+            client.wake.set()
+            await sender
+            self.clients.discard(client)
+            writer.close()
+
+    async def _handshake(self, reader, writer):
+        request = await reader.readuntil(b"\r\n\r\n")
+        lines = request.decode("latin-1").split("\r\n")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        key = headers.get("sec-websocket-key")
+        if headers.get("upgrade", "").lower() != "websocket" or not key:
+            body = b"FitFlex live stream: connect with a WebSocket client\n"
+            writer.write(b"HTTP/1.1 426 Upgrade Required\r\nUpgrade: websocket\r\nConnection: close\r\n"
+                         b"Content-Type: text/plain\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+            await writer.drain()
+            writer.close()
+            return False
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n").encode())
+        return True
+
+    async def _read_loop(self, client):
+        try:
+            while not client.closed:
+                opcode, data = await read_message(client.reader, MAX_MESSAGE)
+                if opcode == OP_CLOSE:
+                    await self._close(client, 1000)
+                elif opcode == OP_PING:
+                    client.writer.write(ws_frame(OP_PONG, data))
+                elif opcode == OP_TEXT:
+                    words = data.split()
+                    if words == [b"key"]:
+                        client.encoder.force_key = True
+                    elif len(words) == 2 and words[0] == b"ack" and words[1].isdigit():
+                        client.acked = int(words[1]) & 0xFFFF
+                        client.wake.set()
+        except ProtocolError:
+            await self._close(client, 1009)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            client.closed = True
+
+    async def _send_loop(self, client):
+        writer = client.writer
+        try:
+            while not client.closed:
+                await client.wake.wait()
+                client.wake.clear()
+                while client.events:
+                    msg = client.events.popleft()
+                    writer.write(ws_frame(OP_TEXT, msg.encode()))
+                    client.counts['events'] += 1
+                if client.pending is not None and self._window_open(client):
+                    snap, client.pending = client.pending, None
+                    msg, kind = client.encoder.encode(snap)
+                    client.sent_seq = snap.seq & 0xFFFF
+                    writer.write(ws_frame(OP_BINARY, msg))
+                    client.counts['frames'] += 1
+                    client.counts['bytes'] += len(msg)
+                    client.counts['key'] += kind == KIND_KEY
+                # while this waits, newer frames replace client.pending
+                await writer.drain()
+        except ConnectionError:
+            client.closed = True
+        finally:
+            for k, v in client.counts.items():
+                self.counts[f"client_{k}"] += v
+
+    @staticmethod
+    def _window_open(client):
+        if client.acked is None or client.sent_seq is None:
+            return True
+        return (client.sent_seq - client.acked) & 0xFFFF < ACK_WINDOW
+
+    async def _close(self, client, code):
+        if client.closed:
+            return
+        client.closed = True
+        client.wake.set()
+        try:
+            client.writer.write(ws_frame(OP_CLOSE, struct.pack("!H", code)))
+            await client.writer.drain()
+        except ConnectionError:
+            pass
+        client.writer.close()
+
+    def stats(self):
+        return dict(self.counts, published=self.published, clients=len(self.clients))
+
+
+# Test client
+async def run_client(url, frames=300, slow_ms=0.0, timeout_s=30.0, ack=True):
+    """
+    Connect, decode `frames` frames (sleeping slow_ms after each to act as a slow
+    client, then acknowledging it if ack) and return what was received: hello, events,
+    decoded frames, sizes.
+    """
+    if not url.startswith("ws://"):
+        raise ValueError("only ws:// URLs are supported")
+    hostport, _, path = url[5:].partition("/")
+    host, _, port = hostport.partition(":")
+    reader, writer = await asyncio.open_connection(host, int(port or 80))
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((f"GET /{path} HTTP/1.1\r\nHost: {hostport}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    response = await reader.readuntil(b"\r\n\r\n")
+    if b" 101 " not in response.split(b"\r\n", 1)[0] or accept_key(key).encode() not in response:
+        raise ProtocolError(f"handshake failed: {response.splitlines()[0]!r}")
+    out = {'hello': None, 'events': [], 'frames': [], 'bytes': []}
+    decoder = None
+    deadline = time.monotonic() + timeout_s
+    try:
+        while len(out['frames']) < frames and time.monotonic() < deadline:
+            try:
+                opcode, data = await asyncio.wait_for(read_message(reader, 1 << 24), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+            if opcode == OP_TEXT:
+                msg = json.loads(data)
+                if msg['type'] == 'hello':
+                    out['hello'] = msg
+                    decoder = FrameDecoder(msg['landmarks'], msg['quant'])
+                else:
+                    out['events'].append(msg)
+            elif opcode == OP_BINARY:
+                frame = decoder.decode(data)
+                out['frames'].append(frame)
+                out['bytes'].append(len(data))
+                if slow_ms:
+                    await asyncio.sleep(slow_ms / 1000.0)
+                if ack:
+                    writer.write(ws_frame(OP_TEXT, f"ack {frame['seq']}".encode(), mask=True))
+            elif opcode == OP_CLOSE:
+                break
+        writer.write(ws_frame(OP_CLOSE, struct.pack("!H", 1000), mask=True))
+        await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FitFlex live stream test client")
+    parser.add_argument("url", nargs="?", default=f"ws://127.0.0.1:{DEFAULT_PORT}/")
+    parser.add_argument("--frames", type=int, default=300, help="Frames to receive before disconnecting")
+    parser.add_argument("--slow_ms", type=float, default=0.0, help="Sleep after each frame to act as a slow client")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--no_ack", action="store_true", help="Do not acknowledge frames (socket-paced only)")
+    args = parser.parse_args()
+    out = asyncio.run(run_client(args.url, args.frames, args.slow_ms, args.timeout, ack=not args.no_ack))
+    hello = out['hello'] or {}
+    print(f"[Client] hello: {hello.get('landmarks')} landmarks, exercises {hello.get('exercises')}, totals {hello.get('totals')}")
+    for msg in out['events']:
+        print(f"[Client] event {msg['event']} totals {msg['totals']}")
+    frames = out['frames']
+    if frames:
+        kinds = collections.Counter(f['kind'] for f in frames)
+        seqs = [f['seq'] for f in frames]
+        skipped = sum((b - a - 1) & 0xFFFF for a, b in zip(seqs, seqs[1:]))
+        span_s = (frames[-1]['t_ms'] - frames[0]['t_ms']) / 1000.0
+        print(f"[Client] {len(frames)} frames over {span_s:.1f}s: key={kinds[KIND_KEY]} delta={kinds[KIND_DELTA]} "
+              f"no_pose={kinds[KIND_NONE]}, mean {np.mean(out['bytes']):.0f} bytes, {skipped} coalesced by the server")
+        last = frames[-1]
+        ex = hello.get('exercises', [])
+        name = ex[last['exercise']] if last['exercise'] < len(ex) else None
+        print(f"[Client] last frame t={last['t_ms']:.0f} exercise={name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+FitFlex synthetic pose streams
+
+Generates MediaPipe-style 33-landmark sequences in pixel coordinates for benchmarks
+and offline checks, without a camera or model:
+
+  bicep_curl    - upper arms hanging, elbows flexing between ~165 and ~30 degrees
+  lat_pulldown  - arms raised overhead, pulled down until elbows are beside the torso
+  idle          - standing with arms relaxed, slight sway
+  occlusion     - bicep curls with random dropouts (visibility 0, landmarks jittered)
+
+synth_stream() returns (ts_ms, frames) with frames of shape (n, 33, 4) = x, y, z, vis.
+"""
+import math
+
+import numpy as np
+
+NUM_LANDMARKS = 33
+T0_MS = 1_700_000_000_000
+KINDS = ("bicep_curl", "lat_pulldown", "idle", "occlusion")
+# exercise each stream performs (None: no reps)
+KIND_EXERCISE = {"bicep_curl": "bicep_curl", "lat_pulldown": "lat_pulldown", "idle": None,
+                 "occlusion": "bicep_curl"}
+
+# neutral standing pose, facing the camera, 640x480 frame
+# (MediaPipe "left" landmarks are the athlete's left, i.e. image right)
+BASE_POSE = np.array([
+    (320, 110), (326, 100), (330, 100), (334, 100), (314, 100), (310, 100), (306, 100),
+    (342, 105), (298, 105), (328, 124), (312, 124),
+    (360, 170), (280, 170),        # shoulders 11, 12
+    (366, 250), (274, 250),        # elbows 13, 14
+    (370, 330), (270, 330),        # wrists 15, 16
+    (374, 342), (266, 342), (372, 344), (268, 344), (366, 338), (274, 338),
+    (345, 320), (295, 320),        # hips 23, 24
+    (347, 395), (293, 395),        # knees 25, 26
+    (349, 465), (291, 465),        # ankles 27, 28
+    (352, 472), (288, 472), (356, 476), (284, 476),
+], dtype=np.float64)
+
+UPPER_ARM = 80.0
+FOREARM = 80.0
+# (shoulder, elbow, wrist, hand points, mirror sign)
+ARMS = (
+    (11, 13, 15, (17, 19, 21), 1.0),
+    (12, 14, 16, (18, 20, 22), -1.0),
+)
+
+
+def _rotate(v, deg):
+    r = math.radians(deg)
+    c, s = math.cos(r), math.sin(r)
+    return np.array([c * v[0] - s * v[1], s * v[0] + c * v[1]])
+
+
+def _place_arm(pose, arm, upper_dir, elbow_deg):
+    """Place elbow, wrist and hand so the shoulder-elbow-wrist angle is elbow_deg."""
+    s, e, w, hand, sign = arm
+    u = np.asarray(upper_dir, dtype=np.float64)
+    u = u / np.linalg.norm(u)
+    pose[e] = pose[s] + UPPER_ARM * u
+    # bend the forearm away from the straight-arm direction, towards the body midline
+    d = _rotate(-u, sign * elbow_deg)
+    pose[w] = pose[e] + FOREARM * d
+    for k, i in enumerate(hand):
+        pose[i] = pose[w] + d * (10 + 2 * k)
+
+
+def _phase(t, period):
+    # 0 at the extended position, 1 at full contraction
+    return 0.5 - 0.5 * math.cos(2 * math.pi * t / period)
+
+
+def _pose_at(kind, t, period):
+    pose = BASE_POSE.copy()
+    if kind in ("bicep_curl", "occlusion"):
+        elbow = 165.0 - 135.0 * _phase(t, period)
+        for arm in ARMS:
+            _place_arm(pose, arm, (0.05 * arm[4], 1.0), elbow)
+    elif kind == "lat_pulldown":
+        ph = _phase(t, period)
+        elbow = 165.0 - 110.0 * ph
+        for arm in ARMS:
+            sign = arm[4]
+            # upper arm sweeps from overhead to out-and-down beside the torso
+            up = np.array([0.25 * sign, -1.0]) * (1 - ph) + np.array([0.9 * sign, 0.35]) * ph
+            _place_arm(pose, arm, up, -elbow)
+        pose[23:25, 1] += 6 * ph  # slight torso lean
+    elif kind == "idle":
+        sway = 3.0 * math.sin(2 * math.pi * t / 4.0)
+        pose[:, 0] += sway
+        for arm in ARMS:
+            _place_arm(pose, arm, (0.1 * arm[4], 1.0), 170.0)
+    else:
+        raise ValueError(f"unknown synthetic stream kind: {kind}")
+    return pose
+
+
+def synth_stream(kind="bicep_curl", seconds=30.0, fps=30.0, noise_px=1.5, period_s=2.5,
+                 occlusion_rate=0.05, seed=0, t0_ms=T0_MS):
+    """
+    Synthetic landmark stream. Returns (ts_ms int64 (n,), frames float64 (n, 33, 4)).
+    noise_px is Gaussian jitter on x/y; for kind='occlusion', occlusion_rate is the
+    per-frame probability that a dropout of 5-30 frames starts.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * fps)
+    ts = (t0_ms + np.round(np.arange(n) * 1000.0 / fps)).astype(np.int64)
+    frames = np.zeros((n, NUM_LANDMARKS, 4), dtype=np.float64)
+    frames[:, :, 3] = 0.95
+    for k in range(n):
+        frames[k, :, :2] = _pose_at(kind, k / fps, period_s)
+    frames[:, :, :2] += rng.normal(0.0, noise_px, size=(n, NUM_LANDMARKS, 2))
+    frames[:, :, 2] = rng.normal(0.0, 0.02, size=(n, NUM_LANDMARKS))
+    frames[:, :, 3] -= np.abs(rng.normal(0.0, 0.03, size=(n, NUM_LANDMARKS)))
+    if kind == "occlusion":
+        k = 0
+        while k < n:
+            if rng.random() < occlusion_rate:
+                span = int(rng.integers(5, 31))
+                frames[k:k + span, :, 3] = 0.0
+                frames[k:k + span, :, :2] += rng.normal(0.0, 40.0, size=(min(span, n - k), NUM_LANDMARKS, 2))
+                k += span
+            else:
+                k += 1
+    return ts, frames
+
+
+def expected_reps(kind="bicep_curl", seconds=30.0, period_s=2.5):
+    """
+    Number of complete reps in a synthetic stream (0 for idle). For occlusion this is an
+    upper bound: a dropout over the bottom or top of a rep hides that rep.
+    """
+    if kind == "idle":
+        return 0
+    return int(seconds // period_s)
+
+
+def iter_frames(ts, frames):
+    """Yield (ts, landmarks, vis) tuples in the shape read_landmarks_csv produces."""
+    for t, f in zip(ts.tolist(), frames.tolist()):
+        yield t, [tuple(p) for p in f], [p[3] for p in f]
@@ -0,0 +1,370 @@
+"""
+FitFlex video-file input with a pose-landmark cache
+
+Recorded workout videos are decoded on a background thread and handed to pose
+inference in batches. Landmarks are cached on disk, keyed by the video's content hash
+and the model settings; record i of a cache entry holds frame i. A later run with
+different smoothing, calibration or exercise logic reads landmarks straight from the
+cache and never builds a MediaPipe graph:
+
+    python fitflex_mediapipe_multi.py --video workout.mp4 --headless
+    python fitflex_video.py workout.mp4 --out workout.fflm      # landmarks for eval/calibrate
+
+Cache layout (POSE_CACHE_DIR):
+  <key>.fflm   - one .fflm recording per (video, settings); frames without a pose have
+                 NaN coordinates so frame indices stay aligned
+  index.json   - entry sizes and last use, plus content hashes by (path, size, mtime)
+                 so unchanged videos are not hashed again
+
+Entries are evicted least recently used first once the cache exceeds its size limit.
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from fitflex_frame import FrameState
+from fitflex_recording import LandmarkRecording, LandmarkWriter, RECORDING_EXT
+
+POSE_CACHE_DIR = Path("pose_cache")
+POSE_CACHE_MAX_MB = 2048
+# frames per decode -> inference hand-off, and batches buffered ahead of inference
+DECODE_BATCH = 16
+DECODE_AHEAD = 4
+HASH_CHUNK = 1 << 20
+MAX_DIGESTS = 1024
+
+
+def file_digest(path):
+    """SHA-256 of the file contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def video_info(path):
+    """(fps, width, height) of a video file."""
+    import cv2
+    cap = cv2.VideoCapture(str(path))
+    try:
+        return (cap.get(cv2.CAP_PROP_FPS) or 30.0, int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    finally:
+        cap.release()
+
+
+def cache_key(digest, settings):
+    """Cache key for a video digest and a dict of model settings."""
+    blob = digest + json.dumps(settings, sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()[:32]
+
+
+class VideoDecoder:
+    """
+    Decodes a video file on a background thread into batches of (t_ms, frame_bgr).
+    Unlike the camera pipeline nothing is dropped: decoding blocks once DECODE_AHEAD
+    batches are waiting. Timestamps are frame_index * 1000 / fps from the start of the video.
+    """
+    def __init__(self, path, batch=DECODE_BATCH, ahead=DECODE_AHEAD):
+        import cv2
+        self.path = str(path)
+        self.cap = cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            raise ValueError(f"{self.path}: cannot open video")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.batch = batch
+        self.batches = queue.Queue(maxsize=ahead)
+        self.stop_event = threading.Event()
+        self.decoded = 0
+        self.thread = threading.Thread(target=self._decode_loop, name="fitflex-decode", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def timestamp(self, index):
+        return int(round(index * 1000.0 / self.fps))
+
+    def _put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.batches.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _decode_loop(self):
+        batch = []
+        try:
+            while not self.stop_event.is_set():
+                ok, frame = self.cap.read()
+                if not ok:
+                    break
+                batch.append((self.timestamp(self.decoded), frame))
+                self.decoded += 1
+                if len(batch) == self.batch:
+                    self._put(batch)
+                    batch = []
+            if batch:
+                self._put(batch)
+        finally:
+            self.cap.release()
+            self._put(None)
+
+    def __iter__(self):
+        """Yield frame batches (lists of (t_ms, frame_bgr)) until the video ends."""
+        while True:
+            try:
+                batch = self.batches.get(timeout=0.5)
+            except queue.Empty:
+                if self.stop_event.is_set() or not self.thread.is_alive():
+                    return
+                continue
+            if batch is None:
+                return
+            yield batch
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join(timeout=2.0)
+
+
+class PoseCache:
+    """
+    On-disk pose landmarks keyed by (video content hash, model settings).
+    max_bytes bounds the total size of the .fflm entries; least recently used go first.
+    """
+    def __init__(self, root=POSE_CACHE_DIR, max_bytes=POSE_CACHE_MAX_MB * 1024 * 1024):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / "index.json"
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.index = self._load_index()
+
+    def _entry_path(self, key):
+        return self.root / f"{key}{RECORDING_EXT}"
+
+    def _load_index(self):
+        try:
+            index = json.loads(self.index_path.read_text())
+        except (OSError, ValueError):
+            index = {}
+        entries = index.get("entries", {})
+        # entries written by another process since our last save are adopted, missing ones dropped
+        on_disk = {p.stem: p for p in self.root.glob(f"*{RECORDING_EXT}")}
+        for key in list(entries):
+            if key not in on_disk:
+                del entries[key]
+        for key, p in on_disk.items():
+            if key not in entries:
+                st = p.stat()
+                entries[key] = {"size": st.st_size, "last_used": st.st_mtime}
+        return {"entries": entries, "digests": index.get("digests", {})}
+
+    def _save_index(self):
+        tmp = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self.index))
+        os.replace(tmp, self.index_path)
+
+    def digest(self, path):
+        """Content hash of a video, reused while its size and mtime are unchanged."""
+        st = os.stat(path)
+        name = str(Path(path).resolve())
+        sig = [st.st_size, st.st_mtime_ns]
+        with self.lock:
+            known = self.index["digests"].get(name)
+            if known and known["sig"] == sig:
+                return known["sha256"]
+        digest = file_digest(path)
+        with self.lock:
+            digests = self.index["digests"]
+            digests.pop(name, None)
+            digests[name] = {"sig": sig, "sha256": digest}
+            while len(digests) > MAX_DIGESTS:
+                del digests[next(iter(digests))]
+            self._save_index()
+        return digest
+
+    def get(self, key):
+        """The cached LandmarkRecording for key, or None."""
+        with self.lock:
+            entry = self.index["entries"].get(key)
+            path = self._entry_path(key)
+            if entry is None or not path.exists():
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry["last_used"] = time.time()
+            self._save_index()
+        return LandmarkRecording(path)
+
+    def writer(self, key, fps, width, height):
+        """LandmarkWriter for a new entry; pass it to commit() or discard() when done."""
+        part = self.root / f"{key}.{os.getpid()}.part"
+        return LandmarkWriter(part, fps=fps, width=width, height=height)
+
+    def commit(self, key, writer, source=None):
+        writer.close()
+        path = self._entry_path(key)
+        os.replace(writer.path, path)
+        with self.lock:
+            self.index["entries"][key] = {"size": path.stat().st_size, "last_used": time.time(),
+                                          "frames": writer.count, "source": source}
+            self._evict(keep=key)
+            self._save_index()
+        return path
+
+    def discard(self, writer):
+        writer.close()
+        Path(writer.path).unlink(missing_ok=True)
+
+    def _evict(self, keep=None):
+        entries = self.index["entries"]
+        total = sum(e["size"] for e in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self._entry_path(key).unlink(missing_ok=True)
+            total -= entries.pop(key)["size"]
+            self.evicted += 1
+
+    def size_bytes(self):
+        with self.lock:
+            return sum(e["size"] for e in self.index["entries"].values())
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.index["entries"]), "hits": self.hits, "misses": self.misses,
+                    "evicted": self.evicted,
+                    "size_mb": round(sum(e["size"] for e in self.index["entries"].values()) / 2**20, 1)}
+
+
+def _fill_cached(state, t, xyz, vis):
+    """Fill state from one cached record (NaN coordinates mark a frame without a pose)."""
+    if np.isnan(xyz[0, 0]):
+        state.clear(t)
+    else:
+        state.fill(t, xyz, vis)
+
+
+def _cached_frames(rec, decoder, state):
+    """Cached detections, paired with decoded frames when a decoder is given."""
+    if decoder is None:
+        for i, t in enumerate(rec.ts.tolist()):
+            _fill_cached(state, t, rec.xyz[i], rec.vis[i])
+            yield t, None, state
+        return
+    i = 0
+    for batch in decoder:
+        for t, frame in batch:
+            if i >= len(rec):
+                return
+            _fill_cached(state, t, rec.xyz[i], rec.vis[i])
+            yield t, frame, state
+            i += 1
+
+
+def video_frames(path, detect, settings, cache=None, images=True, batch=DECODE_BATCH):
+    """
+    Yield (t_ms, frame_bgr, state) for every frame of a video file, like camera_frames;
+    the FrameState is reused for the next frame. detect(frame, state, t_ms) is only
+    called on a cache miss. settings (model name, complexity, thresholds, ...) is part
+    of the cache key. With images=False a cache hit yields frame None without decoding
+    the video. A miss is committed to the cache only when the whole video was consumed.
+    """
+    state = FrameState()
+    key = cache_key(cache.digest(path), settings) if cache else None
+    rec = cache.get(key) if cache else None
+    if rec is not None:
+        decoder = VideoDecoder(path, batch).start() if images else None
+        try:
+            yield from _cached_frames(rec, decoder, state)
+        finally:
+            if decoder:
+                decoder.stop()
+        return
+
+    decoder = VideoDecoder(path, batch).start()
+    writer = cache.writer(key, decoder.fps, decoder.width, decoder.height) if cache else None
+    missing = np.full((state.num, 4), np.nan, dtype=np.float32)
+    complete = False
+    try:
+        for frames in decoder:
+            for t, frame in frames:
+                found = detect(frame, state, t)
+                if writer:
+                    if found:
+                        writer.write(t, state.xyz, state.vis)
+                    else:
+                        writer.write(t, missing)
+                yield t, frame, state
+        complete = True
+    finally:
+        decoder.stop()
+        if writer:
+            if complete:
+                cache.commit(key, writer, source=str(path))
+            else:
+                cache.discard(writer)
+
+
+def video_landmarks(path, detect, settings, cache=None):
+    """
+    Playback source for a video file: yields (ts, xyz, vis) like read_landmarks, with
+    arrays that are overwritten by the next frame. Frames without a pose are skipped,
+    as in camera recordings.
+    """
+    for t, _, state in video_frames(path, detect, settings, cache, images=False):
+        if state.detected:
+            yield t, state.xyz, state.vis
+
+
+def main():
+    import fitflex_mediapipe_multi as ff
+
+    parser = argparse.ArgumentParser(description="Extract pose landmarks from a video into an .fflm recording")
+    parser.add_argument("video", help="Video file")
+    parser.add_argument("--out", type=str, help="Recording to write (default: <video stem>.fflm)")
+    parser.add_argument("--pose_cache", type=str, default=str(POSE_CACHE_DIR), help="Pose landmark cache directory")
+    parser.add_argument("--cache_max_mb", type=float, default=POSE_CACHE_MAX_MB, help="Evict least recently used entries above this size")
+    parser.add_argument("--no_cache", action="store_true", help="Always run inference and leave the cache untouched")
+    args = parser.parse_args()
+
+    out = args.out or str(Path(args.video).with_suffix(RECORDING_EXT))
+    cache = None if args.no_cache else PoseCache(args.pose_cache, int(args.cache_max_mb * 2**20))
+    detector = ff.LazyPoseDetector()
+    t0 = time.perf_counter()
+    n = 0
+    try:
+        fps, width, height = video_info(args.video)
+        with LandmarkWriter(out, fps=fps, width=width, height=height) as writer:
+            for t, landmarks, vis in video_landmarks(args.video, detector, ff.pose_settings(), cache):
+                writer.write(t, landmarks, vis)
+                n += 1
+    finally:
+        detector.close()
+    elapsed = time.perf_counter() - t0
+    print(f"[Video] {n} frames with a pose in {elapsed:.2f}s ({detector.calls} inferences)")
+    if cache:
+        print(f"[PoseCache] {cache.stats()}")
+    print(f"[Saved] Landmark recording -> {out}")
+
+
+if __name__ == "__main__":
+    main()
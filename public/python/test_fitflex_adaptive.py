@@ -0,0 +1,86 @@
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import fitflex_mediapipe_multi as ff
+import fitflex_synth as synth
+from fitflex_adaptive import AdaptiveInference
+from fitflex_frame import FrameState
+
+H, W = 480, 640
+
+
+class FakePose:
+    """Returns the synthetic neutral pose in the coordinates of whatever image it is given."""
+    def __init__(self, frame_xy):
+        self.frame_xy = frame_xy
+        self.calls = 0
+
+    def process(self, rgb):
+        self.calls += 1
+        return SimpleNamespace(pose_landmarks=SimpleNamespace(landmark=self.landmarks))
+
+    @property
+    def landmarks(self):
+        return [SimpleNamespace(x=x / W, y=y / H, z=0.0, visibility=1.0) for x, y in self.frame_xy]
+
+    def close(self):
+        pass
+
+
+def _adaptive(**kw):
+    pose = FakePose(synth.BASE_POSE[:, :2])
+    smoother = ff.PoseSmoother()
+    return AdaptiveInference(lambda c: pose, smoother, **kw), pose, smoother
+
+
+def test_skip_frames_are_predicted_and_leave_the_filter_alone():
+    adaptive, pose, smoother = _adaptive(max_skip=2)
+    frame = np.zeros((H, W, 3), dtype=np.uint8)
+    state = FrameState()
+    assert adaptive.process(frame, state, 0)
+    assert not state.predicted
+    smoother.smooth_state(state)
+    x_prev, t_prev = smoother.x_prev.copy(), smoother.t_prev.copy()
+
+    assert adaptive.process(frame, state, 33)
+    assert state.predicted and state.detected
+    assert pose.calls == 1
+    np.testing.assert_array_equal(smoother.x_prev, x_prev)
+    np.testing.assert_array_equal(smoother.t_prev, t_prev)
+    np.testing.assert_allclose(state.xyz, smoother.predict(33))
+
+    adaptive.process(frame, state, 66)
+    adaptive.process(frame, state, 100)
+    assert pose.calls == 2 and not state.predicted
+    assert adaptive.stats()["skip"] == 2
+
+
+def test_lost_pose_clears_the_state():
+    adaptive, pose, _ = _adaptive()
+    pose.process = lambda rgb: SimpleNamespace(pose_landmarks=None)
+    state = FrameState()
+    assert not adaptive.process(np.zeros((H, W, 3), dtype=np.uint8), state, 0)
+    assert not state.detected and not state.predicted and not adaptive.tracking
+    assert adaptive.stats()["full"] == 1
+
+
+def test_ladder_steps_down_when_over_budget_and_back_up_with_headroom():
+    adaptive, _, _ = _adaptive(target_fps=30.0, cooldown_frames=2)
+    for _ in range(2):
+        adaptive._observe(100.0)
+    assert adaptive.level == 1 and adaptive.stats()["level_down"] == 1
+    assert adaptive.stats()["model_complexity"] == adaptive.ladder[1][0]
+    for _ in range(2):
+        adaptive._observe(1.0)
+    assert adaptive.level == 0 and adaptive.stats()["level_up"] == 1
+
+
+def test_adaptive_and_pipeline_are_rejected(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["fitflex_mediapipe_multi.py", "--adaptive", "--pipeline"])
+    with pytest.raises(SystemExit) as exc:
+        ff.main()
+    assert exc.value.code == 2
+    assert "--adaptive cannot be combined with --pipeline" in capsys.readouterr().err
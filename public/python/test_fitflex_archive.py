@@ -0,0 +1,123 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+import fitflex_mediapipe_multi as ff
+import fitflex_synth as synth
+from fitflex_archive import (CHUNK_FRAMES, HIDDEN_XY_STEP, XY_SCALE, LandmarkArchive, LandmarkArchiveWriter,
+                             extract, load_arrays, pack)
+from fitflex_bench import write_formats
+from fitflex_exercises import VIS_MIN
+
+# CSV bytes / archive bytes: what --record writes (with z), and the same data packed
+# from the CSV (no z); dropouts jitter by tens of pixels and cost more
+MIN_RATIO = {"ffla": 8.0, "ffla_from_csv": 10.0}
+OCCLUSION_MIN_RATIO = {"ffla": 6.0, "ffla_from_csv": 8.0}
+
+
+def _archive(path, seconds=20.0, kind="bicep_curl", chunk_frames=CHUNK_FRAMES, **kwargs):
+    ts, frames = synth.synth_stream(kind, seconds=seconds, seed=3)
+    with LandmarkArchiveWriter(path, chunk_frames=chunk_frames, **kwargs) as w:
+        w.write_many(ts, frames[..., :3], frames[..., 3])
+    return ts, frames
+
+
+@pytest.mark.parametrize("kind", synth.KINDS)
+def test_archive_size_against_csv(kind, tmp_path):
+    ts, frames = synth.synth_stream(kind, seconds=20.0)
+    storage = write_formats(ts, frames, str(tmp_path))
+    for fmt, ratio in (OCCLUSION_MIN_RATIO if kind == "occlusion" else MIN_RATIO).items():
+        assert storage["csv"] / storage[fmt] >= ratio, storage
+
+
+def test_hidden_grid_is_opt_in_and_shrinks_occlusion(tmp_path):
+    ts, frames = synth.synth_stream("occlusion", seconds=20.0)
+    storage = write_formats(ts, frames, str(tmp_path))
+    coarse = tmp_path / "coarse.ffla"
+    pack(tmp_path / "bench_read.csv", coarse, hidden_xy_step=HIDDEN_XY_STEP)
+    assert storage["csv"] * len(ts) / coarse.stat().st_size >= MIN_RATIO["ffla_from_csv"]
+    assert coarse.stat().st_size < storage["ffla_from_csv"] * len(ts)
+
+
+def test_round_trip_within_quantization(tmp_path):
+    path = tmp_path / "a.ffla"
+    ts, frames = _archive(path, kind="occlusion")
+    archive = LandmarkArchive(path)
+    np.testing.assert_array_equal(archive.ts, ts)
+    visible = frames[..., 3] > VIS_MIN
+    err = np.abs(archive.xyz[..., :2] - frames[..., :2]).max(axis=-1)
+    assert err[visible].max() <= 0.5 / XY_SCALE + 1e-3
+    np.testing.assert_allclose(archive.vis, frames[..., 3], atol=0.006)
+    archive.close()
+
+
+def test_hidden_landmarks_are_stored_coarsely_only_on_request(tmp_path):
+    path = tmp_path / "a.ffla"
+    _, frames = _archive(path, kind="occlusion")
+    hidden = frames[..., 3] <= VIS_MIN
+    assert hidden.any()
+    err = np.abs(LandmarkArchive(path).xyz[..., :2] - frames[..., :2]).max(axis=-1)
+    assert err[hidden].max() <= 0.5 / XY_SCALE + 1e-3
+    _archive(path, kind="occlusion", hidden_xy_step=HIDDEN_XY_STEP)
+    xyz = LandmarkArchive(path).xyz
+    err = np.abs(xyz[..., :2] - frames[..., :2]).max(axis=-1)
+    assert err[hidden].max() <= HIDDEN_XY_STEP / 2 + 1e-3
+    assert np.all(np.fmod(xyz[..., :2][hidden], HIDDEN_XY_STEP) == 0)
+
+
+@pytest.mark.parametrize("kind", synth.KINDS)
+def test_recorded_archive_replays_the_same(kind, tmp_path):
+    # written frame by frame through open_recorder, as --record session.ffla does
+    path = str(tmp_path / "session.ffla")
+    ts, frames = synth.synth_stream(kind, seconds=30.0, seed=3)
+    recorder = ff.open_recorder(path, 30.0, 640, 480)
+    for t, f in zip(ts.tolist(), frames):
+        recorder.write(t, f[:, :3], f[:, 3])
+    recorder.close()
+    with contextlib.redirect_stdout(io.StringIO()):
+        archived = ff.replay_session(ff.read_landmarks(path))
+        raw = ff.replay_session(synth.iter_frames(ts, frames))
+    assert archived["reps"] == raw["reps"] and archived["sets"] == raw["sets"]
+    assert sum(raw["reps"].values()) > 0 or kind == "idle"
+
+
+def test_read_decodes_only_overlapping_chunks(tmp_path):
+    path = tmp_path / "a.ffla"
+    ts, _ = _archive(path, chunk_frames=64)
+    archive = LandmarkArchive(path)
+    start, end = int(ts[100]), int(ts[160])
+    assert list(archive.chunks_for(start, end)) == [1, 2]
+    got_ts, xyz, vis = archive.read(start, end)
+    np.testing.assert_array_equal(got_ts, ts[100:160])
+    assert xyz.shape == (60, 33, 3) and vis.shape == (60, 33)
+    assert set(archive.cache) == {1, 2}
+    f_ts, _, _ = archive.frames(62, 130)
+    np.testing.assert_array_equal(f_ts, ts[62:130])
+    assert archive.read(int(ts[-1]) + 1)[0].size == 0
+    archive.close()
+
+
+def test_unclosed_archive_keeps_complete_chunks(tmp_path):
+    path = tmp_path / "a.ffla"
+    ts, frames = synth.synth_stream("idle", seconds=5.0)
+    w = LandmarkArchiveWriter(path, chunk_frames=32)
+    w.write_many(ts, frames[..., :3], frames[..., 3])
+    w.f.flush()
+    archive = LandmarkArchive(path)
+    assert len(archive) == (len(ts) // 32) * 32
+    np.testing.assert_array_equal(archive.ts, ts[:len(archive)])
+    archive.close()
+    w.close()
+
+
+@pytest.mark.parametrize("suffix", [".ffla", ".fflm", ".csv"])
+def test_extract_clip(tmp_path, suffix):
+    src = tmp_path / "a.ffla"
+    ts, _ = _archive(src)
+    out = tmp_path / f"clip{suffix}"
+    n = extract(src, out, 2.0, 4.0)
+    clip_ts, xyz, vis, _ = load_arrays(out)
+    assert n == len(clip_ts) == 60
+    assert clip_ts[0] >= ts[0] + 2000 and clip_ts[-1] < ts[0] + 4000
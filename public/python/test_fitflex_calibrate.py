@@ -0,0 +1,89 @@
+import json
+
+import numpy as np
+
+import fitflex_calibrate as cal
+import fitflex_mediapipe_multi as ff
+import fitflex_synth as synth
+from fitflex_eval import find_recordings, make_synthetic_corpus
+
+SMALL_GRID = {
+    "min_cutoff": [1.0, 2.0],
+    "beta": [0.007],
+    "angle_window": [1, 5],
+    "bottom_th": [40, 60, 80],
+    "top_th": [140, 160],
+    "min_rep_ms": [250],
+    "max_rep_ms": [8000],
+}
+
+
+def test_one_euro_batch_matches_pose_smoother():
+    ts, frames = synth.synth_stream("bicep_curl", seconds=3.0)
+    xy = frames[..., :2]
+    batch = cal.one_euro_batch(xy, ts.astype(np.float64), np.array([0.5, 1.0]), np.array([0.03, 0.007]))
+    for p, (mc, beta) in enumerate([(0.5, 0.03), (1.0, 0.007)]):
+        smoother = ff.PoseSmoother(min_cutoff=mc, beta=beta)
+        ref = np.array([smoother.smooth_array(frames[k, :, :3], t)[:, :2] for k, t in enumerate(ts.tolist())])
+        np.testing.assert_allclose(batch[p], ref, rtol=1e-9, atol=1e-9)
+
+
+def test_grid_counts_match_the_detector():
+    ts, frames = synth.synth_stream("bicep_curl", seconds=20.0, seed=4)
+    angles = np.array([ff.angle_deg(f[11, :2], f[13, :2], f[15, :2]) for f in frames])
+    windows, bottom, top = [1, 5], [40, 60], [140, 160]
+    avg = cal.windowed_means(angles[None], windows)
+    counts = cal.count_reps_grid(avg, ts, bottom, top, [250], [8000])
+    assert counts.max() == synth.expected_reps("bicep_curl", 20.0)
+    for j, w in enumerate(windows):
+        for b, bt in enumerate(bottom):
+            for t, tp in enumerate(top):
+                clock = ff.ReplayClock()
+                det = ff.ExerciseDetector("x", bt, tp, clock=clock, angle_window=w)
+                reps = 0
+                for t_ms, a in zip(ts.tolist(), angles.tolist()):
+                    clock.set(t_ms)
+                    reps += det.update(a)[0]
+                assert counts[0, j, b, t, 0, 0] == reps, (w, bt, tp)
+
+
+def test_calibrate_fits_a_synthetic_corpus(tmp_path):
+    make_synthetic_corpus(tmp_path, count=2, seconds=20.0)
+    profile, summary = cal.calibrate(find_recordings(tmp_path), SMALL_GRID)
+    assert set(profile["exercises"]) == {"bicep_curl", "lat_pulldown"}
+    assert all(s["mae"] == 0 for s in summary.values())
+    for params in profile["exercises"].values():
+        assert params["bottom_th"] < params["top_th"]
+    # the profile drives a live manager as is
+    manager = ff.MultiExerciseManager(clock=ff.ReplayClock())
+    manager.apply_profile(json.loads(json.dumps(profile)))
+    assert manager.detectors["bicep_curl"].bottom_th == profile["exercises"]["bicep_curl"]["bottom_th"]
+
+
+def test_segment_mask():
+    ts = np.arange(10) * 100
+    labels = {"segments": [{"start": 200, "end": 400, "exercise": "squat"},
+                           {"start": 500, "end": 900, "exercise": "bicep_curl"}]}
+    assert cal.segment_mask(labels, "squat", ts).nonzero()[0].tolist() == [2, 3, 4]
+    assert cal.segment_mask({}, "squat", ts).all()
+
+
+def test_grid_counts_match_the_detector_across_a_long_rest():
+    # two sets split by a rest longer than both SET_IDLE_S and the largest max_rep_ms
+    ts, frames = synth.synth_stream("bicep_curl", seconds=10.0, seed=5)
+    rest = int((ff.SET_IDLE_S + 4) * 30)
+    angles = np.array([ff.angle_deg(f[11, :2], f[13, :2], f[15, :2]) for f in frames])
+    angles = np.concatenate([angles, np.full(rest, 165.0), angles])
+    ts = ts[0] + np.round(np.arange(len(angles)) * 1000 / 30).astype(np.int64)
+    avg = cal.windowed_means(angles[None], [5])
+    counts = cal.count_reps_grid(avg, ts, [40, 60], [140], [250], [4000, 8000])
+    for b, bt in enumerate([40, 60]):
+        for m, mx in enumerate([4000, 8000]):
+            clock = ff.ReplayClock()
+            det = ff.ExerciseDetector("x", bt, 140, clock=clock, max_rep_ms=mx)
+            reps = 0
+            for t_ms, a in zip(ts.tolist(), angles.tolist()):
+                clock.set(t_ms)
+                reps += det.update(a)[0]
+            assert counts[0, 0, b, 0, 0, m] == reps, (bt, mx)
+    assert counts.max() == 2 * synth.expected_reps("bicep_curl", 10.0)
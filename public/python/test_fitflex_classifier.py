@@ -0,0 +1,123 @@
+import math
+
+import numpy as np
+import pytest
+
+import fitflex_synth as synth
+from fitflex_classifier import (SIGNAL_SCALE, SIGNALS, ExerciseClassifier, FeatureEngine, RingBuffer,
+                                TemplateClassifier, _dtw, motion_template, templates_from_recording)
+from fitflex_exercises import EXERCISES
+from fitflex_recording import LandmarkWriter
+
+
+def _engine(kind, seconds=10.0, window=120):
+    ts, frames = synth.synth_stream(kind, seconds=seconds, seed=5)
+    engine = FeatureEngine(window)
+    for t, f in zip(ts.tolist(), frames):
+        engine.push(t, f[:, :2], f[:, 3])
+    return engine
+
+
+def test_ring_buffer_wraps():
+    ring = RingBuffer(3, 1)
+    assert [ring.push([i]) for i in range(5)] == [None, None, None, [0.0], [1.0]]
+    assert ring.last().ravel().tolist() == [2.0, 3.0, 4.0]
+    assert ring.last(2).ravel().tolist() == [3.0, 4.0]
+
+
+def test_running_statistics_match_the_window():
+    engine = _engine("bicep_curl")
+    rows = engine.ring.last()[:, :len(SIGNALS)]
+    np.testing.assert_allclose(engine.mean(), rows.mean(axis=0), rtol=1e-6, atol=1e-6)
+    np.testing.assert_allclose(engine.std(), rows.std(axis=0), rtol=1e-4, atol=1e-4)
+    np.testing.assert_allclose(engine.range, rows.max(axis=0) - rows.min(axis=0), atol=1e-9)
+    assert SIGNALS[engine.dominant()] == "elbow"
+    assert engine.period_s[engine.dominant()] == pytest.approx(2.5, abs=0.1)
+
+
+def test_signal_measured_late_starts_without_a_jump():
+    ts, frames = synth.synth_stream("bicep_curl", seconds=8.0, seed=5)
+    hidden = len(ts) - 20
+    frames[:hidden, 23:29, 3] = 0.0      # hips and legs come into view near the end
+    engine = FeatureEngine(300)
+    for t, f in zip(ts.tolist(), frames):
+        engine.push(t, f[:, :2], f[:, 3])
+    knee = SIGNALS.index("knee")
+    rows = engine.ring.last()
+    col = rows[:, knee]
+    assert np.isnan(col[:hidden]).all() and not np.isnan(col[hidden:]).any()
+    assert engine.count[knee] == 20
+    assert engine.mean()[knee] == pytest.approx(col[hidden:].mean())
+    assert engine.range[knee] == pytest.approx(col[hidden:].max() - col[hidden:].min())
+    assert engine.range[knee] < 30.0      # not the jump from 0 to a standing knee angle
+    assert engine.speed()[knee] == pytest.approx(rows[hidden:, len(SIGNALS) + knee].mean())
+    # the dominant period reaches back before the knee was seen; it holds its first value
+    traj = engine.trajectory()
+    assert not np.isnan(traj).any()
+    assert np.ptp(traj[:, knee]) <= engine.range[knee] * SIGNAL_SCALE[knee] + 1e-9
+
+
+def test_reset_matches_a_fresh_engine():
+    engine = _engine("lat_pulldown", seconds=3.0)
+    engine.reset()
+    assert engine.ring.size == 0 and engine.seq == 0 and engine.last is None
+    ts, frames = synth.synth_stream("bicep_curl", seconds=3.0, seed=5)
+    fresh = FeatureEngine(120)
+    for t, f in zip(ts.tolist(), frames):
+        engine.push(t, f[:, :2], f[:, 3])
+        fresh.push(t, f[:, :2], f[:, 3])
+    np.testing.assert_array_equal(engine.ring.last(), fresh.ring.last())
+    assert engine.range == fresh.range and engine.period_s == fresh.period_s
+
+
+def test_pruned_search_matches_brute_force():
+    clf = TemplateClassifier().add_motions().build()
+    query = _engine("lat_pulldown").trajectory(clf.n_points)
+    exercise, confidence, dist = clf.classify(query)
+    brute = {}
+    for m, label in enumerate(clf.labels):
+        diff = query[:, None, :] - clf.index["traj"][m][None, :, :]
+        d = _dtw((diff * diff * clf.index["weights"][m]).sum(axis=2), clf.band, math.inf)
+        brute[label] = min(brute.get(label, math.inf), d)
+    brute = {k: math.sqrt(v / clf.n_points) for k, v in brute.items()}
+    ranked = sorted(brute, key=brute.get)
+    assert exercise == ranked[0] == "lat_pulldown"
+    assert dist[ranked[0]] == pytest.approx(brute[ranked[0]])
+    assert dist[ranked[1]] == pytest.approx(brute[ranked[1]])
+    assert confidence == pytest.approx(1 - brute[ranked[0]] / brute[ranked[1]])
+
+
+def test_each_motion_classifies_as_itself():
+    clf = TemplateClassifier().add_motions().build()
+    for name, spec in EXERCISES.items():
+        traj, _ = motion_template(spec.motion, clf.n_points)
+        assert clf.classify(np.roll(traj, 5, axis=0))[0] == name
+
+
+@pytest.mark.parametrize("kind,switch", [("lat_pulldown", "lat_pulldown"), ("bicep_curl", None), ("idle", None)])
+def test_auto_switch_votes(kind, switch):
+    ts, frames = synth.synth_stream(kind, seconds=20.0, seed=1)
+    auto = ExerciseClassifier()
+    current, switched = "bicep_curl", []
+    for t, f in zip(ts.tolist(), frames):
+        chosen = auto.update(t, f[:, :2], f[:, 3], current)
+        if chosen:
+            switched.append(chosen)
+            current = chosen
+    assert switched == ([switch] if switch else [])
+
+
+def test_templates_round_trip(tmp_path):
+    ts, frames = synth.synth_stream("bicep_curl", seconds=10.0)
+    rec = tmp_path / "curl.fflm"
+    with LandmarkWriter(rec) as w:
+        for t, f in zip(ts.tolist(), frames):
+            w.write(t, f)
+    clf = TemplateClassifier()
+    added = templates_from_recording(rec, "bicep_curl", clf, limit=5)
+    assert added == 5
+    clf.save(tmp_path / "t.npz")
+    loaded = TemplateClassifier.load(tmp_path / "t.npz")
+    motions = len(TemplateClassifier().add_motions().labels)
+    assert len(loaded.labels) == motions + 5
+    assert loaded.labels[-5:] == ["bicep_curl"] * 5
@@ -0,0 +1,54 @@
+import numpy as np
+
+import fitflex_synth as synth
+from fitflex_frame import FrameState
+from fitflex_mediapipe_multi import POSE_CONNECTIONS, OverlayCompositor
+
+H, W = 480, 640
+
+
+def _frame(seed=0):
+    return np.random.default_rng(seed).integers(0, 256, size=(H, W, 3), dtype=np.uint8)
+
+
+def _state(dx=0.0, vis=0.95):
+    state = FrameState()
+    pose = synth.BASE_POSE.copy()
+    pose[:, 0] += dx
+    state.fill(0, np.column_stack([pose, np.zeros(len(pose))]), np.full(len(pose), vis))
+    return state
+
+
+def test_nothing_visible_is_a_plain_copy():
+    comp = OverlayCompositor()
+    frame = _frame()
+    out, overlay = comp.draw(frame, _state(vis=0.1), POSE_CONNECTIONS)
+    np.testing.assert_array_equal(out, frame)
+    assert not overlay.any()
+
+
+def test_blend_is_exact_and_limited_to_the_roi():
+    comp = OverlayCompositor()
+    frame = _frame()
+    out, overlay = comp.draw(frame, _state(), POSE_CONNECTIONS)
+    a = overlay[..., 3:4].astype(np.uint32)
+    ref = (overlay[..., :3] * a + frame * (255 - a)) // 255
+    np.testing.assert_array_equal(out, ref)
+    y0, y1, x0, x1 = comp.roi
+    assert overlay[y0:y1, x0:x1, 3].any()
+    outside = np.ones((H, W), dtype=bool)
+    outside[y0:y1, x0:x1] = False
+    np.testing.assert_array_equal(out[outside], frame[outside])
+    assert not overlay[outside].any()
+
+
+def test_buffers_are_reused_and_stale_pixels_cleared():
+    comp = OverlayCompositor()
+    frame = _frame()
+    out1, ov1 = comp.draw(frame, _state(dx=-150), POSE_CONNECTIONS)
+    left = comp.roi
+    out2, ov2 = comp.draw(frame, _state(dx=150), POSE_CONNECTIONS)
+    assert out1 is out2 and ov1 is ov2
+    y0, y1, x0, x1 = left
+    right_x0 = comp.roi[2]
+    assert not ov2[y0:y1, x0:min(x1, right_x0)].any()
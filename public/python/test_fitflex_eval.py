@@ -0,0 +1,61 @@
+import json
+
+import fitflex_eval as ev
+
+
+def _result(reps, label_reps, confusion, pid=1):
+    return {"path": "x.fflm", "pid": pid, "frames": 100, "elapsed_s": 0.1, "reps": reps,
+            "sets": {}, "label_reps": label_reps, "confusion": confusion}
+
+
+def test_report_scores_reps_and_switching():
+    results = [_result({"bicep_curl": 10}, {"bicep_curl": 10}, {"bicep_curl": {"bicep_curl": 100}}),
+               _result({"bicep_curl": 7}, {"bicep_curl": 10}, {"bicep_curl": {"squat": 100}}, pid=2)]
+    report = ev.build_report(results, 1.0, 2)
+    e = report["per_exercise"]["bicep_curl"]
+    assert (e["label_reps"], e["pred_reps"], e["mae"], e["exact_rate"]) == (20, 17, 1.5, 0.5)
+    assert report["switch_accuracy"] == 0.5
+    assert set(report["per_worker"]) == {"1", "2"}
+
+
+def test_check_synthetic_flags_a_corpus_that_counts_nothing():
+    good = ev.build_report([_result({"bicep_curl": 24}, {"bicep_curl": 24},
+                                    {"bicep_curl": {"bicep_curl": 10}})], 1.0, 1)
+    bad = ev.build_report([_result({}, {"bicep_curl": 24}, {"bicep_curl": {"bicep_curl": 10}})], 1.0, 1)
+    assert ev.check_synthetic(good) == []
+    assert any("bicep_curl" in p for p in ev.check_synthetic(bad))
+    assert ev.check_synthetic(ev.build_report([], 1.0, 1))
+
+
+def test_segment_labels():
+    labels = {"segments": [{"start": 0, "end": 10, "exercise": "squat"}]}
+    assert ev._label_at(labels, 5) == "squat" and ev._label_at(labels, 11) is None
+    assert ev._label_at({"exercise": "row"}, 5) == "row"
+
+
+def test_synthetic_corpus_scores_near_perfect(tmp_path):
+    ev.make_synthetic_corpus(tmp_path, count=2)
+    paths = ev.find_recordings(tmp_path)
+    assert len(paths) == 2
+    assert json.loads(ev.label_path(paths[0]).read_text())["reps"]
+    report = ev.evaluate_corpus(paths, workers=2)
+    assert report["files"] == 2
+    assert ev.check_synthetic(report) == []
+
+
+def test_corrupt_recording_is_reported_and_counted_as_missed(tmp_path):
+    ev.make_synthetic_corpus(tmp_path, count=2)
+    good = ev.find_recordings(tmp_path)
+    # a recording cut off inside its header, with the same labels as a good one
+    broken = tmp_path / "broken.fflm"
+    broken.write_bytes(good[0].read_bytes()[:32])
+    ev.label_path(broken).write_text(ev.label_path(good[0]).read_text())
+    report = ev.evaluate_corpus(good + [broken], workers=2)
+    assert report["files"] == 2
+    assert [f["path"] for f in report["failed"]] == [str(broken)]
+    assert "ValueError" in report["failed"][0]["error"]
+    (ex, n), = json.loads(ev.label_path(broken).read_text())["reps"].items()
+    e = report["per_exercise"][ex]
+    assert e["files"] == 2 and e["failed"] == 1
+    assert e["abs_error"] >= n and e["label_reps"] - e["pred_reps"] >= n
+    assert any("broken.fflm" in p for p in ev.check_synthetic(report))
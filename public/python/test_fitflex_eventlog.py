@@ -0,0 +1,79 @@
+import uuid
+
+import pytest
+
+import fitflex_eventlog
+from fitflex_eventlog import SessionLog, compact, recover_summary, segment_paths
+
+
+def _reps(log, exercise, n, t0=0):
+    for i in range(n):
+        log.record({"type": "rep", "exercise": exercise, "ts": t0 + i})
+
+
+def test_same_start_time_gets_separate_logs(tmp_path):
+    a = SessionLog("csv", 1700000000000, log_dir=tmp_path)
+    _reps(a, "bicep_curl", 3)
+    a.close(10)
+    b = SessionLog("csv", 1700000000000, log_dir=tmp_path)
+    _reps(b, "bicep_curl", 2)
+    b.close(10)
+    assert a.paths[0] != b.paths[0]
+    assert compact(a.paths[0])["reps"] == {"bicep_curl": 3}
+    assert compact(b.paths[0])["reps"] == {"bicep_curl": 2}
+
+
+def test_name_collision_fails_loudly(tmp_path, monkeypatch):
+    fixed = uuid.UUID(int=1)
+    monkeypatch.setattr(fitflex_eventlog.uuid, "uuid4", lambda: fixed)
+    SessionLog("csv", 5, log_dir=tmp_path).close()
+    with pytest.raises(FileExistsError):
+        SessionLog("csv", 5, log_dir=tmp_path)
+
+
+def test_rotation_and_recovery(tmp_path):
+    log = SessionLog("camera", 1, log_dir=tmp_path, max_bytes=200)
+    _reps(log, "squat", 20)
+    log.record({"type": "rep_undo", "exercise": "squat", "ts": 30})
+    log.record({"type": "set", "exercise": "squat", "ts": 31})
+    log.close(40)
+    assert len(log.paths) > 1
+    assert segment_paths(log.paths[-1]) == log.paths
+    recovered = recover_summary(log.paths[0])
+    assert dict(recovered.reps) == {"squat": 19}
+    assert dict(recovered.sets) == {"squat": 1}
+    assert recovered.end_time == 40
+    full = compact(log.paths[1])
+    assert full["reps"] == {"squat": 19}
+    assert len(full["events"]) == 22
+
+
+def test_unclosed_log_recovers_from_the_last_segment(tmp_path):
+    log = SessionLog("camera", 1, log_dir=tmp_path, max_bytes=150)
+    _reps(log, "row", 12)
+    log.f.flush()
+    recovered = recover_summary(log.paths[-1])
+    assert dict(recovered.reps) == {"row": 12} and recovered.end_time == 11
+    log.close()
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    log = SessionLog("camera", 1, log_dir=tmp_path)
+    _reps(log, "squat", 2)
+    log.close(5)
+    with open(log.paths[0], "a", encoding="utf-8") as f:
+        f.write('{"type": "rep", "exer')
+    assert compact(log.paths[0])["reps"] == {"squat": 2}
+
+
+def test_reset_and_tracks(tmp_path):
+    log = SessionLog("camera", 1, log_dir=tmp_path)
+    log.record({"type": "rep", "exercise": "squat", "ts": 1, "track": 1})
+    log.record({"type": "rep", "exercise": "squat", "ts": 2, "track": 2})
+    log.record({"type": "reset", "ts": 3})
+    log.record({"type": "rep", "exercise": "squat", "ts": 4, "track": 2})
+    snap = log.snapshot()
+    assert snap["reps"] == {"squat": 1}
+    assert snap["tracks"] == {"1": {"reps": {"squat": 0}, "sets": {}},
+                              "2": {"reps": {"squat": 1}, "sets": {}}}
+    log.close()
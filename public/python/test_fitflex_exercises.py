@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+import fitflex_mediapipe_multi as ff
+import fitflex_synth as synth
+from fitflex_exercises import (EXERCISES, JOINTS, RIGHT_ELBOW, VIS_MIN, AngleKernel,
+                               ExerciseSpec, joint_angles)
+
+
+def test_joint_angles_match_angle_deg_for_frames_and_batches():
+    _, frames = synth.synth_stream("bicep_curl", seconds=2.0)
+    xy = frames[..., :2]
+    triplets = np.array([t for j in JOINTS for t in JOINTS[j]])
+    batch = joint_angles(xy, triplets)
+    assert batch.shape == (len(frames), len(triplets))
+    for k in (0, 17, 40):
+        ref = [ff.angle_deg(*(xy[k, i] for i in t)) for t in triplets]
+        np.testing.assert_allclose(joint_angles(xy[k], triplets), ref, atol=1e-6)
+        np.testing.assert_allclose(batch[k], ref, atol=1e-6)
+
+
+def test_kernel_side_rules():
+    kernel = AngleKernel()
+    _, frames = synth.synth_stream("bicep_curl", seconds=1.0, noise_px=0.0)
+    xy = frames[10, :, :2].copy()
+    xy[RIGHT_ELBOW, 1] += 30.0      # make the two sides differ
+    left, right = joint_angles(xy, JOINTS["elbow"])
+    assert abs(left - right) > 5
+    vis = np.full(33, 0.9)
+    vis[RIGHT_ELBOW] = 0.5
+    angles = kernel.angles(xy, vis)
+    # 'visible' takes the side with more summed visibility, 'mean' averages usable sides
+    assert angles[kernel.index["bicep_curl"]] == pytest.approx(left)
+    assert angles[kernel.index["shoulder_press"]] == pytest.approx((left + right) / 2)
+    vis[RIGHT_ELBOW] = VIS_MIN
+    assert kernel.angle("shoulder_press", xy, vis) == pytest.approx(left)
+    vis[:] = 0.0
+    assert not kernel.angles(xy, vis).any()
+
+
+def test_kernel_batch_matches_the_managers_per_frame_angle():
+    kernel = AngleKernel()
+    manager = ff.MultiExerciseManager(clock=ff.ReplayClock())
+    single = {name: AngleKernel([spec]) for name, spec in EXERCISES.items()}
+    _, frames = synth.synth_stream("occlusion", seconds=4.0, seed=2)
+    batch = kernel.angles(frames[..., :2], frames[..., 3])
+    for k in range(0, len(frames), 7):
+        np.testing.assert_allclose(batch[k], kernel.angles(frames[k, :, :2], frames[k, :, 3]))
+        for name in EXERCISES:
+            expected = batch[k, kernel.index[name]]
+            manager.current = name
+            assert manager.primary_angle(frames[k], frames[k, :, 3]) == pytest.approx(expected)
+            assert single[name].angles(frames[k, :, :2], frames[k, :, 3])[0] == pytest.approx(expected)
+
+
+def test_registry_validates_specs():
+    with pytest.raises(ValueError):
+        ExerciseSpec("x", "wrist", 10, 20)
+    with pytest.raises(ValueError):
+        ExerciseSpec("x", "elbow", 10, 20, side="left")
+    kernel = AngleKernel([EXERCISES["squat"], EXERCISES["bicep_curl"]])
+    # one triplet pair per distinct joint
+    assert kernel.names == ["squat", "bicep_curl"] and kernel.triplets.shape == (4, 3)
@@ -0,0 +1,65 @@
+import json
+import threading
+
+import cv2
+import numpy as np
+
+import fitflex_synth as synth
+from fitflex_export import ExportWriterPool, PngOverlayExporter, VectorOverlayExporter
+from fitflex_frame import VIS_THRESHOLD, FrameState
+
+
+def _state(t_ms=0):
+    state = FrameState()
+    state.fill(t_ms, np.column_stack([synth.BASE_POSE, np.zeros(33)]), np.full(33, 0.87))
+    return state
+
+
+def test_full_queue_drops_instead_of_blocking():
+    gate = threading.Event()
+    pool = ExportWriterPool(workers=1, max_queue=2)
+    results = [pool.submit(gate.wait) for _ in range(6)]
+    # one job is running, two are queued, the rest were dropped
+    assert results.count(False) >= 3
+    gate.set()
+    pool.close()
+    stats = pool.stats()
+    assert stats["written"] == stats["submitted"] == results.count(True)
+    assert stats["dropped"] == results.count(False)
+
+
+def test_failed_writes_are_counted(capsys):
+    pool = ExportWriterPool(workers=1)
+    pool.submit(lambda: 1 / 0)
+    pool.close()
+    assert pool.stats()["failed"] == 1
+    assert "[Export] write failed" in capsys.readouterr().out
+
+
+def test_vector_export_lines(tmp_path):
+    path = tmp_path / "out" / "overlay.jsonl"
+    exporter = VectorOverlayExporter(path, 640, 480, [(11, 13), (13, 15)])
+    state = _state()
+    for i in range(3):
+        state.t_ms = 1000 + i
+        assert exporter.export(i, state)
+    exporter.close()
+    header, *frames = [json.loads(l) for l in path.read_text().splitlines()]
+    assert header["vis_threshold"] == VIS_THRESHOLD
+    assert header["connections"] == [[11, 13], [13, 15]]
+    assert [f["f"] for f in frames] == [0, 1, 2] and frames[2]["ts"] == 1002
+    assert frames[0]["p"] == np.rint(synth.BASE_POSE).astype(int).ravel().tolist()
+    assert frames[0]["v"] == [87] * 33
+    assert exporter.stats()["written"] == 3
+
+
+def test_png_export_copies_the_overlay(tmp_path):
+    exporter = PngOverlayExporter(tmp_path / "overlays")
+    overlay = np.zeros((48, 64, 4), dtype=np.uint8)
+    overlay[10:20, 10:20] = (46, 230, 166, 255)
+    exporter.export(7, _state(), overlay)
+    overlay[:] = 0       # the compositor reuses its buffer for the next frame
+    exporter.close()
+    saved = cv2.imread(str(tmp_path / "overlays" / "overlay_000007.png"), cv2.IMREAD_UNCHANGED)
+    assert saved.shape == (48, 64, 4)
+    assert saved[15, 15].tolist() == [166, 230, 46, 255]
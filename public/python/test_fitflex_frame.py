@@ -0,0 +1,98 @@
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+from fitflex_frame import VIS_THRESHOLD, FramePool, FrameState
+
+
+def _landmarks(n):
+    return [SimpleNamespace(x=i / 100, y=i / 200, z=-i / 10, visibility=i / n) for i in range(n)]
+
+
+def test_fill_landmarks_scales_and_offsets():
+    state = FrameState(4)
+    state.fill_landmarks(_landmarks(4), 120, 200, 100, x0=10, y0=20)
+    assert state.detected and not state.predicted and state.t_ms == 120
+    assert np.allclose(state.xy[:, 0], [10, 12, 14, 16])
+    assert np.allclose(state.xy[:, 1], [20, 20.5, 21, 21.5])
+    assert np.allclose(state.xyz[:, 2], [0, -0.1, -0.2, -0.3])
+    assert state.valid.tolist() == [v >= VIS_THRESHOLD for v in (0, 0.25, 0.5, 0.75)]
+
+
+def test_xy_is_a_view_of_xyz():
+    state = FrameState(2)
+    state.fill(0, [(1, 2, 3, 1), (4, 5, 6, 1)])
+    state.xy += 1
+    assert state.xyz[:, :2].tolist() == [[2, 3], [5, 6]]
+
+
+def test_fill_visibility_sources():
+    state = FrameState(2)
+    state.fill(5, np.array([[1, 2, 3, 0.1], [4, 5, 6, 0.9]]))
+    assert state.vis.tolist() == [0.1, 0.9]
+    assert state.valid.tolist() == [False, True]
+    state.fill(6, np.zeros((2, 3)))
+    assert state.vis.tolist() == [1.0, 1.0]
+    state.fill(7, np.zeros((2, 4)), vis=np.array([0.0, 0.5]))
+    assert state.valid.tolist() == [False, True]
+
+
+def test_clear_resets_pose_and_predicted_flag():
+    state = FrameState(2)
+    state.fill(1, [(1, 2, 3, 1), (4, 5, 6, 1)])
+    state.predicted = True
+    state.clear(9)
+    assert state.t_ms == 9 and not state.detected and not state.predicted
+    assert not state.xyz.any() and not state.vis.any() and not state.valid.any()
+
+
+def test_fill_resets_predicted():
+    state = FrameState(1)
+    state.predicted = True
+    state.fill(1, [(0, 0, 0, 1)])
+    assert not state.predicted
+
+
+def test_copy_from_is_deep():
+    src = FrameState(2)
+    src.fill(3, [(1, 2, 3, 1), (4, 5, 6, 0)])
+    src.predicted = True
+    dst = FrameState(2)
+    dst.copy_from(src)
+    assert (dst.t_ms, dst.detected, dst.predicted) == (3, True, True)
+    assert dst.valid.tolist() == [True, False]
+    src.xyz.fill(0)
+    assert dst.xyz[1].tolist() == [4, 5, 6]
+
+
+def test_landmarks_tuples():
+    state = FrameState(1)
+    state.fill(0, [(1, 2, 3, 0.5)])
+    assert state.landmarks() == [(1.0, 2.0, 3.0, 0.5)]
+
+
+def test_pool_reuses_released_states():
+    pool = FramePool(5)
+    a = pool.acquire()
+    b = pool.acquire()
+    assert a is not b and a.num == 5 and pool.allocated == 2
+    pool.release(a)
+    assert pool.acquire() is a
+    assert pool.allocated == 2
+
+
+def test_pool_settles_under_threads():
+    pool = FramePool()
+
+    def work():
+        for _ in range(500):
+            pool.release(pool.acquire())
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert pool.allocated <= 4
+    assert len(pool.free) == pool.allocated
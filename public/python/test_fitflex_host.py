@@ -0,0 +1,81 @@
+import queue
+from pathlib import Path
+
+import pytest
+
+from fitflex_eventlog import recover_summary
+from fitflex_host import Aggregator, plan_workers, stream_names
+from fitflex_store import SessionStore
+
+T0 = 1_790_000_000_000
+
+
+def test_plan_keeps_first_core_for_capture():
+    plan = plan_workers(3, cores=[0, 1, 2, 3])
+    assert plan == [([1], [0]), ([2], [1]), ([3], [2])]
+
+
+def test_plan_deals_streams_round_robin():
+    plan = plan_workers(5, workers=2, cores=range(8))
+    assert [streams for _, streams in plan] == [[0, 2, 4], [1, 3]]
+    assert plan[0][0] == [1, 3, 5, 7] and plan[1][0] == [2, 4, 6]
+
+
+def test_plan_shares_cores_when_workers_outnumber_them():
+    plan = plan_workers(3, workers=3, cores=[0, 1])
+    assert [cores for cores, _ in plan] == [[0], [1], [0]]
+    assert plan_workers(0, cores=[0])[0] == ([0], [])
+
+
+def test_stream_names_are_unique_and_safe():
+    names = stream_names([0, 1], ["bay 3.mp4", "/x/bay 3.avi", "clips/a.b.mp4"])
+    assert names == ["cam0", "cam1", "bay_3", "bay_3-2", "a.b"]
+
+
+def _rep(exercise, ts):
+    return {'type': 'rep', 'exercise': exercise, 'ts': ts}
+
+
+def test_aggregator_logs_and_totals_each_stream(tmp_path):
+    store = SessionStore(tmp_path / "s.db")
+    agg = Aggregator(["cam0", "bay3"], log_dir=tmp_path / "logs", store=store, user="gym")
+    results = queue.Queue()
+    for msg in [('ready', 0, 1234),
+                ('event', 'cam0', _rep('squat', T0)),
+                ('event', 'bay3', _rep('squat', T0 + 5)),
+                ('event', 'cam0', _rep('squat', T0 + 10)),
+                ('event', 'cam0', {'type': 'set', 'exercise': 'squat', 'ts': T0 + 20}),
+                ('stats', 'cam0', {'frames': 30, 'fps': 29.5}),
+                ('done', 'bay3', {'frames': 12})]:
+        results.put(msg)
+    agg.drain(results)
+    assert agg.ready == {0: 1234}
+    snap = agg.snapshot()
+    assert snap['totals'] == {'reps': {'squat': 3}, 'sets': {'squat': 1}}
+    assert snap['streams']['cam0']['reps'] == {'squat': 2}
+    assert snap['streams']['cam0']['stats']['fps'] == 29.5
+    assert snap['streams']['bay3']['done'] and not snap['streams']['cam0']['done']
+    log = snap['streams']['cam0']['event_log'][0]
+    assert Path(log).parent == tmp_path / "logs" / "cam0"
+    assert "cam0" in agg.status_line() and "2 reps" in agg.status_line()
+    agg.close()
+    assert recover_summary(log).reps == {'squat': 2}
+    stored = {s['station']: s for s in store.sessions(user="gym")}
+    assert set(stored) == {'cam0', 'bay3'}
+    assert stored['cam0']['reps'] == 2 and stored['cam0']['sets'] == 1
+    assert store.session(stored['cam0']['id'])['meta']['stats']['frames'] == 30
+    store.close()
+
+
+def test_aggregator_without_store(tmp_path):
+    agg = Aggregator(["cam0"], log_dir=tmp_path)
+    agg.handle(('event', 'cam0', _rep('row', T0)))
+    agg.close()
+    assert agg.snapshot()['streams']['cam0']['reps'] == {'row': 1}
+
+
+@pytest.mark.parametrize("timeout", [0.0, 0.01])
+def test_drain_empty_queue(tmp_path, timeout):
+    agg = Aggregator(["cam0"], log_dir=tmp_path)
+    agg.drain(queue.Queue(), timeout=timeout)
+    assert agg.snapshot()['totals'] == {'reps': {}, 'sets': {}}
@@ -0,0 +1,69 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from fitflex_metrics import Metrics, MetricsServer, RollingHistogram
+
+
+def test_histogram_keeps_a_rolling_window():
+    hist = RollingHistogram(window=100)
+    for ms in range(1, 201):
+        hist.add(float(ms))
+    s = hist.summary()
+    # percentiles cover the last 100 samples; count, mean and max cover all of them
+    assert s["count"] == 200 and s["max_ms"] == 200.0 and s["mean_ms"] == 100.5
+    assert 149 < s["p50_ms"] < 152 and s["p99_ms"] > 198
+    assert RollingHistogram().summary() == {"count": 0}
+
+
+def test_stages_counters_and_snapshot():
+    metrics = Metrics(window=10)
+    for _ in range(3):
+        with metrics.stage("pose_process"):
+            pass
+    metrics.observe("smooth", 2.0)
+    metrics.count("no_pose")
+    metrics.count("no_pose", 2)
+    metrics.set_counter("pipeline_dropped", 5)
+    snap = metrics.snapshot()
+    assert snap["stages"]["pose_process"]["count"] == 3
+    assert metrics.p95("smooth") == 2.0 and metrics.p95("missing") == 0.0
+    assert snap["counters"] == {"no_pose": 3, "pipeline_dropped": 5}
+
+
+def test_fps_from_frame_marks(monkeypatch):
+    metrics = Metrics(window=4)
+    clock = iter(i / 30.0 for i in range(100))
+    monkeypatch.setattr("fitflex_metrics.time.perf_counter", lambda: next(clock))
+    metrics.frame()
+    assert metrics.fps() == 0.0
+    for _ in range(9):
+        metrics.frame()
+    assert metrics.frames == 10
+    assert metrics.fps() == pytest.approx(30.0)
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics(enabled=False)
+    with metrics.stage("pose_process"):
+        pass
+    metrics.count("no_pose")
+    metrics.frame()
+    snap = metrics.snapshot()
+    assert snap["stages"] == {} and snap["counters"] == {} and snap["frames"] == 0
+
+
+def test_server_serves_the_snapshot():
+    metrics = Metrics()
+    metrics.count("no_pose")
+    server = MetricsServer(metrics, port=0).start()
+    try:
+        url = f"http://127.0.0.1:{server.port}"
+        with urllib.request.urlopen(url + "/metrics") as resp:
+            assert json.load(resp)["counters"] == {"no_pose": 1}
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + "/other")
+    finally:
+        server.stop()
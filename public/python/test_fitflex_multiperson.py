@@ -0,0 +1,133 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+import fitflex_mediapipe_multi as ff
+import fitflex_synth as synth
+from fitflex_exercises import POSE_CONNECTIONS
+from fitflex_multiperson import MultiPersonTracker, TrackPool
+
+SECONDS = 30
+
+
+def _person(kind, dx, seed):
+    ts, frames = synth.synth_stream(kind, seconds=SECONDS, seed=seed)
+    frames = frames.copy()
+    frames[..., 0] += dx
+    return ts, frames
+
+
+def _crowd(people, order_seed=0, gaps=None):
+    """(ts, people) frames with the detections in a random order each frame."""
+    rng = np.random.default_rng(order_seed)
+    ts = people[0][0]
+    gaps = gaps or {}
+    for i, t in enumerate(ts.tolist()):
+        present = [(f[i, :, :3], f[i, :, 3]) for k, (_, f) in enumerate(people)
+                   if not (k in gaps and gaps[k][0] <= i < gaps[k][1])]
+        yield t, [present[j] for j in rng.permutation(len(present))]
+
+
+def _replay(frames, **kw):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return ff.replay_multi(frames, **kw)
+
+
+def _single(ts, frames):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return ff.replay_session(synth.iter_frames(ts, frames))
+
+
+def test_two_athletes_keep_their_own_counts():
+    curl = _person("bicep_curl", -400, seed=1)
+    lat = _person("lat_pulldown", 400, seed=2)
+    summary = _replay(_crowd([curl, lat]))
+    assert summary['multi']['started'] == 2
+    assert summary['multi']['rejected'] == 0
+    assert set(summary['tracks']) == {'1', '2'}
+    by_exercise = {max(t['reps'], key=t['reps'].get): t['reps'] for t in summary['tracks'].values()}
+    assert set(by_exercise) == {'bicep_curl', 'lat_pulldown'}
+    # each track counts what the same person counts alone
+    assert by_exercise['bicep_curl']['bicep_curl'] == _single(*curl)['reps']['bicep_curl']
+    assert by_exercise['lat_pulldown']['lat_pulldown'] == _single(*lat)['reps']['lat_pulldown']
+    total = sum(t['reps'].get('bicep_curl', 0) for t in summary['tracks'].values())
+    assert summary['reps']['bicep_curl'] == total
+
+
+def test_returning_athlete_gets_new_track_in_reused_slot():
+    curl = _person("bicep_curl", -400, seed=1)
+    idle = _person("idle", 400, seed=3)
+    fps = 30
+    # the idle athlete is gone for 3 s (> TRACK_IDLE_MS) and comes back
+    summary = _replay(_crowd([curl, idle], gaps={1: (5 * fps, 8 * fps)}), max_tracks=2)
+    assert summary['multi']['started'] == 3
+    assert summary['multi']['ended'] == 1
+    assert summary['multi']['pooled'] == 2
+    assert summary['multi']['live'] == 2
+
+
+def test_extra_people_are_rejected():
+    people = [_person("idle", dx, seed=s) for s, dx in enumerate((-500, 0, 500))]
+    summary = _replay(_crowd(people), max_tracks=2)
+    assert summary['multi']['started'] == 2
+    assert summary['multi']['live'] == 2
+
+
+def test_render_state_holds_every_skeleton():
+    tracker = ff.make_tracker(ff.ReplayClock(), max_tracks=2)
+    assert len(tracker.connections) == 2 * len(POSE_CONNECTIONS)
+    a, b = POSE_CONNECTIONS[0]
+    assert tracker.connections[len(POSE_CONNECTIONS)] == (a + 33, b + 33)
+    pose = np.column_stack([synth.BASE_POSE, np.zeros(33)])
+    tracker.detections[0].fill(0, pose - (300, 0, 0))
+    tracker.detections[1].fill(0, pose + (300, 0, 0))
+    seen = tracker.update(0, 2)
+    assert [t.id for t in seen] == [1, 2]
+    rs = tracker.render_state
+    assert rs.detected and rs.valid.all()
+    for track in seen:
+        block = rs.xy[track.slot * 33:(track.slot + 1) * 33]
+        assert np.allclose(block, track.state.xy)
+    tracker.update(33, 0)
+    assert not tracker.seen and not tracker.render_state.detected
+
+
+def test_tracks_follow_moving_detections():
+    tracker = ff.make_tracker(ff.ReplayClock(), max_tracks=2)
+    pose = np.column_stack([synth.BASE_POSE, np.zeros(33)])
+    for i in range(30):
+        left, right = pose - (300 - 4 * i, 0, 0), pose + (300 - 4 * i, 0, 0)
+        dets = (right, left) if i % 2 else (left, right)
+        for state, p in zip(tracker.detections, dets):
+            state.fill(33 * i, p)
+        tracker.update(33 * i, 2)
+    assert tracker.counts['started'] == 2
+    first, second = tracker.seen
+    assert first.state.xy[0, 0] < second.state.xy[0, 0]
+
+
+def test_pool_clears_reused_manager():
+    built = []
+
+    class Manager:
+        def __init__(self):
+            self.cleared = 0
+            built.append(self)
+
+        def clear(self):
+            self.cleared += 1
+
+    pool = TrackPool(1, Manager)
+    track = pool.acquire(1, 0)
+    assert pool.acquire(2, 0) is None
+    pool.release(track)
+    again = pool.acquire(3, 50)
+    assert again is track and again.id == 3 and again.first_seen == 50
+    assert len(built) == 1 and built[0].cleared == 1
+
+
+def test_smoother_must_cover_every_track():
+    with pytest.raises(ValueError, match="slots"):
+        MultiPersonTracker(lambda: None, ff.TrackSmoother(2), max_tracks=3)
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from fitflex_frame import FramePool
+from fitflex_pipeline import FramePipeline, LatestQueue
+
+
+def test_latest_queue_drops_the_oldest():
+    dropped = []
+    q = LatestQueue(maxsize=2, on_drop=dropped.append)
+    for i in range(5):
+        q.put(i)
+    assert dropped == [0, 1, 2] and q.dropped == 3 and q.put_count == 5
+    assert [q.get(), q.get()] == [3, 4]
+    assert q.get(timeout=0.01) is None
+    q.put(5)
+    q.close()
+    # a closed queue still drains what it holds
+    assert q.get() == 5 and q.get() is None
+
+
+def test_pipeline_runs_every_frame_when_nothing_falls_behind():
+    frames = iter(range(20))
+    go = threading.Event()
+
+    def read_frame():
+        # one frame at a time, so no stage ever has a backlog
+        go.wait()
+        go.clear()
+        frame = next(frames, None)
+        return frame is not None, frame
+
+    pipeline = FramePipeline(read_frame, lambda frame, t_ms: frame * 10).start()
+    seen = []
+    go.set()
+    for t_ms, frame, result in pipeline.frames():
+        seen.append((frame, result))
+        go.set()
+    pipeline.stop()
+    assert seen == [(i, i * 10) for i in range(20)]
+    assert pipeline.capture_failed
+    assert pipeline.stats()["rendered"] == 20
+
+
+def test_slow_render_drops_stale_results_and_returns_them_to_the_pool():
+    pool = FramePool()
+    frames = iter(range(200))
+
+    def read_frame():
+        time.sleep(0.001)
+        frame = next(frames, None)
+        return frame is not None, frame
+
+    def infer(frame, t_ms):
+        state = pool.acquire()
+        state.t_ms = frame
+        return state
+
+    pipeline = FramePipeline(read_frame, infer, release=pool.release).start()
+    rendered = []
+    for t_ms, frame, state in pipeline.frames():
+        assert state.t_ms == frame
+        rendered.append(frame)
+        time.sleep(0.01)
+    pipeline.stop()
+    stats = pipeline.stats()
+    assert rendered == sorted(rendered) and len(rendered) < 200
+    assert stats["dropped_before_inference"] + stats["dropped_before_render"] > 0
+    # every state came back: dropped ones via on_drop, rendered ones after each frame
+    assert len(pool.free) == pool.allocated
+    assert pool.allocated <= 4
@@ -0,0 +1,114 @@
+import contextlib
+import io
+import math
+
+import fitflex_mediapipe_multi as ff
+
+T0_MS = 1_700_000_000_000
+FPS = 30
+# front-facing upper body; the arms curl from ~165 to ~30 degrees at the elbow
+SHOULDERS = ((360.0, 170.0), (280.0, 170.0))
+HIPS = ((345.0, 320.0), (295.0, 320.0))
+UPPER_ARM, FOREARM = 80.0, 70.0
+
+
+def _pose(elbow_deg):
+    landmarks = [(320.0, 240.0, 0.0, 1.0)] * 33
+    for side, (sx, sy) in enumerate(SHOULDERS):
+        out = 1.0 if side == 0 else -1.0
+        ex, ey = sx, sy + UPPER_ARM
+        bend = math.radians(180.0 - elbow_deg)
+        wx, wy = ex + out * FOREARM * math.sin(bend), ey + FOREARM * math.cos(bend)
+        landmarks[11 + side] = (sx, sy, 0.0, 1.0)
+        landmarks[13 + side] = (ex, ey, 0.0, 1.0)
+        landmarks[15 + side] = (wx, wy, 0.0, 1.0)
+    for side, (hx, hy) in enumerate(HIPS):
+        landmarks[23 + side] = (hx, hy, 0.0, 1.0)
+    return landmarks
+
+
+def curl_recording(reps, period_ms=2000, rest_ms=12000):
+    """(ts, landmarks, vis) frames: `reps` curls, then standing still for rest_ms."""
+    frames = []
+    n = int((reps * period_ms + rest_ms) * FPS / 1000)
+    for k in range(n):
+        t = k * 1000.0 / FPS
+        if t < reps * period_ms:
+            phase = (1.0 - math.cos(2.0 * math.pi * t / period_ms)) / 2.0
+        else:
+            phase = 0.0
+        landmarks = _pose(165.0 - 135.0 * phase)
+        frames.append((T0_MS + round(t), landmarks, [lm[3] for lm in landmarks]))
+    return frames
+
+
+def _replay(frames):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return ff.replay_session(iter(frames))
+
+
+def test_replay_counts_reps_and_closes_the_set():
+    session = _replay(curl_recording(6))
+    assert sum(session['reps'].values()) == 6
+    assert sum(session['sets'].values()) == 1
+    assert session['frames'] == len(curl_recording(6))
+    assert session['start_time'] == T0_MS
+    assert session['end_time'] == curl_recording(6)[-1][0]
+
+
+def test_replay_is_deterministic_and_ignores_wall_clock(monkeypatch):
+    frames = curl_recording(5)
+    first = _replay(frames)
+    # a wall clock racing ahead (or standing still) must not change anything
+    fake = iter(range(0, 10 ** 12, 10 ** 7))
+    monkeypatch.setattr(ff.time, "time", lambda: next(fake) / 1000.0)
+    second = _replay(frames)
+    assert second == first
+    rep_ts = [e['ts'] for e in first['events'] if e['type'] == 'rep']
+    assert all(T0_MS <= ts <= frames[-1][0] for ts in rep_ts)
+
+
+def test_set_idle_timer_runs_on_recorded_time():
+    # the set only closes once SET_IDLE_S of recorded time has passed
+    short_rest = _replay(curl_recording(3, rest_ms=ff.SET_IDLE_S * 1000 - 3000))
+    assert sum(short_rest['sets'].values()) == 0
+    long_rest = _replay(curl_recording(3, rest_ms=ff.SET_IDLE_S * 1000 + 3000))
+    assert sum(long_rest['sets'].values()) == 1
+
+
+def test_replay_clock_only_moves_when_set():
+    clock = ff.ReplayClock(5)
+    assert clock.now_ms() == 5
+    clock.set(1234.9)
+    assert clock.now_ms() == 1234
+
+
+def test_empty_recording():
+    session = _replay([])
+    assert session['frames'] == 0 and not session['events']
+
+
+
+def _curl_angles(reps, period_ms=2000, rest_ms=0, t0=0):
+    """(t_ms, elbow angle) samples at FPS: `reps` curls, then rest_ms standing still."""
+    n = int((reps * period_ms + rest_ms) * FPS / 1000)
+    for k in range(n):
+        t = k * 1000.0 / FPS
+        phase = (1.0 - math.cos(2.0 * math.pi * t / period_ms)) / 2.0 if t < reps * period_ms else 0.0
+        yield t0 + round(t), 165.0 - 135.0 * phase
+
+
+def test_counts_again_after_a_rest_longer_than_max_rep_ms():
+    clock = ff.ReplayClock()
+    det = ff.ExerciseDetector('bicep_curl', 40, 160, clock=clock)
+    rest_ms = max(ff.MAX_REP_MS, ff.SET_IDLE_S * 1000) + 2000
+    samples = list(_curl_angles(4, rest_ms=rest_ms))
+    samples += list(_curl_angles(3, rest_ms=rest_ms, t0=samples[-1][0] + 33))
+    reps = sets = 0
+    for t_ms, angle in samples:
+        clock.set(t_ms)
+        rep_inc, set_inc = det.update(angle)
+        reps += rep_inc
+        sets += set_inc
+    assert (reps, sets) == (7, 2)
+    assert det.set_count == 2 and det.rep_count == 0
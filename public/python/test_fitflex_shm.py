@@ -0,0 +1,132 @@
+import multiprocessing as mp
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from fitflex_shm import ShmFrameRing
+
+SHAPE = (4, 6, 3)
+
+
+@pytest.fixture
+def ring():
+    ring = ShmFrameRing.create(SHAPE, slots=3)
+    yield ring
+    ring.release()
+
+
+def _frame(value):
+    return np.full(SHAPE, value, dtype=np.uint8)
+
+
+def test_frames_come_out_in_order(ring):
+    out = np.empty(SHAPE, dtype=np.uint8)
+    assert ring.get(out) is None
+    for i in range(2):
+        assert ring.put(_frame(i + 1), 100 + i)
+    assert ring.get(out) == 100 and (out == 1).all()
+    assert ring.get(out) == 101 and (out == 2).all()
+    assert ring.get(out) is None
+    assert ring.stats() == {'written': 2, 'read': 2, 'dropped': 0}
+
+
+def test_overrun_drops_oldest(ring):
+    out = np.empty(SHAPE, dtype=np.uint8)
+    for i in range(5):
+        ring.put(_frame(i), i)
+    # 3 slots: frames 0 and 1 were overwritten
+    assert ring.get(out) == 2 and (out == 2).all()
+    assert ring.stats()['dropped'] == 2
+
+
+def test_latest_skips_to_newest(ring):
+    out = np.empty(SHAPE, dtype=np.uint8)
+    for i in range(3):
+        ring.put(_frame(i), i)
+    assert ring.get(out, latest=True) == 2
+    assert ring.get(out, latest=True) is None
+    assert ring.stats()['dropped'] == 2
+
+
+def test_slot_being_written_is_not_read(ring):
+    out = np.zeros(SHAPE, dtype=np.uint8)
+    ring.put(_frame(7), 1)
+    ring.slot_seq[0] = -1       # writer is mid-copy
+    assert ring.get(out) is None
+    assert not out.any()
+    assert ring.stats()['dropped'] == 1
+
+
+def test_blocking_put_waits_for_reader(ring):
+    for i in range(3):
+        assert ring.put(_frame(i), i, block=True)
+    done = threading.Event()
+
+    def writer():
+        ring.put(_frame(3), 3, block=True)
+        done.set()
+
+    t = threading.Thread(target=writer)
+    t.start()
+    time.sleep(0.05)
+    assert not done.is_set()
+    out = np.empty(SHAPE, dtype=np.uint8)
+    assert ring.get(out) == 0
+    t.join(timeout=2.0)
+    assert done.is_set()
+    assert [ring.get(out) for _ in range(3)] == [1, 2, 3]
+    assert ring.stats()['dropped'] == 0
+
+
+def test_blocking_put_gives_up_on_stop_or_close(ring):
+    for i in range(3):
+        ring.put(_frame(i), i)
+    stop = threading.Event()
+    stop.set()
+    assert not ring.put(_frame(9), 9, block=True, stop=stop)
+    ring.close()
+    assert not ring.put(_frame(9), 9, block=True)
+    assert ring.stats()['written'] == 3
+
+
+def test_finished_after_close_and_drain(ring):
+    out = np.empty(SHAPE, dtype=np.uint8)
+    ring.put(_frame(1), 1)
+    ring.close()
+    assert not ring.finished()
+    ring.get(out)
+    assert ring.finished()
+
+
+def test_nbytes_covers_header_and_frames():
+    assert ShmFrameRing.nbytes(SHAPE, slots=3) == (8 + 6) * 8 + 3 * 72
+
+
+def _child_read(spec, results):
+    peer = ShmFrameRing.attach(spec)
+    out = np.empty(peer.shape, dtype=np.uint8)
+    got = []
+    while not peer.finished():
+        ts = peer.get(out)
+        if ts is None:
+            time.sleep(0.001)
+            continue
+        got.append((ts, int(out[0, 0, 0]), bool((out == out[0, 0, 0]).all())))
+    results.put(got)
+    peer.release()
+
+
+def test_frames_cross_processes(ring):
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+    proc = ctx.Process(target=_child_read, args=(ring.spec(), results))
+    proc.start()
+    for i in range(20):
+        assert ring.put(_frame(i), 1000 + i, block=True)
+    ring.close()
+    got = results.get(timeout=30)
+    proc.join(timeout=10)
+    assert proc.exitcode == 0
+    assert got == [(1000 + i, i, True) for i in range(20)]
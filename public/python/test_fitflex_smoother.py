@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import fitflex_mediapipe_multi as ff
+
+N = 33
+
+
+def _stream(frames=240, seed=0):
+    """
+    Jittery random-walk landmarks with irregular timestamps, a repeated timestamp,
+    a NaN landmark and a dropout stretch where part of the body reads (0, 0) at vis 0.
+    """
+    rng = np.random.default_rng(seed)
+    xyz = np.cumsum(rng.normal(0.0, 3.0, (frames, N, 3)), axis=0) + (320.0, 240.0, 0.0)
+    xyz[..., 2] *= 0.01
+    vis = rng.uniform(0.5, 1.0, (frames, N))
+    ts = np.cumsum(rng.integers(20, 50, frames)) + 1_700_000_000_000
+    ts[100] = ts[99]
+    xyz[60, 7, 0] = np.nan
+    xyz[150:170, 11:17] = 0.0
+    vis[150:170, 11:17] = 0.0
+    return ts, xyz, vis
+
+
+def _scalar(ts, xyz, **params):
+    """The per-landmark, per-axis OneEuro filters PoseSmoother replaced."""
+    filters = [[ff.OneEuro(**params) for _ in range(3)] for _ in range(N)]
+    out = np.empty_like(xyz)
+    for k, t in enumerate(ts.tolist()):
+        for i in range(N):
+            for a in range(3):
+                out[k, i, a] = filters[i][a].filter(xyz[k, i, a], t)
+    return out
+
+
+@pytest.mark.parametrize("params", [{}, {'min_cutoff': 0.3, 'beta': 0.05, 'd_cutoff': 2.0}])
+def test_smooth_array_matches_scalar_filters(params):
+    ts, xyz, _ = _stream()
+    expected = _scalar(ts, xyz, **params)
+    smoother = ff.PoseSmoother(N, **params)
+    got = np.array([smoother.smooth_array(f, t) for f, t in zip(xyz, ts.tolist())])
+    np.testing.assert_allclose(got, expected, rtol=1e-12, atol=1e-9)
+    # the NaN sample poisons only its own filter, as in the scalar version
+    assert np.isnan(got[60:, 7, 0]).all() and not np.isnan(got[:, 8]).any()
+
+
+def test_smooth_keeps_tuple_interface_and_visibility():
+    ts, xyz, vis = _stream(seed=1)
+    expected = _scalar(ts, xyz)
+    smoother = ff.PoseSmoother(N)
+    for k, t in enumerate(ts.tolist()):
+        landmarks = [(x, y, z, v) for (x, y, z), v in zip(xyz[k].tolist(), vis[k].tolist())]
+        out = smoother.smooth(landmarks, t)
+        assert len(out) == N
+        np.testing.assert_allclose(np.array(out)[:, :3], expected[k], rtol=1e-12, atol=1e-9)
+        assert [lm[3] for lm in out] == vis[k].tolist()
+
+
+def test_batch_in_chunks_matches_frame_by_frame():
+    ts, xyz, _ = _stream(seed=2)
+    one = ff.PoseSmoother(N)
+    frame_by_frame = np.array([one.smooth_array(f, t) for f, t in zip(xyz, ts.tolist())])
+    chunked = ff.PoseSmoother(N)
+    got = np.concatenate([chunked.smooth_batch(xyz[:90], ts[:90]), chunked.smooth_batch(xyz[90:], ts[90:])])
+    np.testing.assert_allclose(got, frame_by_frame)
+
+
+def test_first_frame_passes_through_and_reset_restarts():
+    ts, xyz, _ = _stream(seed=3)
+    smoother = ff.PoseSmoother(N)
+    np.testing.assert_array_equal(smoother.smooth_array(xyz[0], ts[0]), xyz[0])
+    smoother.smooth_array(xyz[1], ts[1])
+    smoother.reset()
+    np.testing.assert_array_equal(smoother.smooth_array(xyz[2], ts[2]), xyz[2])
@@ -0,0 +1,117 @@
+import glob
+import os
+import subprocess
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import fitflex_mediapipe_multi as ff
+from fitflex_frame import FrameState
+
+HERE = Path(__file__).parent
+MODULES = sorted(Path(p).stem for p in glob.glob(str(HERE / "fitflex_*.py")))
+
+
+def test_modules_import_without_cv2_or_mediapipe():
+    code = ("import sys\n"
+            f"for name in {MODULES!r}: __import__(name)\n"
+            "loaded = [m for m in ('cv2', 'mediapipe') if m in sys.modules]\n"
+            "assert not loaded, loaded\n")
+    proc = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+
+
+def test_import_has_no_overlay_dir_side_effect(tmp_path):
+    proc = subprocess.run([sys.executable, "-c", "import fitflex_mediapipe_multi"], cwd=tmp_path,
+                          capture_output=True, text=True,
+                          env=dict(os.environ, PYTHONPATH=str(HERE)))
+    assert proc.returncode == 0, proc.stderr
+    assert not any(tmp_path.iterdir())
+
+
+class FakePose:
+    def __init__(self, **settings):
+        self.settings = settings
+        self.frames = []
+        self.closed = False
+
+    def process(self, rgb):
+        self.frames.append(rgb.shape)
+        lms = [SimpleNamespace(x=0.5, y=0.5, z=0.0, visibility=1.0)] * 33
+        return SimpleNamespace(pose_landmarks=SimpleNamespace(landmark=lms))
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_mediapipe(monkeypatch):
+    built = []
+
+    def make(**settings):
+        built.append(FakePose(**settings))
+        return built[-1]
+
+    monkeypatch.setattr(ff, "load_mediapipe", lambda: SimpleNamespace(Pose=make))
+    return built
+
+
+def test_pose_warmup_builds_and_primes_pose(fake_mediapipe):
+    warm = ff.PoseWarmup()
+    pose = warm.get()
+    assert pose is fake_mediapipe[0]
+    assert pose.settings == ff.POSE_SETTINGS
+    assert pose.frames == [(64, 64, 3)]
+    assert warm.elapsed_s is not None
+
+
+def test_pose_warmup_reraises_load_errors(monkeypatch):
+    def fail():
+        raise ImportError("no mediapipe")
+    monkeypatch.setattr(ff, "load_mediapipe", fail)
+    with pytest.raises(ImportError, match="no mediapipe"):
+        ff.PoseWarmup().get()
+
+
+def test_lazy_detector_builds_pose_on_first_call(fake_mediapipe):
+    pytest.importorskip("cv2")
+    detect = ff.LazyPoseDetector()
+    assert fake_mediapipe == []
+    state = FrameState()
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    assert detect(frame, state, 10) and detect(frame, state, 20)
+    assert len(fake_mediapipe) == 1 and detect.calls == 2
+    assert state.detected and np.allclose(state.xy[0], [32, 24])
+    detect.close()
+    assert fake_mediapipe[0].closed and detect.pose is None
+
+
+def test_pose_settings_without_mediapipe(monkeypatch):
+    import importlib.metadata
+
+    def missing(name):
+        raise importlib.metadata.PackageNotFoundError(name)
+    monkeypatch.setattr(importlib.metadata, "version", missing)
+    settings = ff.pose_settings()
+    assert settings["mediapipe"] == "unknown"
+    assert {k: settings[k] for k in ff.POSE_SETTINGS} == ff.POSE_SETTINGS
+
+
+def test_pose_connections_match_mediapipe():
+    mp = pytest.importorskip("mediapipe")
+    from fitflex_exercises import POSE_CONNECTIONS
+    assert set(POSE_CONNECTIONS) == set(mp.solutions.pose.POSE_CONNECTIONS)
+
+
+def test_headless_replay_needs_no_backends():
+    code = ("import sys, io, contextlib, numpy as np\n"
+            "import fitflex_mediapipe_multi as ff, fitflex_synth as synth\n"
+            "ts, frames = synth.synth_stream('bicep_curl', seconds=10, seed=0)\n"
+            "with contextlib.redirect_stdout(io.StringIO()):\n"
+            "    ff.replay_session(synth.iter_frames(ts, frames))\n"
+            "assert 'cv2' not in sys.modules and 'mediapipe' not in sys.modules\n")
+    proc = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
@@ -0,0 +1,123 @@
+import json
+import sqlite3
+import sys
+
+import fitflex_synth as synth
+from fitflex_eventlog import SessionLog
+from fitflex_recording import LandmarkWriter
+from fitflex_store import SessionStore, log_key
+
+WALL_MS = 1_790_000_000_000
+
+
+def _live(store, log_dir, events, start=WALL_MS, user="alice"):
+    log = SessionLog("camera", start, log_dir=log_dir)
+    stored = store.open_session("camera", start, user=user, log=log_key(log.paths[0]))
+    log.listeners.append(stored.record)
+    for event in events:
+        log.record(event)
+    log.close(start + 1000)
+    stored.close(log.end_time)
+    return log, stored
+
+
+def _rep(exercise, ts, **kw):
+    return dict(type="rep", exercise=exercise, ts=ts, **kw)
+
+
+def test_aggregates_follow_every_event(tmp_path):
+    store = SessionStore(tmp_path / "s.db")
+    events = [_rep("squat", 1), _rep("squat", 2), {"type": "rep_undo", "exercise": "squat", "ts": 3},
+              _rep("bicep_curl", 4), {"type": "set", "exercise": "squat", "ts": 5}]
+    _live(store, tmp_path, events)
+    _, second = _live(store, tmp_path, [_rep("squat", 1), {"type": "reset", "ts": 2}, _rep("squat", 3)])
+    totals = {r["exercise"]: r for r in store.totals("alice")}
+    assert (totals["squat"]["reps"], totals["squat"]["sets"], totals["squat"]["sessions"]) == (2, 1, 2)
+    assert (totals["bicep_curl"]["reps"], totals["bicep_curl"]["sessions"]) == (1, 1)
+    daily = store.daily(user="alice")
+    assert sum(r["reps"] for r in daily) == 3
+    assert store.session(second.id)["exercises"] == {"squat": {"reps": 1, "sets": 0}}
+    assert [s["reps"] for s in store.sessions(user="alice")] == [1, 2]
+    assert [e["type"] for e in store.events(second.id)] == ["rep", "reset", "rep"]
+    assert store.users() == ["alice"]
+    store.close()
+
+
+def test_repeated_start_time_opens_new_sessions(tmp_path):
+    store = SessionStore(tmp_path / "s.db")
+    _live(store, tmp_path, [_rep("squat", 1)], start=0)
+    _live(store, tmp_path, [_rep("squat", 1)], start=0)
+    assert len(store.sessions()) == 2
+    assert store.totals()[0]["reps"] == 2
+    store.close()
+
+
+def test_import_skips_sessions_already_stored(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = SessionStore("s.db")
+    log, _ = _live(store, "sessions", [_rep("squat", 1), _rep("squat", 2)])
+    summary = tmp_path / "session_summary_final_1.json"
+    summary.write_text(json.dumps(log.snapshot()))
+    assert store.import_path(summary) == (0, 1)
+    assert store.import_path(log.paths[0]) == (0, 1)
+    other = tmp_path / "session_summary_2.json"
+    other.write_text(json.dumps({"start_time": WALL_MS, "end_time": WALL_MS + 5, "mode": "camera",
+                                 "reps": {"lat_pulldown": 4}, "sets": {}}))
+    assert store.import_path(other) == (1, 0)
+    assert store.import_path(other) == (0, 1)
+    assert {r["exercise"]: r["reps"] for r in store.totals()} == {"squat": 2, "lat_pulldown": 4}
+    store.close()
+
+
+def test_host_summary_imports_one_session_per_stream(tmp_path):
+    store = SessionStore(tmp_path / "s.db")
+    path = tmp_path / "host_summary_final_1.json"
+    path.write_text(json.dumps({"start_time": WALL_MS, "end_time": WALL_MS + 9, "streams": {
+        "cam0": {"reps": {"squat": 3}, "sets": {}}, "cam1": {"reps": {"squat": 5}, "sets": {"squat": 1}}}}))
+    assert store.import_path(path) == (2, 0)
+    assert sorted(s["station"] for s in store.sessions()) == ["cam0", "cam1"]
+    assert store.totals()[0]["reps"] == 8
+    store.close()
+
+
+def test_store_without_log_column_is_upgraded(tmp_path):
+    conn = sqlite3.connect(tmp_path / "old.db")
+    conn.execute("CREATE TABLE sessions (id INTEGER PRIMARY KEY, uid TEXT NOT NULL UNIQUE, user TEXT NOT NULL, "
+                 "station TEXT NOT NULL, mode TEXT, day TEXT NOT NULL, start_time INTEGER, end_time INTEGER, "
+                 "reps INTEGER NOT NULL DEFAULT 0, sets INTEGER NOT NULL DEFAULT 0, source TEXT, meta TEXT)")
+    conn.close()
+    store = SessionStore(tmp_path / "old.db")
+    _live(store, tmp_path, [_rep("squat", 1)])
+    assert store.totals()[0]["reps"] == 1
+    store.close()
+
+
+def test_replaying_a_recording_twice_stores_two_sessions(tmp_path, monkeypatch):
+    import cv2
+    import fitflex_mediapipe_multi as ff
+    ts, frames = synth.synth_stream("lat_pulldown", seconds=3.0)
+    with LandmarkWriter(tmp_path / "r.fflm") as w:
+        for t, f in zip(ts.tolist(), frames):
+            w.write(t, f)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cv2, "imshow", lambda *a: None)
+    monkeypatch.setattr(cv2, "waitKey", lambda *a: 255)
+    monkeypatch.setattr(cv2, "destroyAllWindows", lambda: None)
+    monkeypatch.setattr(sys, "argv", ["ff", "--csv", "r.fflm", "--store", "s.db"])
+    ff.main()
+    ff.main()
+    store = SessionStore("s.db")
+    assert len(store.sessions()) == 2
+    store.close()
+
+
+def test_host_stream_run_twice_stores_two_sessions(tmp_path):
+    from fitflex_host import Aggregator
+    store = SessionStore(tmp_path / "s.db")
+    for _ in range(2):
+        agg = Aggregator(["bay1"], tmp_path / "logs", store)
+        agg.handle(("event", "bay1", _rep("squat", 0)))
+        agg.handle(("event", "bay1", _rep("squat", 40)))
+        agg.close()
+    assert [s["reps"] for s in store.sessions()] == [2, 2]
+    store.close()
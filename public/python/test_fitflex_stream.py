@@ -0,0 +1,200 @@
+import asyncio
+import socket
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import fitflex_synth as synth
+from fitflex_exercises import POSE_CONNECTIONS
+from fitflex_frame import FrameState
+from fitflex_stream import (KIND_DELTA, KIND_KEY, KIND_NONE, KEYFRAME_EVERY, NO_EXERCISE, QUANT, OP_BINARY,
+                            OP_PING, OP_TEXT, FrameDecoder, FrameEncoder, FrameSnapshot, ProtocolError,
+                            StreamServer, accept_key, read_message, run_client, ws_frame)
+
+
+def _states(kind="bicep_curl", seconds=5, seed=0):
+    ts, frames = synth.synth_stream(kind, seconds=seconds, seed=seed)
+    state = FrameState()
+    for t, f in zip(ts.tolist(), frames):
+        state.fill(t, f)
+        yield state
+
+
+def _roundtrip(snaps, encoder=None):
+    encoder = encoder or FrameEncoder()
+    decoder = FrameDecoder()
+    for snap in snaps:
+        msg, kind = encoder.encode(snap)
+        yield snap, kind, len(msg), decoder.decode(msg)
+
+
+def test_decoder_tracks_the_quantized_pose():
+    snaps = (FrameSnapshot.from_state(i, s, exercise=1) for i, s in enumerate(_states()))
+    kinds = []
+    for snap, kind, size, out in _roundtrip(snaps):
+        kinds.append(kind)
+        assert out['kind'] == kind and out['exercise'] == 1 and out['seq'] == snap.seq
+        assert out['t_ms'] == snap.t_ms
+        assert np.array_equal(out['xy'] * QUANT, snap.q)
+        assert np.array_equal(np.rint(out['vis'] * 255), snap.v)
+        if kind == KIND_DELTA:
+            assert size < 8 + 5 * 33
+    assert kinds[0] == KIND_KEY
+    assert kinds.count(KIND_KEY) == -(-len(kinds) // KEYFRAME_EVERY)
+
+
+def test_dropouts_decode_exactly():
+    # occlusion jitter often steps past i8 and forces key frames
+    snaps = (FrameSnapshot.from_state(i, s) for i, s in enumerate(_states("occlusion", seed=3)))
+    for snap, kind, _, out in _roundtrip(snaps):
+        assert np.array_equal(out['xy'] * QUANT, snap.q)
+        assert np.array_equal(np.rint(out['vis'] * 255), snap.v)
+
+
+def test_keyframe_interval_and_forced_keys():
+    state = next(_states())
+    encoder = FrameEncoder(keyframe_every=4)
+    kinds = [encoder.encode(FrameSnapshot.from_state(i, state))[1] for i in range(9)]
+    assert kinds == [KIND_KEY, KIND_DELTA, KIND_DELTA, KIND_DELTA] * 2 + [KIND_KEY]
+    encoder.force_key = True
+    assert encoder.encode(FrameSnapshot.from_state(9, state))[1] == KIND_KEY
+    assert encoder.encode(FrameSnapshot.from_state(10, state))[1] == KIND_DELTA
+
+
+def test_unchanged_frame_is_header_plus_mask():
+    state = next(_states())
+    encoder = FrameEncoder()
+    encoder.encode(FrameSnapshot.from_state(0, state))
+    msg, kind = encoder.encode(FrameSnapshot.from_state(1, state))
+    assert kind == KIND_DELTA and len(msg) == 12 + 5
+
+
+def test_large_step_falls_back_to_key():
+    state = FrameState()
+    state.fill(0, np.column_stack([synth.BASE_POSE, np.zeros(33)]))
+    encoder, decoder = FrameEncoder(), FrameDecoder()
+    decoder.decode(encoder.encode(FrameSnapshot.from_state(0, state))[0])
+    state.xy[5] += 100      # 200 units at QUANT=2, over i8
+    msg, kind = encoder.encode(FrameSnapshot.from_state(1, state))
+    assert kind == KIND_KEY
+    assert np.allclose(decoder.decode(msg)['xy'], state.xy)
+
+
+def test_no_pose_keeps_the_last_skeleton():
+    states = list(s.xyz.copy() for s, _ in zip(_states(), range(3)))
+    state = FrameState()
+    encoder, decoder = FrameEncoder(), FrameDecoder()
+    state.fill(0, states[0])
+    decoder.decode(encoder.encode(FrameSnapshot.from_state(0, state))[0])
+    state.clear(33)
+    msg, kind = encoder.encode(FrameSnapshot.from_state(1, state, NO_EXERCISE))
+    out = decoder.decode(msg)
+    assert kind == KIND_NONE and len(msg) == 12
+    assert out['xy'] is None and out['exercise'] == NO_EXERCISE
+    state.fill(66, states[2])
+    msg, kind = encoder.encode(FrameSnapshot.from_state(2, state))
+    assert kind == KIND_DELTA
+    assert np.allclose(decoder.decode(msg)['xy'], np.rint(states[2][:, :2] * QUANT) / QUANT)
+
+
+def test_delta_before_key_is_rejected():
+    state = next(_states())
+    encoder = FrameEncoder()
+    encoder.encode(FrameSnapshot.from_state(0, state))
+    msg, _ = encoder.encode(FrameSnapshot.from_state(1, state))
+    with pytest.raises(ProtocolError):
+        FrameDecoder().decode(msg)
+
+
+def test_accept_key_rfc_example():
+    assert accept_key("dGhlIHNhbXBsZSBub25jZQ==") == "s3pPLMBiTxaQ9kYGzzhZRbK+xOo="
+
+
+def _read(data, max_size=1 << 20):
+    async def go():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_message(reader, max_size)
+    return asyncio.run(go())
+
+
+@pytest.mark.parametrize("size", [0, 125, 126, 300, 70000])
+@pytest.mark.parametrize("mask", [False, True])
+def test_ws_frame_lengths(size, mask):
+    payload = bytes(range(256)) * (size // 256) + bytes(size % 256)
+    assert _read(ws_frame(OP_BINARY, payload, mask=mask)) == (OP_BINARY, payload)
+
+
+def test_fragments_are_joined_around_control_frames():
+    first = bytes([OP_TEXT, 3]) + b"abc"             # FIN clear
+    last = bytes([0x80, 2]) + b"de"                  # continuation, FIN set
+    assert _read(first + last) == (OP_TEXT, b"abcde")
+    assert _read(first + ws_frame(OP_PING, b"p") + last) == (OP_PING, b"p")
+
+
+def test_oversized_message_is_rejected():
+    with pytest.raises(ProtocolError):
+        _read(ws_frame(OP_TEXT, b"x" * 100), max_size=64)
+
+
+@pytest.fixture
+def server():
+    server = StreamServer(port=0, exercises=["bicep_curl", "squat"], connections=POSE_CONNECTIONS,
+                          width=640, height=480).start()
+    yield server
+    server.stop()
+
+
+def test_server_streams_frames_and_events(server):
+    server.publish_event({'type': 'rep', 'exercise': 'squat', 'ts': 1})
+    states = [s.xyz.copy() for s, _ in zip(_states(), range(60))]
+    stop = threading.Event()
+
+    def publish():
+        while not server.clients and not stop.is_set():
+            time.sleep(0.005)
+        state = FrameState()
+        for i, xyz in enumerate(states):
+            if stop.is_set():
+                return
+            state.fill(33 * i, xyz)
+            server.publish_frame(state, 'bicep_curl')
+            if i == 10:
+                server.publish_event({'type': 'rep', 'exercise': 'bicep_curl', 'ts': 330})
+            time.sleep(0.002)
+
+    t = threading.Thread(target=publish)
+    t.start()
+    try:
+        out = asyncio.run(run_client(f"ws://127.0.0.1:{server.port}/", frames=20, timeout_s=10))
+    finally:
+        stop.set()
+        t.join()
+    hello = out['hello']
+    assert hello['exercises'] == ["bicep_curl", "squat"]
+    assert hello['totals']['reps'] == {'squat': 1}
+    assert len(hello['connections']) == len(POSE_CONNECTIONS)
+    frames = out['frames']
+    assert len(frames) == 20 and frames[0]['kind'] == KIND_KEY
+    assert all(f['exercise'] == 0 for f in frames)
+    seqs = [f['seq'] for f in frames]
+    assert seqs == sorted(seqs)
+    last = frames[-1]
+    assert np.allclose(last['xy'], np.rint(states[last['seq']][:, :2] * QUANT) / QUANT)
+    assert out['events'][0]['totals']['reps'] == {'squat': 1, 'bicep_curl': 1}
+
+
+def test_plain_http_gets_426(server):
+    with socket.create_connection(("127.0.0.1", server.port), timeout=5) as sock:
+        sock.sendall(b"GET / HTTP/1.1\r\nHost: x\r\n\r\n")
+        assert sock.recv(64).startswith(b"HTTP/1.1 426")
+
+
+def test_publish_without_loop_is_a_noop():
+    server = StreamServer(port=0)
+    server.publish_frame(FrameState())
+    server.publish_event({'type': 'rep', 'exercise': 'squat'})
+    assert server.published == 0
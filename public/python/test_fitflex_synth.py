@@ -0,0 +1,82 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+import fitflex_mediapipe_multi as ff
+import fitflex_synth as synth
+from fitflex_bench import check_reps, compare, write_csv
+from fitflex_exercises import EXERCISES
+
+SECONDS = 20.0
+
+
+def _elbow_angles(frames):
+    a, b, c = frames[:, 11, :2], frames[:, 13, :2], frames[:, 15, :2]
+    ba, bc = a - b, c - b
+    cos = (ba * bc).sum(1) / (np.linalg.norm(ba, axis=1) * np.linalg.norm(bc, axis=1))
+    return np.degrees(np.arccos(np.clip(cos, -1.0, 1.0)))
+
+
+def test_curl_passes_both_rep_thresholds():
+    _, frames = synth.synth_stream("bicep_curl", seconds=SECONDS, noise_px=0.0)
+    angles = _elbow_angles(frames)
+    spec = EXERCISES["bicep_curl"]
+    assert angles.min() < spec.bottom_th - 5
+    assert angles.max() > spec.top_th
+
+
+@pytest.mark.parametrize("kind", synth.KINDS)
+def test_replay_counts_expected_reps(kind):
+    ts, frames = synth.synth_stream(kind, seconds=SECONDS, seed=1)
+    counted, expected, ok = check_reps(kind, ts, frames, SECONDS)
+    assert ok, (counted, expected)
+
+
+def test_check_reps_flags_a_stream_that_counts_nothing():
+    ts, frames = synth.synth_stream("idle", seconds=SECONDS)
+    counted, expected, ok = check_reps("bicep_curl", ts, frames, SECONDS)
+    assert counted == 0 and expected > 0 and not ok
+
+
+@pytest.mark.parametrize("kind", synth.KINDS)
+def test_streams_are_seeded_and_regular(kind):
+    ts, frames = synth.synth_stream(kind, seconds=SECONDS, seed=4)
+    assert len(ts) == SECONDS * 30 and frames.shape == (len(ts), synth.NUM_LANDMARKS, 4)
+    assert set(np.diff(ts).tolist()) <= {33, 34}
+    np.testing.assert_array_equal(synth.synth_stream(kind, seconds=SECONDS, seed=4)[1], frames)
+    assert not np.array_equal(synth.synth_stream(kind, seconds=SECONDS, seed=5)[1], frames)
+
+
+def test_only_the_occlusion_stream_drops_out():
+    for kind in synth.KINDS:
+        _, frames = synth.synth_stream(kind, seconds=SECONDS)
+        dropped = (frames[..., 3] == 0.0).all(axis=1)
+        assert dropped.any() == (kind == "occlusion")
+
+
+def test_expected_reps():
+    assert synth.expected_reps("bicep_curl", SECONDS) == 8
+    assert synth.expected_reps("lat_pulldown", SECONDS, period_s=4.0) == 5
+    assert synth.expected_reps("idle", SECONDS) == 0
+
+
+def test_iter_frames_matches_the_csv_reader(tmp_path):
+    ts, frames = synth.synth_stream("lat_pulldown", seconds=2.0)
+    path = tmp_path / "s.csv"
+    write_csv(path, ts.tolist(), frames.tolist())
+    rows = list(ff.read_landmarks_csv(str(path)))
+    assert len(rows) == len(ts)
+    for (t, landmarks, vis), (ct, clandmarks, cvis) in zip(synth.iter_frames(ts, frames), rows):
+        assert t == ct and len(landmarks) == len(clandmarks)
+        np.testing.assert_allclose(np.array(landmarks)[:, :2], np.array(clandmarks)[:, :2], atol=5e-4)
+        np.testing.assert_allclose(vis, cvis, atol=5e-4)
+
+
+def test_compare_flags_only_slowdowns_past_the_threshold():
+    baseline = {"results": {"a": {"median_us": 10.0}, "b": {"median_us": 10.0}}}
+    current = {"results": {"a": {"median_us": 10.5}, "b": {"median_us": 12.0}, "new": {"median_us": 1.0}}}
+    with contextlib.redirect_stdout(io.StringIO()):
+        regressions = compare(current, baseline, 0.10)
+    assert [r[0] for r in regressions] == ["b"]
@@ -0,0 +1,109 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+import fitflex_synth as synth
+from fitflex_video import PoseCache, cache_key, video_frames, video_landmarks
+
+FRAMES = 20
+SETTINGS = {"model_complexity": 1}
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "workout.avi"
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 30, (64, 48))
+    for i in range(FRAMES):
+        writer.write(np.full((48, 64, 3), i * 10, np.uint8))
+    writer.release()
+    return path
+
+
+class FakeDetector:
+    """Poses from the synthetic curl; every third frame has no pose."""
+    def __init__(self):
+        self.calls = 0
+        _, self.frames = synth.synth_stream("bicep_curl", seconds=1.0)
+
+    def __call__(self, frame, state, t_ms):
+        i = self.calls
+        self.calls += 1
+        if i % 3 == 2:
+            state.clear(t_ms)
+            return False
+        state.fill(t_ms, self.frames[i])
+        return True
+
+
+def _never(frame, state, t_ms):
+    raise AssertionError("inference on a cache hit")
+
+
+def _collect(frames):
+    return [(t, frame is not None, state.detected, state.xyz.copy()) for t, frame, state in frames]
+
+
+def test_miss_then_hit_replays_the_same_states(video, tmp_path):
+    cache = PoseCache(tmp_path / "cache")
+    detect = FakeDetector()
+    first = _collect(video_frames(video, detect, SETTINGS, cache))
+    assert detect.calls == FRAMES and len(first) == FRAMES
+    second = _collect(video_frames(video, _never, SETTINGS, cache))
+    assert [r[:3] for r in second] == [r[:3] for r in first]
+    for a, b in zip(first, second):
+        if a[2]:
+            np.testing.assert_allclose(a[3], b[3], rtol=1e-6)
+    # landmarks only: no decoding on a hit, and frames without a pose are skipped
+    assert len(list(video_landmarks(video, _never, SETTINGS, cache))) == FRAMES - FRAMES // 3
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 2, 1)
+
+
+def test_settings_are_part_of_the_key(video, tmp_path):
+    cache = PoseCache(tmp_path / "cache")
+    digest = cache.digest(video)
+    assert cache_key(digest, SETTINGS) != cache_key(digest, {"model_complexity": 0})
+    list(video_frames(video, FakeDetector(), SETTINGS, cache))
+    detect = FakeDetector()
+    list(video_frames(video, detect, {"model_complexity": 0}, cache))
+    assert detect.calls == FRAMES
+
+
+def test_partial_run_is_not_cached(video, tmp_path):
+    cache = PoseCache(tmp_path / "cache")
+    frames = video_frames(video, FakeDetector(), SETTINGS, cache)
+    for _ in range(5):
+        next(frames)
+    frames.close()
+    assert cache.stats()["entries"] == 0
+    assert not list((tmp_path / "cache").glob("*.part"))
+
+
+def test_digest_is_reused_until_the_file_changes(video, tmp_path, monkeypatch):
+    cache = PoseCache(tmp_path / "cache")
+    first = cache.digest(video)
+    monkeypatch.setattr("fitflex_video.file_digest", lambda path: "rehashed")
+    assert cache.digest(video) == first
+    video.write_bytes(video.read_bytes() + b"\0")
+    assert cache.digest(video) == "rehashed"
+    # the digest index survives a restart
+    assert json.loads((tmp_path / "cache" / "index.json").read_text())["digests"]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = PoseCache(tmp_path / "cache")
+    _, frames = synth.synth_stream("idle", seconds=1.0)
+    for key in ("a", "b", "c"):
+        w = cache.writer(key, 30.0, 640, 480)
+        for t, f in enumerate(frames):
+            w.write(t, f)
+        cache.commit(key, w)
+        if key == "a":
+            size = cache.size_bytes()
+            cache.max_bytes = 2 * size
+    assert cache.get("a") is None and cache.get("c") is not None
+    assert cache.stats()["evicted"] == 1
+    # a fresh process sees the same entries
+    assert set(PoseCache(tmp_path / "cache").index["entries"]) == {"b", "c"}